@@ -0,0 +1,192 @@
+import pako from 'pako';
+
+import vtkActor from 'vtk.js/Sources/Rendering/Core/Actor';
+import vtkDataArray from 'vtk.js/Sources/Common/Core/DataArray';
+import vtkGenericRenderWindow from 'vtk.js/Sources/Rendering/Misc/GenericRenderWindow';
+import vtkPolyData from 'vtk.js/Sources/Common/DataModel/PolyData';
+import vtkSphereMapper from 'vtk.js/Sources/Rendering/Core/SphereMapper';
+
+const TYPED_ARRAYS = {
+  float32: Float32Array,
+  float64: Float64Array,
+  int32: Int32Array,
+  uint8: Uint8Array,
+  uint32: Uint32Array,
+};
+
+// Arrays no longer drawn are kept for a while, a looping simulation
+// sends the same arrays again
+const MAX_UNUSED_ARRAYS = 64;
+
+function toArrayBuffer(data) {
+  if (data instanceof ArrayBuffer) {
+    return Promise.resolve(data);
+  }
+  if (ArrayBuffer.isView(data)) {
+    return Promise.resolve(data.slice().buffer);
+  }
+  return new Response(data).arrayBuffer();
+}
+
+// Draw the fury actors of the server with vtk.js, from the instance arrays
+// of the fury.geometry protocol. Resolves to a function going back to an
+// empty container.
+export default function connectLocalRendering(session, container,
+  { background = [1, 1, 1] } = {}) {
+  const genericRenderWindow = vtkGenericRenderWindow.newInstance({
+    background,
+  });
+  genericRenderWindow.setContainer(container);
+  genericRenderWindow.resize();
+  window.addEventListener('resize', genericRenderWindow.resize);
+  const renderer = genericRenderWindow.getRenderer();
+  const renderWindow = genericRenderWindow.getRenderWindow();
+
+  const arrays = new Map(); // hash -> typed array
+  const actors = new Map(); // name -> { polydata, hashes }
+  const forgetting = new Set(); // evicted hashes the server is told about
+  // Updates are applied in order
+  let updates = Promise.resolve();
+
+  function decode(description) {
+    if (arrays.has(description.hash)) {
+      return Promise.resolve(arrays.get(description.hash));
+    }
+    return toArrayBuffer(description.data).then((buffer) => {
+      let bytes = new Uint8Array(buffer);
+      if (description.compression === 'zlib') {
+        bytes = pako.inflate(bytes);
+      }
+      const TypedArray = TYPED_ARRAYS[description.dtype];
+      const values = new TypedArray(bytes.slice().buffer);
+      arrays.set(description.hash, values);
+      return values;
+    });
+  }
+
+  function pruneArrays() {
+    const used = new Set();
+    actors.forEach(({ hashes }) => Object.values(hashes).forEach(
+      (hash) => used.add(hash)));
+    const unused = [...arrays.keys()].filter(
+      (hash) => !used.has(hash) && !forgetting.has(hash));
+    const evicted = unused.slice(0, Math.max(0, unused.length - MAX_UNUSED_ARRAYS));
+    if (!evicted.length) {
+      return;
+    }
+    evicted.forEach((hash) => forgetting.add(hash));
+    // The server sends their data again from now on, the updates it pushed
+    // before may still refer to them without data
+    session.call('fury.geometry.forget', [evicted]).then(() => {
+      updates = updates.then(() => evicted.forEach((hash) => {
+        forgetting.delete(hash);
+        arrays.delete(hash);
+      }));
+    });
+  }
+
+  // Only billboards are drawn, vtk.js has no ray marching of sdf primitives
+  function createActor(name) {
+    const polydata = vtkPolyData.newInstance();
+    const mapper = vtkSphereMapper.newInstance();
+    mapper.setInputData(polydata);
+    mapper.setScaleArray('radii');
+    mapper.setRadius(1);
+    const actor = vtkActor.newInstance();
+    actor.setMapper(mapper);
+    renderer.addActor(actor);
+    const entry = { polydata, hashes: {} };
+    actors.set(name, entry);
+    return entry;
+  }
+
+  function applyActor(description, values) {
+    const entry = actors.get(description.name) ||
+      createActor(description.name);
+    Object.keys(description.arrays).forEach((name, i) => {
+      const { hash, shape } = description.arrays[name];
+      entry.hashes[name] = hash;
+      if (name === 'centers') {
+        entry.polydata.getPoints().setData(values[i], 3);
+      } else {
+        const dataArray = vtkDataArray.newInstance({
+          name,
+          values: values[i],
+          numberOfComponents: shape[1] || 1,
+        });
+        if (name === 'colors') {
+          entry.polydata.getPointData().setScalars(dataArray);
+        } else {
+          entry.polydata.getPointData().removeArray(name);
+          entry.polydata.getPointData().addArray(dataArray);
+        }
+      }
+    });
+    entry.polydata.modified();
+  }
+
+  function update({ actors: delivered }) {
+    return Promise.all(delivered.map((description) => Promise.all(
+      Object.values(description.arrays).map(decode))))
+      .then((decoded) => {
+        delivered.forEach((description, i) => applyActor(description, decoded[i]));
+        pruneArrays();
+        renderWindow.render();
+      });
+  }
+
+  const subscription = session.subscribe('fury.geometry.subscription', ([delta]) => {
+    updates = updates.then(() => update(delta));
+  });
+
+  function disconnect() {
+    session.unsubscribe(subscription);
+    window.removeEventListener('resize', genericRenderWindow.resize);
+    genericRenderWindow.delete();
+    return session.call('fury.geometry.subscribe', [false]);
+  }
+
+  return session.call('fury.geometry.get', [[...arrays.keys()]])
+    .then(update)
+    .then(() => {
+      renderer.resetCamera();
+      renderWindow.render();
+      return session.call('fury.geometry.subscribe', [true]);
+    })
+    .then(() => disconnect);
+}
+
+// Follow the delivery mode chosen by the server (fury.delivery) for the
+// view: images from connectRemote(), or local rendering. Resolves once the
+// first mode is connected.
+export function connectHybridRendering(session, container, connectRemote,
+  options = {}) {
+  let mode = null;
+  let disconnect = () => null;
+  let switching = Promise.resolve();
+
+  function switchTo(nextMode) {
+    if (nextMode === mode) {
+      return Promise.resolve();
+    }
+    mode = nextMode;
+    return Promise.resolve(disconnect()).then(() => {
+      if (nextMode === 'geometry') {
+        return connectLocalRendering(session, container, options).then((d) => {
+          disconnect = d;
+        });
+      }
+      disconnect = connectRemote(session);
+      return null;
+    });
+  }
+
+  session.subscribe('fury.delivery.subscription', ([decision]) => {
+    switching = switching.then(() => switchTo(decision.mode));
+  });
+  return session.call('fury.delivery.register', [-1])
+    .then((decision) => {
+      switching = switching.then(() => switchTo(decision.mode));
+      return switching;
+    });
+}
@@ -34,6 +34,11 @@ from vtk.web import protocols
 from vtk.web import wslink as vtk_wslink
 from wslink import server
 
+# Shared fury-web server modules live at the root of the repository
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                             os.pardir, os.pardir, os.pardir)))
+from furyweb import startup, tracing
+
 try:
     import argparse
 except ImportError:
@@ -52,6 +57,7 @@ class _WebCone(vtk_wslink.ServerProtocol):
     authKey = "wslink-secret"
 
     def initialize(self):
+        startup.mark('initialize')
         global renderer, renderWindow, renderWindowInteractor, cone, mapper, actor
 
         # Bring used components
@@ -89,6 +95,11 @@ class _WebCone(vtk_wslink.ServerProtocol):
             _WebCone.view = renderWindow
             self.getApplication().GetObjectIdMap().SetActiveObject("VIEW", renderWindow)
 
+        startup.mark('initialized')
+        startup.watch_first_frame(
+            self.getApplication().GetObjectIdMap().GetActiveObject("VIEW"))
+        tracing.instrument(self)
+
 # =============================================================================
 # Main: Parse args and start server
 # =============================================================================
@@ -99,9 +110,11 @@ if __name__ == "__main__":
 
     # Add default arguments
     server.add_arguments(parser)
+    tracing.add_arguments(parser)
 
     # Extract arguments
     args = parser.parse_args()
+    tracing.configure(args)
 
     # Configure our current application
     _WebCone.authKey = args.authKey
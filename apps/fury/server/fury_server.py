@@ -32,10 +32,7 @@ import os
 
 # import vtk modules.
 import numpy as np
-import matplotlib
-from fury import ui, window, actor, utils
-from fury.io import load_polydata
-import nibabel as nib
+from fury import window, actor, utils
 # from dipy.data import fetch_bundles_2_subjects, read_bundles_2_subjects
 # from dipy.tracking.streamline import transform_streamlines, length
 # from dipy.viz.app import horizon
@@ -43,6 +40,15 @@ import vtk
 from vtk.web import protocols
 from vtk.web import wslink as vtk_wslink
 from wslink import server
+from wslink import register as exportRpc
+from twisted.internet import reactor, task, threads
+
+# Shared fury-web server modules live at the root of the repository
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                             os.pardir, os.pardir, os.pardir)))
+from furyweb import mesh_cache, picking, startup, tracing
+from furyweb.prewarm import cached
+from furyweb.render_state import lod_mapper_hooks
 
 import threading
 
@@ -53,6 +59,241 @@ except ImportError:
     # the source for the same as _argparse and we use it instead.
     from vtk.util import _argparse as argparse
 
+# =============================================================================
+# Static data of the demos
+# =============================================================================
+
+DATA_PATH = "/pvw/data/"
+
+# Fractions of the triangles kept by the levels of detail of the surfaces
+LOD_RATIOS = (.1, .01)
+
+
+def load_pial_surfaces(path=DATA_PATH):
+    """Return the (vertices, cells) of the left and right pial surfaces.
+
+    The arrays are memory-mapped from the binary cache of the GIFTI files
+    (see furyweb.mesh_cache).
+    """
+    def load():
+        return [mesh_cache.load_gifti_mesh(
+                    os.path.join(path, 'pial_%s.gii' % hemisphere))
+                for hemisphere in ('left', 'right')]
+
+    return cached(('pial', path), load)
+
+
+def load_pial_lods(path=DATA_PATH, ratios=LOD_RATIOS):
+    """Return the decimated (vertices, cells) of the pial surfaces.
+
+    One list per hemisphere, with a mesh for each ratio. The meshes are
+    computed once and cached next to the ones of ``load_pial_surfaces``.
+    """
+    def load():
+        return [[mesh_cache.load_decimated_mesh(
+                     os.path.join(path, 'pial_%s.gii' % hemisphere), ratio)
+                 for ratio in ratios]
+                for hemisphere in ('left', 'right')]
+
+    return cached(('pial-lod', path, ratios), load)
+
+
+def prewarm():
+    """Load the static data before a process pool forks (furyweb.prewarm)."""
+    import fury.ui  # noqa: F401
+    load_pial_surfaces()
+    load_pial_lods()
+
+# =============================================================================
+# Demos built on first selection
+# =============================================================================
+
+
+def _set_visibility(element, visible):
+    if hasattr(element, 'add_to_scene'):
+        element.set_visibility(visible)
+    else:
+        element.SetVisibility(visible)
+
+
+def _element_actors(element):
+    return element.actors if hasattr(element, 'add_to_scene') else [element]
+
+
+class LazyDemos(object):
+    """Build each demo the first time it is selected and cache its actors.
+
+    Parameters
+    ----------
+    scene : Scene
+        Scene the demos are added to.
+    builders : list of (str, callable)
+        Name of each demo and the function building it, which returns a
+        ``(name, elements)`` tuple.
+    on_ready : callable, optional
+        Called once a demo is built and displayed, to request a new frame.
+    unload_after : float, optional
+        Remove the demos not displayed for this many seconds from the scene
+        and the cache, to bound the memory of the session (0: never).
+    on_unload : callable, optional
+        Called with the elements of each unloaded demo, to drop the other
+        references to them.
+    """
+
+    def __init__(self, scene, builders, on_ready=None, unload_after=0,
+                 on_unload=None):
+        self.scene = scene
+        self.builders = dict(builders)
+        self.names = [name for name, _ in builders]
+        self.on_ready = on_ready
+        self.unload_after = unload_after
+        self.on_unload = on_unload
+        self.built = {}
+        self.last_shown = {}
+        self.current = None
+        self.loading = None
+
+        from fury import ui
+        self.loading_label = ui.TextBlock2D(text='', font_size=20,
+                                            bold=True, color=(1, 1, 1),
+                                            position=(10, 400))
+        self.loading_label.set_visibility(False)
+        scene.add(self.loading_label)
+
+        if unload_after:
+            self.unload_loop = task.LoopingCall(self.unload_unused)
+            self.unload_loop.start(min(unload_after, 30.), now=False)
+
+    def show(self, name):
+        """Display a demo, building it first if needed."""
+        self.hide_current()
+        self.current = name
+        self.last_shown[name] = time.time()
+        if name in self.built:
+            for element in self.built[name]:
+                _set_visibility(element, True)
+            return
+
+        # Show the indicator now and build once the current frame is sent
+        self.loading = name
+        self.loading_label.message = 'Loading {}...'.format(name)
+        self.loading_label.set_visibility(True)
+        reactor.callLater(0, self.build, name)
+
+    def hide_current(self):
+        for element in self.built.get(self.current, []):
+            _set_visibility(element, False)
+
+    def build(self, name):
+        if name in self.built:
+            return
+        try:
+            _, elements = self.builders[name]()
+            for element in elements:
+                self.scene.add(element)
+                _set_visibility(element, name == self.current)
+            self.built[name] = elements
+        finally:
+            self.loading = None
+            self.loading_label.set_visibility(False)
+        if self.on_ready:
+            self.on_ready()
+
+    def is_loaded(self, element):
+        """Whether an element belongs to a demo still in the cache."""
+        return any(element is loaded for elements in self.built.values()
+                   for loaded in elements)
+
+    def unload_unused(self):
+        now = time.time()
+        for name in list(self.built):
+            if name == self.current or \
+                    now - self.last_shown[name] < self.unload_after:
+                continue
+            elements = self.built.pop(name)
+            for element in elements:
+                self.scene.rm(*_element_actors(element))
+            if self.on_unload:
+                self.on_unload(elements)
+            print('Unloaded {} (unused for {:.0f}s)'.format(
+                name, now - self.last_shown[name]))
+
+
+class InteractionLOD(object):
+    """Render surfaces with decimated meshes while the user interacts.
+
+    The decimated meshes are switched in once the event starting the
+    interaction is handled, so that the click itself still picks the full
+    resolution mesh, and switched out as soon as the interaction ends.
+
+    Parameters
+    ----------
+    application : vtkWebApplication
+        Application emitting the Start/EndInteractionEvent events.
+    view : vtkRenderWindow
+        View of the surfaces.
+    max_triangles : int, optional
+        Number of triangles of a surface above which a decimated mesh is
+        displayed while interacting (0: never).
+    """
+
+    def __init__(self, application, view, max_triangles=100000):
+        self.view = view
+        self.max_triangles = max_triangles
+        self.levels = {}
+        self.interacting = False
+        self.fast, self.full = lod_mapper_hooks(self.levels)
+        application.AddObserver('StartInteractionEvent', self.start)
+        application.AddObserver('EndInteractionEvent', self.end)
+
+    def add(self, surface_actor, meshes):
+        """Use the finest of the (vertices, cells) meshes under the budget.
+        """
+        full_mapper = surface_actor.GetMapper()
+        if not self.max_triangles or \
+                full_mapper.GetInput().GetNumberOfCells() <= self.max_triangles:
+            return
+        candidates = [mesh for mesh in meshes
+                      if len(mesh[1]) <= self.max_triangles]
+        vertices, cells = max(candidates, key=lambda mesh: len(mesh[1])) \
+            if candidates else min(meshes, key=lambda mesh: len(mesh[1]))
+
+        fast_mapper = vtk.vtkPolyDataMapper()
+        fast_mapper.ShallowCopy(full_mapper)
+        fast_mapper.SetInputData(mesh_cache.polydata_from_mesh(vertices, cells))
+        self.levels[surface_actor] = fast_mapper
+
+    def remove(self, actors):
+        """Forget the decimated meshes of actors no longer displayed."""
+        for surface_actor in actors:
+            self.levels.pop(surface_actor, None)
+
+    def start(self, obj, event):
+        self.interacting = True
+        reactor.callLater(0, self._switch)
+
+    def _switch(self):
+        if self.interacting:
+            self.fast(self.view)
+
+    def end(self, obj, event):
+        self.interacting = False
+        self.full(self.view)
+
+
+class DemoImageDelivery(protocols.vtkWebViewPortImageDelivery):
+    """Report the image as stale while a demo is being built.
+
+    The client then asks again for an image until the demo is displayed.
+    """
+
+    @exportRpc("viewport.image.render")
+    def stillRender(self, options):
+        reply = super().stillRender(options)
+        if _WebCone.demos is not None and _WebCone.demos.loading:
+            reply['stale'] = True
+        return reply
+
 # =============================================================================
 # Create custom ServerProtocol class to handle clients requests
 # =============================================================================
@@ -64,8 +305,14 @@ class _WebCone(vtk_wslink.ServerProtocol):
     # Application configuration
     view    = None
     authKey = "wslink-secret"
+    demos = None
+    lod = None
+    unload_demos_after = 0
+    lod_triangles = 100000
 
     def build_slider_demo(self):
+        from fury import ui
+
         panel = ui.Panel2D(size=(500, 150), color=(1.0, 1.0, 1.0),
                            align="right", opacity=0.1)
         panel.center = (500, 400)
@@ -121,34 +368,35 @@ class _WebCone(vtk_wslink.ServerProtocol):
         return ('Slider Demo', [panel, cube])
 
     def build_brain_demo(self, showm):
+        from fury import ui
+
         # path = "/Users/koudoro/Software/temp/"
-        path = "/pvw/data/"
         # lh_path = os.path.join(path, "100307_white_lh.vtk")
         # rh_path = os.path.join(path, "100307_white_rh.vtk")
         # lh_pd = load_polydata(lh_path)
         # rh_pd = load_polydata(rh_path)
-        left_fname = os.path.join(path, 'pial_left.gii')
-        right_fname = os.path.join(path, 'pial_right.gii')
-
-        left_gii = nib.load(left_fname)
-        right_gii = nib.load(right_fname)
-
-        left_pointset = left_gii.darrays[0].data  # NIFTI_INTENT_POINTSET   1008
-        left_triangles = left_gii.darrays[1].data  # NIFTI_INTENT_TRIANGLE   1009
-        right_pointset = right_gii.darrays[0].data
-        right_triangles = right_gii.darrays[1].data
-
-        left_poly = vtk.vtkPolyData()
-        right_poly = vtk.vtkPolyData()
+        (left_vertices, left_cells), (right_vertices, right_cells) = \
+            load_pial_surfaces()
 
-        utils.set_polydata_vertices(left_poly, left_pointset)
-        utils.set_polydata_triangles(left_poly, left_triangles)
-        utils.set_polydata_vertices(right_poly, right_pointset)
-        utils.set_polydata_triangles(right_poly, right_triangles)
+        left_poly = mesh_cache.polydata_from_mesh(left_vertices, left_cells)
+        right_poly = mesh_cache.polydata_from_mesh(right_vertices, right_cells)
 
         lh_actor = utils.get_actor_from_polydata(left_poly)
         rh_actor = utils.get_actor_from_polydata(right_poly)
 
+        # Decimated meshes for interaction, computed off the reactor thread
+        def add_lods(lods):
+            # The demo may have been unloaded in the meantime
+            if not _WebCone.demos.is_loaded(lh_actor):
+                return
+            for surface_actor, meshes in zip([lh_actor, rh_actor], lods):
+                _WebCone.lod.add(surface_actor, meshes)
+
+        if _WebCone.lod_triangles:
+            threads.deferToThread(load_pial_lods).addCallbacks(
+                add_lods, lambda failure: print(
+                    'Surface LOD failed: {}'.format(failure.getErrorMessage())))
+
         text_block = ui.TextBlock2D(text='', font_size=15, bold=True,
                                     color=(1, 1, 1))
 
@@ -156,10 +404,8 @@ class _WebCone(vtk_wslink.ServerProtocol):
                            color=(.8, .8, .8), opacity=0.1)
         panel.add_element(text_block, (0.1, 0.1))
 
-        picker = vtk.vtkCellPicker()
-        # picker = window.vtk.vtkPointPicker()
-        # print(picker.GetTolerance())
-        picker.SetTolerance(0.01)
+        # Locators built once: a pick no longer scans every triangle
+        picker = picking.surface_picker([lh_actor, rh_actor], tolerance=0.01)
 
         dummy_sphere = actor.sphere(centers=np.array([[0, 0, 0]]),
                                     radii=1,
@@ -238,6 +484,8 @@ class _WebCone(vtk_wslink.ServerProtocol):
         return ('Bundle Demo', [])  #[bundle_actor])
 
     def build_surface_demo(self, showm):
+        from fury import ui
+
         xyzr = np.array([[0, 0, 0, 10], [100, 0, 0, 50], [200, 0, 0, 100]])
 
         colors = np.random.rand(*(xyzr.shape[0], 4))
@@ -259,10 +507,8 @@ class _WebCone(vtk_wslink.ServerProtocol):
         # sphere_actor.GetProperty().SetWireFrame(1)
         axes_actor = actor.axes(scale=(10, 10, 10))
 
-        picker = vtk.vtkCellPicker()
-        # picker = window.vtk.vtkPointPicker()
-        # print(picker.GetTolerance())
-        picker.SetTolerance(0.01)
+        # Locators built once: a pick no longer scans every triangle
+        picker = picking.surface_picker([sphere_actor], tolerance=0.01)
 
         dummy_sphere = actor.sphere(centers=np.array([[0, 0, 0]]),
                                     radii=.1,
@@ -308,13 +554,14 @@ class _WebCone(vtk_wslink.ServerProtocol):
         return ('Surface Demo', [panel, axes_actor, sphere_actor, dummy_sphere])
 
     def initialize(self):
+        startup.mark('initialize')
         print(sys.version)
         global renderer, renderWindow, renderWindowInteractor  #, cone, mapper, actor
 
         # Bring used components
         self.registerVtkWebProtocol(protocols.vtkWebMouseHandler())
         self.registerVtkWebProtocol(protocols.vtkWebViewPort())
-        self.registerVtkWebProtocol(protocols.vtkWebViewPortImageDelivery())
+        self.registerVtkWebProtocol(DemoImageDelivery())
         # self.registerVtkWebProtocol(protocols.vtkWebPublishImageDelivery(decode=False))
         self.registerVtkWebProtocol(protocols.vtkWebViewPortGeometryDelivery())
 
@@ -329,47 +576,39 @@ class _WebCone(vtk_wslink.ServerProtocol):
             TEST_HORIZON = False
 
             if not TEST_HORIZON:
+                # Not imported with the module, the pool preloads it in
+                # prewarm()
+                from fury import ui
+
                 showm = window.ShowManager()
                 showm.initialize()
 
-                slider_demo = self.build_slider_demo()
-                brain_demo = self.build_brain_demo(showm)
-                bundle_demo = self.build_bundle_demo()
-                surface_demo = self.build_surface_demo(showm)
-
-                examples = [slider_demo, brain_demo]
-                examples_names = [name for name, act in examples]
-
-                listbox = ui.ListBox2D(values=examples_names,
+                # Demos are only built once selected in the list
+                demos = LazyDemos(
+                    showm.scene,
+                    [('Slider Demo', self.build_slider_demo),
+                     ('Brain Demo', lambda: self.build_brain_demo(showm))],
+                    on_ready=lambda: self.getApplication().InvokeEvent(
+                        'UpdateEvent'),
+                    unload_after=_WebCone.unload_demos_after,
+                    on_unload=lambda elements: _WebCone.lod.remove(elements))
+                _WebCone.demos = demos
+                _WebCone.lod = InteractionLOD(self.getApplication(),
+                                              showm.window,
+                                              _WebCone.lod_triangles)
+
+                listbox = ui.ListBox2D(values=demos.names,
                                        position=(10, 300),
                                        size=(300, 80),
                                        multiselection=False)
 
-                def hide_all_examples():
-                    for _, l_act in examples:
-                        for element in l_act:
-                            if hasattr(element, 'add_to_scene'):
-                                element.set_visibility(False)
-                            else:
-                                element.SetVisibility(False)
-
                 def display_element():
-                    hide_all_examples()
-                    example = examples[examples_names.index(listbox.selected[0])]
-                    for element in example[1]:
-                        if hasattr(element, 'add_to_scene'):
-                            element.set_visibility(True)
-                        else:
-                            element.SetVisibility(True)
+                    demos.show(listbox.selected[0])
 
                 listbox.on_change = display_element
                 listbox.panel.color = (1.0, 1.0, 1.0)
                 listbox.panel.opacity = 0.3
-                hide_all_examples()
                 showm.scene.add(listbox)
-                for _, l_act in examples:
-                    for element in l_act:
-                        showm.scene.add(element)
 
                 # VTK specific code
                 renderer = showm.scene
@@ -414,6 +653,11 @@ class _WebCone(vtk_wslink.ServerProtocol):
             # view = self.getApplication().GetObjectIdMap().GetActiveObject("VIEW")
             # import pdb; pdb.set_trace()
 
+        startup.mark('initialized')
+        startup.watch_first_frame(
+            self.getApplication().GetObjectIdMap().GetActiveObject("VIEW"))
+        tracing.instrument(self)
+
 # =============================================================================
 # Main: Parse args and start server
 # =============================================================================
@@ -425,12 +669,25 @@ if __name__ == "__main__":
 
     # Add default arguments
     server.add_arguments(parser)
+    tracing.add_arguments(parser)
+    parser.add_argument("--unload-demos-after", default=0, type=float,
+                        dest="unload_demos_after",
+                        help="Remove the demos not displayed for this many "
+                             "seconds from memory (0: keep them)")
+    parser.add_argument("--lod-triangles", default=100000, type=int,
+                        dest="lod_triangles",
+                        help="Display decimated brain surfaces while "
+                             "interacting when they have more triangles "
+                             "than this (0: always full resolution)")
 
     # Extract arguments
     args = parser.parse_args()
+    tracing.configure(args)
 
     # Configure our current application
     _WebCone.authKey = args.authKey
+    _WebCone.unload_demos_after = args.unload_demos_after
+    _WebCone.lod_triangles = args.lod_triangles
 
     # Start server
     server.start_webserver(options=args, protocol=_WebCone)
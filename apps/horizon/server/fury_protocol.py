@@ -0,0 +1,28 @@
+from vtk.web import protocols
+from wslink import register
+
+
+class HorizonProtocol(protocols.vtkWebProtocol):
+
+    def __init__(self, streamlines):
+        super(HorizonProtocol, self).__init__()
+        self.streamlines = streamlines
+
+    @register("horizon.clusters.threshold")
+    def set_cluster_threshold(self, threshold=None):
+        """Draw the centroids of a threshold in mm (None: the streamlines).
+        """
+        threshold = None if threshold is None else float(threshold)
+        deferred = self.streamlines.show_clusters(threshold)
+        if deferred is not None:
+            deferred.addErrback(lambda failure: print(
+                'Clustering failed: {}'.format(failure.getErrorMessage())))
+        return {'threshold': threshold,
+                'cached': self.streamlines.clustering.cached_thresholds()}
+
+    @register("horizon.clusters.stats")
+    def get_cluster_stats(self):
+        return dict(self.streamlines.clustering.stats,
+                    threshold=self.streamlines.cluster_thr,
+                    level=self.streamlines.level,
+                    pending=sorted(self.streamlines.clustering.pending))
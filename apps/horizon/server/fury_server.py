@@ -0,0 +1,362 @@
+r"""
+This module is a VTK/FURY Web server application exploring tractograms, in
+the spirit of DIPY Horizon. The following command line illustrates how to
+use it:
+
+$ vtkpython .../fury_server.py --tractogram /data/whole_brain.trk
+
+The tractogram (``.trk`` or ``.tck``) is memory-mapped, never loaded as a
+whole (see ``furyweb.tractography``). A sample of its streamlines is drawn
+as soon as the file is indexed, then replaced by finer levels computed in a
+worker thread: the streamlines resampled to 12 points and finally at full
+resolution, or with ``--cluster`` their QuickBundles centroids, computed in
+a worker process (see ``furyweb.clustering``). The resampled levels and the
+clusters are cached next to the file, the next sessions on the same
+tractogram only read them, and ``horizon.clusters.threshold`` switches
+between thresholds and back to the streamlines.
+
+Any VTK Web executable script comes with a set of standard arguments that can
+be overriden if need be:
+    --host localhost
+        Interface on which the HTTP server will listen.
+    --port 8080
+        Port number on which the HTTP server will listen.
+    --content /path-to-web-content/
+        Directory that you want to serve as static web content. By default,
+        this variable is empty which means that we rely on another server to
+        deliver the static content and the current process only focuses on the
+        WebSocket connectivity of clients.
+    --authKey wslink-secret
+        Secret key that should be provided by the client to allow it to make
+        any WebSocket communication. The client will assume if none is given
+        that the server expects "wslink-secret" as the secret key.
+"""
+
+
+from fury import actor, window
+from fury_protocol import HorizonProtocol
+from twisted.internet import reactor, threads
+from vtk.web import protocols
+from vtk.web import wslink as vtk_wslink
+from wslink import server
+
+
+import argparse
+import os
+import sys
+import time
+import numpy as np
+import vtk
+
+# Shared fury-web server modules live at the root of the repository
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                             os.pardir, os.pardir, os.pardir)))
+from furyweb import startup, tracing, tractography
+from furyweb.clustering import ClusteringService
+from furyweb.image_delivery import vtkWebPublishImageDelivery
+
+
+def evenly_spaced(n, size):
+    """Indices of at most size items spread over n, in increasing order."""
+    if size >= n:
+        return np.arange(n)
+    return np.unique(np.linspace(0, n - 1, size).astype(np.int64))
+
+
+class ProgressiveTractogram(object):
+    """Draw a tractogram coarse first, then finer levels once computed.
+
+    Levels and their polydata are built in worker threads, one after the
+    other, and the actor of the previous level is only replaced on the
+    reactor thread.
+
+    Parameters
+    ----------
+    scene : Scene
+    path : str
+        ``.trk`` or ``.tck`` file.
+    max_streamlines : int, optional
+        Streamlines drawn by the finer levels.
+    sample_size : int, optional
+        Streamlines of the first level, read straight from the file.
+    clustering : ClusteringService, optional
+        Clusters of the tractogram, needed to draw centroids.
+    cluster_thr : float, optional
+        Draw the QuickBundles centroids of this threshold in mm instead of
+        the streamlines (None: streamlines).
+    cache_dir : str, optional
+        See ``tractography.load_tractogram``.
+    on_update : callable, optional
+        Called after a level is displayed.
+    """
+
+    def __init__(self, scene, path, max_streamlines=100000, sample_size=5000,
+                 clustering=None, cluster_thr=None, cache_dir=None,
+                 on_update=None):
+        self.scene = scene
+        self.path = path
+        self.max_streamlines = max_streamlines
+        self.sample_size = sample_size
+        self.clustering = clustering
+        self.cluster_thr = cluster_thr
+        self.cache_dir = cache_dir
+        self.on_update = on_update
+        self.tractogram = None
+        self.selection = None
+        self.resampled = False
+        self.actor = None
+        self.level = None
+        self.started = time.time()
+
+    def start(self):
+        deferred = threads.deferToThread(
+            lambda: self._build(self._sample()))
+        deferred.addCallback(self._show)
+        deferred.addCallback(lambda _: threads.deferToThread(
+            lambda: self._build(self._resampled())))
+        deferred.addCallback(self._show)
+        deferred.addCallback(lambda _: self.show_clusters(self.cluster_thr))
+        deferred.addErrback(lambda failure: print(
+            'Tractogram loading failed: {}'.format(
+                failure.getErrorMessage())))
+        return deferred
+
+    def show_clusters(self, threshold):
+        """Draw the centroids of a threshold (None: the streamlines).
+
+        Only the last threshold asked for is drawn, the clusters of the
+        previous ones are still computed and cached.
+        """
+        self.cluster_thr = threshold
+        if not self.resampled:
+            # Drawn once the coarser levels are
+            return None
+        if threshold is None:
+            def show_full(level):
+                if self.cluster_thr is None:
+                    self._show(level)
+
+            return threads.deferToThread(
+                lambda: self._build(self._full())).addCallback(show_full)
+
+        def build(clusters):
+            return threads.deferToThread(
+                self._build, ('centroids', np.asarray(clusters[0])))
+
+        def show(level):
+            if self.cluster_thr == threshold:
+                self._show(level)
+
+        return self.clustering.clusters(threshold).addCallback(
+            build).addCallback(show)
+
+    def _sample(self):
+        self.tractogram = tractography.load_tractogram(self.path,
+                                                       self.cache_dir)
+        selection = evenly_spaced(len(self.tractogram), self.sample_size)
+        points, lengths = self.tractogram.points(selection)
+        streamlines = tractography.resample(points, lengths,
+                                            min(tractography.RESAMPLED_POINTS))
+        return 'sample', streamlines
+
+    def _resampled(self):
+        levels = tractography.resample_levels(self.tractogram,
+                                              cache_dir=self.cache_dir)
+        if self.clustering is not None and self.clustering.prefix is None:
+            # Hashed by resample_levels already, lists the cached clusters
+            self.clustering.prefix = tractography.cache_prefix(
+                self.path, self.cache_dir)
+        self.resampled = True
+        if self.cluster_thr is not None:
+            # Clustered from the cached levels by the worker process
+            return None
+        self.selection = evenly_spaced(len(self.tractogram),
+                                       self.max_streamlines)
+        return 'resampled', levels[12][self.selection]
+
+    def _full(self):
+        if self.selection is None:
+            self.selection = evenly_spaced(len(self.tractogram),
+                                           self.max_streamlines)
+        points, lengths = self.tractogram.points(self.selection)
+        # Colored like the coarser levels, by their end points
+        ends = np.cumsum(lengths) - 1
+        colors = tractography.orientation_colors(
+            np.stack([points[ends - lengths + 1], points[ends]], axis=1))
+        return 'full', (points, lengths, colors)
+
+    def _build(self, level):
+        """Polydata of a level, in the worker thread."""
+        if level is None:
+            return None
+        name, streamlines = level
+        if isinstance(streamlines, tuple):
+            points, lengths, colors = streamlines
+        else:
+            points = streamlines.reshape(-1, 3)
+            lengths = np.full(len(streamlines), streamlines.shape[1])
+            colors = tractography.orientation_colors(streamlines)
+        return name, tractography.lines_polydata(points, lengths, colors)
+
+    def _show(self, level):
+        if level is None:
+            return
+        name, polydata = level
+
+        mapper = vtk.vtkPolyDataMapper()
+        mapper.SetInputData(polydata)
+        lines_actor = vtk.vtkActor()
+        lines_actor.SetMapper(mapper)
+        if name == 'centroids':
+            lines_actor.GetProperty().SetLineWidth(3)
+
+        self.scene.AddActor(lines_actor)
+        if self.actor is None:
+            self.scene.ResetCamera()
+        else:
+            self.scene.RemoveActor(self.actor)
+        self.actor = lines_actor
+        self.level = name
+        print('Tractogram {0}: {1} level, {2} lines, {3} points, after '
+              '{4:.1f}s'.format(self.path, name, polydata.GetNumberOfLines(),
+                                polydata.GetNumberOfPoints(),
+                                time.time() - self.started))
+        if self.on_update is not None:
+            self.on_update()
+
+
+class _WebHorizon(vtk_wslink.ServerProtocol):
+
+    # Application configuration
+    authKey = 'wslink-secret'
+    view = None
+    streamlines = None
+    metrics_file = None
+    metrics_labels = {'app': 'horizon'}
+    tractogram = None
+    max_streamlines = 100000
+    sample_size = 5000
+    cluster = False
+    cluster_thr = 5.
+    cache_dir = None
+
+    def initialize(self):
+        startup.mark('initialize')
+        # Bring used components
+        self.registerVtkWebProtocol(protocols.vtkWebMouseHandler())
+        self.registerVtkWebProtocol(protocols.vtkWebViewPort())
+        # Image delivery pushed from the server
+        image_delivery = vtkWebPublishImageDelivery(
+            decode=False, metricsLabels=_WebHorizon.metrics_labels)
+        if _WebHorizon.metrics_file:
+            image_delivery.startMetricsTextfile(_WebHorizon.metrics_file)
+        self.registerVtkWebProtocol(image_delivery)
+
+        # Tell the C++ web app to use no encoding.
+        # ParaViewWebPublishImageDelivery must be set to decode=False to match.
+        # RAW instead of base64
+        self.getApplication().SetImageEncoding(0)
+
+        # Update authentication key to use
+        self.updateSecret(_WebHorizon.authKey)
+
+        # Create default pipeline (Only once for all the session)
+        if not _WebHorizon.view:
+            # FURY specific code
+            scene = window.Scene()
+            scene.background((0, 0, 0))
+            scene.add(actor.axes())
+
+            showm = window.ShowManager(scene)
+            ren_win = showm.window
+
+            ren_win_interactor = vtk.vtkRenderWindowInteractor()
+            ren_win_interactor.SetRenderWindow(ren_win)
+            ren_win_interactor.GetInteractorStyle().\
+                SetCurrentStyleToTrackballCamera()
+            ren_win_interactor.EnableRenderOff()
+
+            # VTK Web application specific
+            _WebHorizon.view = ren_win
+            self.getApplication().GetObjectIdMap().SetActiveObject(
+                'VIEW', ren_win)
+
+            # Coarse level first, refined in the background
+            application = self.getApplication()
+            clustering = ClusteringService(_WebHorizon.tractogram,
+                                           _WebHorizon.cache_dir)
+            reactor.addSystemEventTrigger('before', 'shutdown',
+                                          clustering.close)
+            _WebHorizon.streamlines = ProgressiveTractogram(
+                scene, _WebHorizon.tractogram,
+                max_streamlines=_WebHorizon.max_streamlines,
+                sample_size=_WebHorizon.sample_size,
+                clustering=clustering,
+                cluster_thr=_WebHorizon.cluster_thr
+                if _WebHorizon.cluster else None,
+                cache_dir=_WebHorizon.cache_dir,
+                on_update=lambda: application.InvokeEvent(
+                    'UpdateEvent'))
+            _WebHorizon.streamlines.start()
+
+        # Custom API
+        self.registerVtkWebProtocol(HorizonProtocol(_WebHorizon.streamlines))
+
+        startup.mark('initialized')
+        startup.watch_first_frame(
+            self.getApplication().GetObjectIdMap().GetActiveObject("VIEW"))
+        tracing.instrument(self)
+
+
+# =============================================================================
+# Main: Parse args and start server
+# =============================================================================
+if __name__ == "__main__":
+    description = 'FURY/Web Horizon tractography web-application'
+
+    # Create argument parser
+    parser = argparse.ArgumentParser(description=description)
+
+    # Add default arguments
+    server.add_arguments(parser)
+    parser.add_argument("--tractogram", required=True, dest="tractogram",
+                        help=".trk or .tck file to explore.")
+    parser.add_argument("--max-streamlines", default=100000, type=int,
+                        dest="max_streamlines",
+                        help="Streamlines drawn once the tractogram is "
+                             "resampled.")
+    parser.add_argument("--sample-size", default=5000, type=int,
+                        dest="sample_size",
+                        help="Streamlines drawn while the finer levels are "
+                             "computed.")
+    parser.add_argument("--cluster", action="store_true", dest="cluster",
+                        help="Draw the QuickBundles centroids instead of the "
+                             "streamlines.")
+    parser.add_argument("--cluster-thr", default=5., type=float,
+                        dest="cluster_thr",
+                        help="QuickBundles distance threshold in mm.")
+    parser.add_argument("--cache-dir", default=None, dest="cache_dir",
+                        help="Directory of the cached levels (default: next "
+                             "to the tractogram).")
+    parser.add_argument("--metrics-file", default=None, dest="metrics_file",
+                        help="Prometheus textfile to periodically write the "
+                             "image delivery metrics to.")
+    tracing.add_arguments(parser)
+
+    # Extract arguments
+    args = parser.parse_args()
+    tracing.configure(args)
+
+    # Configure our current application
+    _WebHorizon.authKey = args.authKey
+    _WebHorizon.metrics_file = args.metrics_file
+    _WebHorizon.tractogram = args.tractogram
+    _WebHorizon.max_streamlines = args.max_streamlines
+    _WebHorizon.sample_size = args.sample_size
+    _WebHorizon.cluster = args.cluster
+    _WebHorizon.cluster_thr = args.cluster_thr
+    _WebHorizon.cache_dir = args.cache_dir
+    _WebHorizon.metrics_labels['port'] = args.port
+
+    # Start server
+    server.start_webserver(options=args, protocol=_WebHorizon)
@@ -82,6 +82,16 @@ clientToConnect
   .then((validClient) => {
     connectImageStream(validClient.getConnection().getSession());
     const session = validClient.getConnection().getSession();
+
+    // Acknowledge every pushed frame so the server never queues more
+    // images than the connection can absorb
+    session.call('viewport.image.push.flow', [-1, true, 2]);
+    session.subscribe('viewport.image.push.subscription', ([frame]) => {
+      if (frame.frameId !== undefined) {
+        session.call('viewport.image.push.ack', [frame.id, frame.frameId]);
+      }
+    });
+
     view.setSession(session);
     view.setViewId(-1);
     view.render();
@@ -16,10 +16,8 @@ r"""
             that the server expects "vtkweb-secret" as secret key.
 """
 import os
-import random
 import sys
 import argparse
-import json
 
 # Try handle virtual env if provided
 if '--virtual-env' in sys.argv:
@@ -39,340 +37,19 @@ from vtk.web import wslink as vtk_wslink
 from vtk.web import protocols as vtk_protocols
 
 import vtk
-import base64
-import time
-# import Twisted reactor for later callback
-from twisted.internet import reactor
 
 import numpy as np
 from fury import actor, window
 
-
-# =============================================================================
-#
-# Provide publish-based Image delivery mechanism
-#
-# =============================================================================
-
-class vtkWebPublishImageDelivery(vtk_protocols.vtkWebProtocol):
-    def __init__(self, decode=True):
-        super(vtkWebPublishImageDelivery, self).__init__()
-        self.trackingViews = {}
-        self.lastStaleTime = 0
-        self.staleHandlerCount = 0
-        self.deltaStaleTimeBeforeRender = 0.5  # 0.5s
-        self.decode = decode
-        self.viewsInAnimations = []
-        self.targetFrameRate = 30.0
-        self.minFrameRate = 12.0
-        self.maxFrameRate = 30.0
-
-    def pushRender(self, vId, ignoreAnimation=False):
-        if vId not in self.trackingViews:
-            return
-
-        if not self.trackingViews[vId]["enabled"]:
-            return
-
-        if not ignoreAnimation and len(self.viewsInAnimations) > 0:
-            return
-
-        if "originalSize" not in self.trackingViews[vId]:
-            view = self.getView(vId)
-            self.trackingViews[vId]["originalSize"] = list(view.GetSize())
-
-        if "ratio" not in self.trackingViews[vId]:
-            self.trackingViews[vId]["ratio"] = 1
-
-        ratio = self.trackingViews[vId]["ratio"]
-        mtime = self.trackingViews[vId]["mtime"]
-        quality = self.trackingViews[vId]["quality"]
-        size = [int(s * ratio)
-                for s in self.trackingViews[vId]["originalSize"]]
-
-        reply = self.stillRender({"view": vId,
-                                  "mtime": mtime,
-                                  "quality": quality,
-                                  "size": size})
-        stale = reply["stale"]
-        if reply["image"]:
-            # depending on whether the app has encoding enabled:
-            if self.decode:
-                reply["image"] = base64.standard_b64decode(reply["image"])
-
-            reply["image"] = self.addAttachment(reply["image"])
-            reply["format"] = "jpeg"
-            # save mtime for next call.
-            self.trackingViews[vId]["mtime"] = reply["mtime"]
-            # echo back real ID, instead of -1 for 'active'
-            reply["id"] = vId
-            self.publish('viewport.image.push.subscription', reply)
-        if stale:
-            self.lastStaleTime = time.time()
-            if self.staleHandlerCount == 0:
-                self.staleHandlerCount += 1
-                reactor.callLater(self.deltaStaleTimeBeforeRender,
-                                  lambda: self.renderStaleImage(vId))
-        else:
-            self.lastStaleTime = 0
-
-    def renderStaleImage(self, vId):
-        self.staleHandlerCount -= 1
-
-        if self.lastStaleTime != 0:
-            delta = (time.time() - self.lastStaleTime)
-            if delta >= self.deltaStaleTimeBeforeRender:
-                self.pushRender(vId)
-            else:
-                self.staleHandlerCount += 1
-                reactor.callLater(self.deltaStaleTimeBeforeRender - delta + 0.001, lambda: self.renderStaleImage(vId))
-
-    def animate(self):
-        if len(self.viewsInAnimations) == 0:
-            return
-
-        nextAnimateTime = time.time() + 1.0 / self.targetFrameRate
-        for vId in self.viewsInAnimations:
-            self.pushRender(vId, True)
-
-        nextAnimateTime -= time.time()
-
-        if self.targetFrameRate > self.maxFrameRate:
-            self.targetFrameRate = self.maxFrameRate
-
-        if nextAnimateTime < 0:
-            if nextAnimateTime < -1.0:
-                self.targetFrameRate = 1
-            if self.targetFrameRate > self.minFrameRate:
-                self.targetFrameRate -= 1.0
-            reactor.callLater(0.001, lambda: self.animate())
-        else:
-            if self.targetFrameRate < self.maxFrameRate and nextAnimateTime > 0.005:
-                self.targetFrameRate += 1.0
-            reactor.callLater(nextAnimateTime, lambda: self.animate())
-
-    @exportRpc("viewport.image.animation.fps.max")
-    def setMaxFrameRate(self, fps=30):
-        self.maxFrameRate = fps
-
-    @exportRpc("viewport.image.animation.fps.get")
-    def getCurrentFrameRate(self):
-        return self.targetFrameRate
-
-    @exportRpc("viewport.image.animation.start")
-    def startViewAnimation(self, viewId='-1'):
-        sView = self.getView(viewId)
-        realViewId = str(self.getGlobalId(sView))
-
-        self.viewsInAnimations.append(realViewId)
-        if len(self.viewsInAnimations) == 1:
-            self.animate()
-
-    @exportRpc("viewport.image.animation.stop")
-    def stopViewAnimation(self, viewId='-1'):
-        sView = self.getView(viewId)
-        realViewId = str(self.getGlobalId(sView))
-
-        if realViewId in self.viewsInAnimations:
-            self.viewsInAnimations.remove(realViewId)
-
-    @exportRpc("viewport.image.push")
-    def imagePush(self, options):
-        sView = self.getView(options["view"])
-        realViewId = str(self.getGlobalId(sView))
-        # Make sure an image is pushed
-        self.getApplication().InvalidateCache(sView)
-        self.pushRender(realViewId)
-
-    # Internal function since the reply[image] is not
-    # JSON(serializable) it can not be an RPC one
-    def stillRender(self, options):
-        """
-        RPC Callback to render a view and obtain the rendered image.
-        """
-        beginTime = int(round(time.time() * 1000))
-        view = self.getView(options["view"])
-        size = view.GetSize()[0:2]
-        resize = size != options.get("size", size)
-        if resize:
-            size = options["size"]
-            if size[0] > 10 and size[1] > 10:
-                view.SetSize(size)
-        t = 0
-        if options and "mtime" in options:
-            t = options["mtime"]
-        quality = 100
-        if options and "quality" in options:
-            quality = options["quality"]
-        localTime = 0
-        if options and "localTime" in options:
-            localTime = options["localTime"]
-        reply = {}
-        app = self.getApplication()
-        if t == 0:
-            app.InvalidateCache(view)
-        if self.decode:
-            stillRender = app.StillRenderToString
-        else:
-            stillRender = app.StillRenderToBuffer
-        reply_image = stillRender(view, t, quality)
-
-        # Check that we are getting image size we have set if not wait until we
-        # do. The render call will set the actual window size.
-        tries = 10
-        while resize and list(view.GetSize()) != size \
-              and size != [0, 0] and tries > 0:
-            app.InvalidateCache(view)
-            reply_image = stillRender(view, t, quality)
-            tries -= 1
-
-        if not resize and options and ("clearCache" in options) and options["clearCache"]:
-            app.InvalidateCache(view)
-            reply_image = stillRender(view, t, quality)
-
-        reply["stale"] = app.GetHasImagesBeingProcessed(view)
-        reply["mtime"] = app.GetLastStillRenderToMTime()
-        reply["size"] = view.GetSize()[0:2]
-        reply["memsize"] = reply_image.GetDataSize() if reply_image else 0
-        reply["format"] = "jpeg;base64" if self.decode else "jpeg"
-        reply["global_id"] = str(self.getGlobalId(view))
-        reply["localTime"] = localTime
-        if self.decode:
-            reply["image"] = reply_image
-        else:
-            # Convert the vtkUnsignedCharArray into a bytes object, required by Autobahn websockets
-            reply["image"] = memoryview(reply_image).tobytes() if reply_image else None
-
-        endTime = int(round(time.time() * 1000))
-        reply["workTime"] = (endTime - beginTime)
-
-        return reply
-
-    @exportRpc("viewport.image.push.observer.add")
-    def addRenderObserver(self, viewId):
-        sView = self.getView(viewId)
-        if not sView:
-            return {'error': 'Unable to get view with id %s' % viewId}
-
-        realViewId = str(self.getGlobalId(sView))
-
-        if not realViewId in self.trackingViews:
-            observerCallback = lambda *args, **kwargs: self.pushRender(realViewId)
-            startCallback = lambda *args, **kwargs: self.startViewAnimation(realViewId)
-            stopCallback = lambda *args, **kwargs: self.stopViewAnimation(realViewId)
-            tag = self.getApplication().AddObserver('UpdateEvent', observerCallback)
-            tagStart = self.getApplication().AddObserver('StartInteractionEvent', startCallback)
-            tagStop = self.getApplication().AddObserver('EndInteractionEvent', stopCallback)
-            # TODO: do we need
-            # self.getApplication().AddObserver('ResetActiveView', resetActiveView())
-            self.trackingViews[realViewId] = {'tags': [tag, tagStart, tagStop],
-                                              'observerCount': 1,
-                                              'mtime': 0,
-                                              'enabled': True,
-                                              'quality': 100}
-        else:
-            # There is an observer on this view already
-            self.trackingViews[realViewId]['observerCount'] += 1
-
-        self.pushRender(realViewId)
-        return {'success': True, 'viewId': realViewId}
-
-    @exportRpc("viewport.image.push.observer.remove")
-    def removeRenderObserver(self, viewId):
-        sView = self.getView(viewId)
-        if not sView:
-            return {'error': 'Unable to get view with id %s' % viewId}
-
-        realViewId = str(self.getGlobalId(sView))
-
-        observerInfo = None
-        if realViewId in self.trackingViews:
-            observerInfo = self.trackingViews[realViewId]
-
-        if not observerInfo:
-            return {'error': 'Unable to find subscription for view %s' % realViewId}
-
-        observerInfo['observerCount'] -= 1
-
-        if observerInfo['observerCount'] <= 0:
-            for tag in observerInfo['tags']:
-                self.getApplication().RemoveObserver(tag)
-            del self.trackingViews[realViewId]
-
-        return { 'result': 'success' }
-
-    @exportRpc("viewport.image.push.quality")
-    def setViewQuality(self, viewId, quality, ratio=1):
-        sView = self.getView(viewId)
-        if not sView:
-            return {'error': 'Unable to get view with id %s' % viewId}
-
-        realViewId = str(self.getGlobalId(sView))
-        observerInfo = None
-        if realViewId in self.trackingViews:
-            observerInfo = self.trackingViews[realViewId]
-
-        if not observerInfo:
-            return {'error': 'Unable to find subscription for view %s' % realViewId}
-
-        observerInfo['quality'] = quality
-        observerInfo['ratio'] = ratio
-
-        # Update image size right now!
-        if "originalSize" in self.trackingViews[realViewId]:
-            size = [int(s * ratio) for s in self.trackingViews[realViewId]["originalSize"]]
-            if hasattr(sView, 'SetSize'):
-                sView.SetSize(size)
-            else:
-                sView.ViewSize = size
-
-        return {'result': 'success'}
-
-    @exportRpc("viewport.image.push.original.size")
-    def setViewSize(self, viewId, width, height):
-        sView = self.getView(viewId)
-        if not sView:
-            return {'error': 'Unable to get view with id %s' % viewId}
-
-        realViewId = str(self.getGlobalId(sView))
-        observerInfo = None
-        if realViewId in self.trackingViews:
-            observerInfo = self.trackingViews[realViewId]
-
-        if not observerInfo:
-            return {'error': 'Unable to find subscription for view %s' % realViewId}
-
-        observerInfo['originalSize'] = [width, height]
-
-        return {'result': 'success'}
-
-    @exportRpc("viewport.image.push.enabled")
-    def enableView(self, viewId, enabled):
-        sView = self.getView(viewId)
-        if not sView:
-            return {'error': 'Unable to get view with id %s' % viewId}
-
-        realViewId = str(self.getGlobalId(sView))
-        observerInfo = None
-        if realViewId in self.trackingViews:
-            observerInfo = self.trackingViews[realViewId]
-
-        if not observerInfo:
-            return {'error': 'Unable to find subscription for view %s' % realViewId}
-
-        observerInfo['enabled'] = enabled
-
-        return {'result': 'success'}
-
-    @exportRpc("viewport.image.push.invalidate.cache")
-    def invalidateCache(self, viewId):
-        sView = self.getView(viewId)
-        if not sView:
-            return {'error': 'Unable to get view with id %s' % viewId}
-
-        self.getApplication().InvalidateCache(sView)
-        self.getApplication().InvokeEvent('UpdateEvent')
-        return {'result': 'success'}
+# Shared fury-web server modules live at the root of the repository
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                             os.pardir, os.pardir, os.pardir)))
+from furyweb import generators, primitive_io, startup, tracing
+from furyweb.culling import InstanceCuller
+from furyweb.image_delivery import vtkWebPublishImageDelivery
+from furyweb.playback import SeriesPlayer
+from furyweb.primitive_buffers import PrimitiveBuffers
+from furyweb.render_state import lod_actor_hooks
 
 
 # -------------------------------------------------------------------------
@@ -404,6 +81,123 @@ class MouseWheel(vtk_protocols.vtkWebProtocol):
             self.getApplication().InvokeEvent('EndInteractionEvent')
 
 
+def build_sdf_actor(centers, directions, colors, codes):
+    """actor.sdf with integer coded primitive types (see primitive_io).
+
+    fury looks up the code of each primitive type name in Python; the actor
+    is built with a single type instead, then its primitive attribute is
+    written from the codes at once.
+    """
+    sdf_actor = actor.sdf(centers, directions, colors, 'sphere')
+    PrimitiveBuffers(sdf_actor, len(centers)).set_attribute('primitive',
+                                                            codes)
+    return sdf_actor
+
+
+def update_primitives(buffers, state, index=None):
+    """Write centers, colors, directions and primitives (codes) in place."""
+    for prim_buffers in buffers:
+        if 'centers' in state:
+            prim_buffers.set_centers(state['centers'], index)
+        if 'colors' in state:
+            prim_buffers.set_colors(state['colors'], index)
+        if 'directions' in state and 'direction' in prim_buffers:
+            prim_buffers.set_attribute('direction', state['directions'],
+                                       index)
+        if 'primitives' in state and 'primitive' in prim_buffers:
+            prim_buffers.set_attribute('primitive', state['primitives'],
+                                       index)
+
+
+def _as_array(value, dtype, columns=None):
+    """Array of a JSON list or of a binary attachment of dtype values."""
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        array = np.frombuffer(value, dtype=dtype)
+    else:
+        array = np.asarray(value, dtype=dtype)
+    return array.reshape(-1, columns) if columns else array.ravel()
+
+
+class PrimitiveEditor(vtk_protocols.vtkWebProtocol):
+    """Update a subset of the primitives without rebuilding the actors."""
+
+    def __init__(self):
+        super(PrimitiveEditor, self).__init__()
+        self.buffers = []
+        self.n_primitives = 0
+        self.culler = None
+
+    @exportRpc("sdf.primitives.update")
+    def update(self, index, centers=None, colors=None, directions=None,
+               types=None):
+        """Write the attributes of the primitives of index.
+
+        Each attribute is a list, or a binary attachment of float32 values
+        (uint32 for index, uint8 codes for types); types may also be names.
+        """
+        index = _as_array(index, np.uint32).astype(np.int64)
+        if len(index) and (index.min() < 0 or
+                           index.max() >= self.n_primitives):
+            return {'error': 'Index out of range [0, %d)' % self.n_primitives}
+
+        state = {}
+        for name, value in (('centers', centers), ('colors', colors),
+                            ('directions', directions)):
+            if value is not None:
+                state[name] = _as_array(value, np.float32, 3)
+        if types is not None:
+            state['primitives'] = primitive_io.primitive_codes(types) \
+                if types and isinstance(types[0], str) else \
+                _as_array(types, np.uint8)
+        for name, values in state.items():
+            if len(values) != len(index):
+                return {'error': '%d %s for %d primitives' % (
+                    len(values), name, len(index))}
+
+        update_primitives(self.buffers, state, index)
+        if self.culler is not None and 'centers' in state:
+            self.culler.invalidate()
+        self.getApplication().InvokeEvent('UpdateEvent')
+        return {'updated': len(index)}
+
+
+class SimulationPlayback(vtk_protocols.vtkWebProtocol):
+    """Play, pause and seek the simulation given with --load-sims."""
+
+    def __init__(self):
+        super(SimulationPlayback, self).__init__()
+        self.player = None
+
+    def getState(self):
+        if self.player is None:
+            return {'error': 'No simulation loaded (--load-sims)'}
+        return self.player.state()
+
+    @exportRpc("sdf.sims.state")
+    def state(self):
+        return self.getState()
+
+    @exportRpc("sdf.sims.play")
+    def play(self, fps=None):
+        if self.player is not None:
+            if fps:
+                self.player.set_fps(fps)
+            self.player.play()
+        return self.getState()
+
+    @exportRpc("sdf.sims.pause")
+    def pause(self):
+        if self.player is not None:
+            self.player.pause()
+        return self.getState()
+
+    @exportRpc("sdf.sims.seek")
+    def seek(self, step):
+        if self.player is not None:
+            self.player.seek(step)
+        return self.getState()
+
+
 # =============================================================================
 # Server class
 # =============================================================================
@@ -412,33 +206,59 @@ class _Server(vtk_wslink.ServerProtocol):
     # Defaults
     authKey = "wslink-secret"
     view = None
+    centersToLoad = None
+    simsToLoad = None
+    cullGrid = 32
+    cullMinPixels = 1.
+    nPoints = 10000
+    distribution = 'uniform'
+    seed = 0
 
     @staticmethod
     def add_arguments(parser):
         parser.add_argument("--virtual-env", default=None,
                             help="Path to virtual environment to use")
         parser.add_argument("--data", default="/pvw/data", help="path to data directory to list, or else multiple directories given as 'name1=path1|name2=path2|...'", dest="path")
-        parser.add_argument("--load-centers", default=None, help="Centers File to load if any based on data-dir base path", dest="centers")
-        parser.add_argument("--load-sims", default=None, help="Simulations File to load if any based on data-dir base path", dest="sims")
+        parser.add_argument("--load-centers", default=None, help="Centers File to load if any based on data-dir base path (.json, .npy, .npz or .fwp)", dest="centers")
+        parser.add_argument("--load-sims", default=None, help="Simulation directory to load if any based on data-dir base path (one (steps, n, 3) .npy file per attribute: centers, colors, directions)", dest="sims")
+        parser.add_argument("--cull-grid", default=32, type=int, help="Cells per axis of the grid used to cull the primitives out of the view (0: no culling)", dest="cullGrid")
+        parser.add_argument("--cull-min-pixels", default=1., type=float, help="Do not draw the primitives smaller than this many pixels", dest="cullMinPixels")
+        parser.add_argument("--metrics-file", default=None, help="Prometheus textfile to periodically write the image delivery metrics to", dest="metricsFile")
 
     @staticmethod
     def configure(args):
         # Standard args
         _Server.authKey = args.authKey
         _Server.dataDir = args.path
+        _Server.metricsFile = args.metricsFile
+        _Server.cullGrid = args.cullGrid
+        _Server.cullMinPixels = args.cullMinPixels
+        _Server.nPoints = args.n_points
+        _Server.distribution = args.distribution
+        _Server.seed = args.seed
+        _Server.metricsLabels = {'app': 'sdf', 'port': args.port}
         if args.centers:
             _Server.centersToLoad = os.path.join(args.path, args.centers)
         if args.sims:
             _Server.simsToLoad = os.path.join(args.path, args.sims)
 
     def initialize(self):
+        startup.mark('initialize')
         # Bring used components
         self.registerVtkWebProtocol(vtk_protocols.vtkWebMouseHandler())
         self.registerVtkWebProtocol(vtk_protocols.vtkWebViewPort())
-        self.registerVtkWebProtocol(vtkWebPublishImageDelivery(decode=False))
+        imageDelivery = vtkWebPublishImageDelivery(
+            decode=False, metricsLabels=_Server.metricsLabels)
+        if _Server.metricsFile:
+            imageDelivery.startMetricsTextfile(_Server.metricsFile)
+        self.registerVtkWebProtocol(imageDelivery)
 
         # Custom API
         self.registerVtkWebProtocol(MouseWheel())
+        editor = PrimitiveEditor()
+        self.registerVtkWebProtocol(editor)
+        playback = SimulationPlayback()
+        self.registerVtkWebProtocol(playback)
 
         # tell the C++ web app to use no encoding.
         # ParaViewWebPublishImageDelivery must be set to decode=False to match.
@@ -451,30 +271,58 @@ class _Server(vtk_wslink.ServerProtocol):
             scene = window.Scene()
             scene.background((1, 1, 1))
 
-            if os.path.isfile(_Server.centersToLoad):
-                with open(_Server.centersToLoad) as f:
-                    f_dict = json.loads(f.read())
-                centers = np.array(f_dict["centers"])
-                n_points = len(centers)
-                colors = np.array(f_dict["colors"])
-                directions = np.random.rand(n_points, 3)
-            else:
-                n_points = 10000
-                translate = 100
-                centers = translate * np.random.rand(n_points, 3) - translate / 2
-                colors = 255 * np.random.rand(n_points, 3)
-
-                directions = np.random.rand(n_points, 3)
-            # scales = np.random.rand(n_points, 3)
-
-            prim_type = ['sphere', 'ellipsoid', 'torus']
-            primitive = [random.choice(prim_type) for _ in range(n_points)]
-
-            sdf_actor = actor.sdf(centers, directions,
-                                  colors, primitive)
+            loaded = {}
+            series = None
+            if _Server.simsToLoad and os.path.isdir(_Server.simsToLoad):
+                # The scene starts as the first step of the simulation
+                series = primitive_io.load_series(_Server.simsToLoad)
+                loaded = {name: np.array(array[0])
+                          for name, array in series.items()}
+            elif _Server.centersToLoad and \
+                    os.path.isfile(_Server.centersToLoad):
+                # .json, .npy, .npz or raw .fwp (see furyweb.primitive_io)
+                loaded = primitive_io.load_primitives(_Server.centersToLoad)
+
+            n_points = len(loaded["centers"]) if loaded else _Server.nPoints
+            # Generated attributes stand in for the ones not loaded
+            missing = [name for name in ("centers", "colors", "directions",
+                                         "primitives") if name not in loaded]
+            generated = generators.generate_points(
+                n_points, _Server.distribution, _Server.seed,
+                fields=missing) if missing else {}
+            centers = loaded.get("centers", generated.get("centers"))
+            colors = loaded.get("colors", generated.get("colors"))
+            directions = loaded.get("directions", generated.get("directions"))
+            codes = loaded.get("primitives", generated.get("primitives"))
+
+            sdf_actor = build_sdf_actor(centers, directions, colors, codes)
             scene.add(sdf_actor)
+
+            # Plain billboards stand in for the ray marched primitives while
+            # interacting
+            preview_actor = actor.billboard(centers, colors=colors)
+            scene.add(preview_actor)
+            imageDelivery.registerRenderStateHooks(
+                *lod_actor_hooks([sdf_actor], [preview_actor]))
             scene.add(actor.axes())
 
+            buffers = [PrimitiveBuffers(sdf_actor, n_points),
+                       PrimitiveBuffers(preview_actor, n_points)]
+            editor.buffers = buffers
+            editor.n_primitives = n_points
+
+            if series is not None:
+                application = self.getApplication()
+
+                def apply_step(step, state):
+                    update_primitives(buffers, state)
+                    if editor.culler is not None and 'centers' in state:
+                        editor.culler.invalidate()
+                    # Push the new step through the render scheduler
+                    application.InvokeEvent('UpdateEvent')
+
+                playback.player = SeriesPlayer(series, apply_step)
+
             showm = window.ShowManager(scene)
 
             renderWindow = showm.window
@@ -482,6 +330,22 @@ class _Server(vtk_wslink.ServerProtocol):
 
             self.getApplication().GetObjectIdMap().SetActiveObject("VIEW", renderWindow)
 
+            # Only draw the primitives in the view and larger than a pixel
+            if _Server.cullGrid:
+                viewMetrics = imageDelivery.metrics.view(
+                    str(imageDelivery.getGlobalId(renderWindow)))
+                editor.culler = InstanceCuller(
+                    [sdf_actor, preview_actor], n_points,
+                    grid_size=_Server.cullGrid,
+                    min_pixels=_Server.cullMinPixels,
+                    on_update=viewMetrics.set_gauges)
+                editor.culler.attach(scene)
+
+        startup.mark('initialized')
+        startup.watch_first_frame(
+            self.getApplication().GetObjectIdMap().GetActiveObject("VIEW"))
+        tracing.instrument(self)
+
 # =============================================================================
 # Main: Parse args and start serverviewId
 # =============================================================================
@@ -494,8 +358,11 @@ if __name__ == "__main__":
     # Add arguments
     server.add_arguments(parser)
     _Server.add_arguments(parser)
+    generators.add_arguments(parser)
+    tracing.add_arguments(parser)
     args = parser.parse_args()
     _Server.configure(args)
+    tracing.configure(args)
 
     # Start server
     server.start_webserver(options=args, protocol=_Server, disableLogging=True)
\ No newline at end of file
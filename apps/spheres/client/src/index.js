@@ -3,9 +3,13 @@ import "./styles.css";
 import vtkWSLinkClient from 'vtk.js/Sources/IO/Core/WSLinkClient';
 import vtkRemoteView from 'vtk.js/Sources/Rendering/Misc/RemoteView';
 import { connectImageStream } from 'vtk.js/Sources/Rendering/Misc/RemoteView';
+import vtkURLExtract from 'vtk.js/Sources/Common/Core/URLExtract';
 
 import SmartConnect from 'wslink/src/SmartConnect';
 
+import connectLocalRendering, { connectHybridRendering }
+  from '../../../common/client/localRendering';
+
 vtkWSLinkClient.setSmartConnectClass(SmartConnect);
 
 document.body.style.padding = '0';
@@ -29,21 +33,31 @@ divRenderer.appendChild(divLoading);
 divRenderer.appendChild(txtLoading);
 divRenderer.classList.add("parent");
 
-const view = vtkRemoteView.newInstance({
-  rpcWheelEvent: 'viewport.mouse.zoom.wheel',
-});
-view.setContainer(divRenderer);
-// Default of .5 causes 2x size labels on high-DPI screens.
-// 1 good for demo, not for production.
-if (location.hostname.split('.')[0] === 'localhost') {
-    view.setInteractiveRatio(1);
-} else {
-    // Scaled image compared to the clients view resolution
-    view.setInteractiveRatio(.75);
+function connectRemoteRendering(session) {
+  const view = vtkRemoteView.newInstance({
+    rpcWheelEvent: 'viewport.mouse.zoom.wheel',
+  });
+  view.setContainer(divRenderer);
+  // Default of .5 causes 2x size labels on high-DPI screens.
+  // 1 good for demo, not for production.
+  if (location.hostname.split('.')[0] === 'localhost') {
+      view.setInteractiveRatio(1);
+  } else {
+      // Scaled image compared to the clients view resolution
+      view.setInteractiveRatio(.75);
+  }
+  view.setInteractiveQuality(50); // jpeg quality
+
+  window.addEventListener('resize', view.resize);
+
+  view.setSession(session);
+  view.setViewId(-1);
+  view.render();
+  return () => {
+    window.removeEventListener('resize', view.resize);
+    view.delete();
+  };
 }
-view.setInteractiveQuality(50); // jpeg quality
-
-window.addEventListener('resize', view.resize);
 
 const clientToConnect = vtkWSLinkClient.newInstance();
 
@@ -69,22 +83,43 @@ clientToConnect.onConnectionClose((httpReq) => {
 
 // hint: if you use the launcher.py and ws-proxy just leave out sessionURL
 // (it will be provided by the launcher)
-const config = {
+const baseConfig = {
   application: 'spheres',
   //sessionURL: 'ws://localhost:1234/ws'
 };
+const userParams = vtkURLExtract.extractURLParameters();
+const config = Object.assign({}, baseConfig, userParams);
 
 // Connect
 clientToConnect
   .connect(config)
   .then((validClient) => {
-    connectImageStream(validClient.getConnection().getSession());
-
     const session = validClient.getConnection().getSession();
-    view.setSession(session);
-    view.setViewId(-1);
-    view.render();
-
+    if (userParams.local && userParams.local !== 'auto') {
+      // Draw the spheres in the browser, the server only sends the
+      // arrays of the instances when they change
+      return connectLocalRendering(session, divRenderer);
+    }
+
+    connectImageStream(session);
+
+    // Acknowledge every pushed frame so the server never queues more
+    // images than the connection can absorb
+    session.call('viewport.image.push.flow', [-1, true, 2]);
+    session.subscribe('viewport.image.push.subscription', ([frame]) => {
+      if (frame.frameId !== undefined) {
+        session.call('viewport.image.push.ack', [frame.id, frame.frameId]);
+      }
+    });
+
+    if (userParams.local === 'auto') {
+      // The server picks images or local rendering from the scene size
+      return connectHybridRendering(session, divRenderer,
+        connectRemoteRendering);
+    }
+    return connectRemoteRendering(session);
+  })
+  .then(() => {
     divRenderer.removeChild(divLoading);
     divRenderer.removeChild(txtLoading);
     divRenderer.classList.remove("parent");
@@ -4,6 +4,17 @@ from wslink import register
 
 class FuryProtocol(protocols.vtkWebProtocol):
 
+    def __init__(self, update_spheres=None):
+        super(FuryProtocol, self).__init__()
+        self.update_spheres = update_spheres
+
+    @register("fury.spheres.update")
+    def update(self, indices, centers=None, colors=None):
+        """Move or recolor spheres, returns the number of updated actors."""
+        updated = self.update_spheres(indices, centers=centers, colors=colors)
+        self.getApplication().InvokeEvent('UpdateEvent')
+        return updated
+
     @register("viewport.mouse.zoom.wheel")
     def update_zoom_from_wheel(self, event):
         if 'Start' in event['type']:
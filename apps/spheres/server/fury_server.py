@@ -30,17 +30,39 @@ from wslink import server
 
 
 import argparse
-import numpy as np
+import os
+import sys
 import vtk
 
+# Shared fury-web server modules live at the root of the repository
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                             os.pardir, os.pardir, os.pardir)))
+from furyweb import generators, startup, tracing
+from furyweb.chunked import ChunkedScene
+from furyweb.culling import InstanceCuller
+from furyweb.delivery_policy import DeliveryPolicy
+from furyweb.geometry_delivery import FuryGeometryDelivery
+from furyweb.image_delivery import vtkWebPublishImageDelivery
+from furyweb.primitive_buffers import PrimitiveBuffers
+
 
 class _WebSpheres(vtk_wslink.ServerProtocol):
 
     # Application configuration
     authKey = 'wslink-secret'
     view = None
+    update_spheres = None
+    metrics_file = None
+    metrics_labels = {'app': 'spheres'}
+    cull_grid = 32
+    cull_min_pixels = 1.
+    n_points = 10000
+    distribution = 'uniform'
+    seed = 0
+    chunk_size = 0
 
     def initialize(self):
+        startup.mark('initialize')
         # Bring used components
         self.registerVtkWebProtocol(protocols.vtkWebMouseHandler())
         self.registerVtkWebProtocol(protocols.vtkWebViewPort())
@@ -49,16 +71,22 @@ class _WebSpheres(vtk_wslink.ServerProtocol):
         #self.registerVtkWebProtocol(protocols.vtkWebViewPortImageDelivery())
         # 2. Improvement on the initial protocol to allow images to be pushed
         # from the server without any client request (i.e.: animation, LOD, …)
-        self.registerVtkWebProtocol(protocols.vtkWebPublishImageDelivery(
-            decode=False))
+        image_delivery = vtkWebPublishImageDelivery(
+            decode=False, metricsLabels=_WebSpheres.metrics_labels)
+        if _WebSpheres.metrics_file:
+            image_delivery.startMetricsTextfile(_WebSpheres.metrics_file)
+        self.registerVtkWebProtocol(image_delivery)
         # Protocol for sending geometry for the vtk.js synchronized render
         # window
         # For local rendering using vtk.js
         #self.registerVtkWebProtocol(protocols.vtkWebViewPortGeometryDelivery())
         #self.registerVtkWebProtocol(protocols.vtkWebLocalRendering())
 
-        # Custom API
-        self.registerVtkWebProtocol(FuryProtocol())
+        # Client-side rendering of the spheres
+        geometry = FuryGeometryDelivery()
+        self.registerVtkWebProtocol(geometry)
+        # Images or geometry for the clients rendering locally when cheaper
+        self.registerVtkWebProtocol(DeliveryPolicy(image_delivery, geometry))
 
         # Tell the C++ web app to use no encoding.
         # ParaViewWebPublishImageDelivery must be set to decode=False to match.
@@ -74,11 +102,13 @@ class _WebSpheres(vtk_wslink.ServerProtocol):
             scene = window.Scene()
             scene.background((1, 1, 1))
 
-            n_points = 10000
-            translate = 100
-            centers = translate * np.random.rand(n_points, 3) - translate / 2
-            colors = 255 * np.random.rand(n_points, 3)
-            radius = np.random.rand(n_points)
+            n_points = _WebSpheres.n_points
+            points = generators.generate_points(
+                n_points, _WebSpheres.distribution, _WebSpheres.seed,
+                fields=('centers', 'colors', 'scales'))
+            centers = points['centers']
+            colors = points['colors']
+            radius = points['scales']
             fake_sphere = \
                 """
                 float len = length(point);
@@ -92,10 +122,26 @@ class _WebSpheres(vtk_wslink.ServerProtocol):
                 float sf_1 = pow(df_1, 24);
                 fragOutput0 = vec4(max(df_1 * color, sf_1 * vec3(1)), 1);
                 """
-            spheres_actor = actor.billboard(centers, colors=colors,
-                                            scales=radius, fs_impl=fake_sphere)
 
-            scene.add(spheres_actor)
+            def build_actor(centers, colors, scales):
+                return actor.billboard(centers, colors=colors, scales=scales,
+                                       fs_impl=fake_sphere)
+
+            chunks = None
+            if _WebSpheres.chunk_size:
+                # One actor per block of neighbouring spheres
+                chunks = ChunkedScene.from_arrays(
+                    build_actor, centers, colors, radius,
+                    chunk_size=_WebSpheres.chunk_size,
+                    min_pixels=_WebSpheres.cull_min_pixels)
+                chunks.add_to_scene(scene)
+                for i, chunk in enumerate(chunks.chunks):
+                    geometry.add_actor('spheres-%d' % i, chunk['actor'],
+                                       len(chunk['index']))
+            else:
+                spheres_actor = build_actor(centers, colors, radius)
+                scene.add(spheres_actor)
+                geometry.add_actor('spheres', spheres_actor, n_points)
             scene.add(actor.axes())
 
             showm = window.ShowManager(scene)
@@ -115,6 +161,45 @@ class _WebSpheres(vtk_wslink.ServerProtocol):
             self.getApplication().GetObjectIdMap().SetActiveObject(
                 'VIEW', ren_win)
 
+            # Only draw the spheres in the view and larger than a pixel
+            view_metrics = image_delivery.metrics.view(
+                str(image_delivery.getGlobalId(ren_win)))
+            if chunks is not None:
+                chunks.on_update = view_metrics.set_gauges
+                chunks.attach(scene)
+            elif _WebSpheres.cull_grid:
+                culler = InstanceCuller(
+                    [spheres_actor], n_points,
+                    grid_size=_WebSpheres.cull_grid,
+                    min_pixels=_WebSpheres.cull_min_pixels,
+                    on_update=view_metrics.set_gauges)
+                culler.attach(scene)
+
+            if chunks is not None:
+                _WebSpheres.update_spheres = chunks.update
+            else:
+                buffers = PrimitiveBuffers(spheres_actor, n_points)
+
+                def update_spheres(index, centers=None, colors=None):
+                    if centers is not None:
+                        buffers.set_centers(centers, index)
+                        if _WebSpheres.cull_grid:
+                            culler.invalidate()
+                    if colors is not None:
+                        buffers.set_colors(colors, index)
+                    return 1
+
+                _WebSpheres.update_spheres = update_spheres
+
+        # Custom API
+        self.registerVtkWebProtocol(
+            FuryProtocol(update_spheres=_WebSpheres.update_spheres))
+
+        startup.mark('initialized')
+        startup.watch_first_frame(
+            self.getApplication().GetObjectIdMap().GetActiveObject("VIEW"))
+        tracing.instrument(self)
+
 
 # =============================================================================
 # Main: Parse args and start server
@@ -127,12 +212,39 @@ if __name__ == "__main__":
 
     # Add default arguments
     server.add_arguments(parser)
+    parser.add_argument("--metrics-file", default=None, dest="metrics_file",
+                        help="Prometheus textfile to periodically write the "
+                             "image delivery metrics to.")
+    parser.add_argument("--cull-grid", default=32, type=int,
+                        dest="cull_grid",
+                        help="Cells per axis of the grid used to cull the "
+                             "spheres out of the view (0: no culling).")
+    parser.add_argument("--cull-min-pixels", default=1., type=float,
+                        dest="cull_min_pixels",
+                        help="Do not draw the spheres smaller than this "
+                             "many pixels.")
+    parser.add_argument("--chunk-size", default=0, type=int,
+                        dest="chunk_size",
+                        help="Spheres per actor, split in blocks of "
+                             "neighbouring spheres culled as a whole (0: a "
+                             "single actor).")
+    generators.add_arguments(parser)
+    tracing.add_arguments(parser)
 
     # Extract arguments
     args = parser.parse_args()
+    tracing.configure(args)
 
     # Configure our current application
     _WebSpheres.authKey = args.authKey
+    _WebSpheres.metrics_file = args.metrics_file
+    _WebSpheres.cull_grid = args.cull_grid
+    _WebSpheres.cull_min_pixels = args.cull_min_pixels
+    _WebSpheres.n_points = args.n_points
+    _WebSpheres.distribution = args.distribution
+    _WebSpheres.seed = args.seed
+    _WebSpheres.chunk_size = args.chunk_size
+    _WebSpheres.metrics_labels['port'] = args.port
 
     # Start server
     server.start_webserver(options=args, protocol=_WebSpheres)
@@ -7,6 +7,9 @@ import { connectImageStream } from 'vtk.js/Sources/Rendering/Misc/RemoteView';
 
 import SmartConnect from 'wslink/src/SmartConnect';
 
+import { connectHybridRendering }
+  from '../../../common/client/localRendering';
+
 vtkWSLinkClient.setSmartConnectClass(SmartConnect);
 
 document.body.style.padding = '0';
@@ -30,14 +33,24 @@ divRenderer.appendChild(divLoading);
 divRenderer.appendChild(txtLoading);
 divRenderer.classList.add("parent");
 
-const view = vtkRemoteView.newInstance({
-  rpcWheelEvent: 'viewport.mouse.zoom.wheel',
-});
-view.setContainer(divRenderer);
-view.setInteractiveRatio(1);
-view.setInteractiveQuality(50); // jpeg quality
-
-window.addEventListener('resize', view.resize);
+function connectRemoteRendering(session) {
+  const view = vtkRemoteView.newInstance({
+    rpcWheelEvent: 'viewport.mouse.zoom.wheel',
+  });
+  view.setContainer(divRenderer);
+  view.setInteractiveRatio(1);
+  view.setInteractiveQuality(50); // jpeg quality
+
+  window.addEventListener('resize', view.resize);
+
+  view.setSession(session);
+  view.setViewId(-1);
+  view.render();
+  return () => {
+    window.removeEventListener('resize', view.resize);
+    view.delete();
+  };
+}
 
 const clientToConnect = vtkWSLinkClient.newInstance();
 
@@ -87,9 +100,26 @@ clientToConnect
     connectImageStream(validClient.getConnection().getSession());
 
     const session = validClient.getConnection().getSession();
-    view.setSession(session);
-    view.setViewId(-1);
-    view.render();
+
+    // Acknowledge every pushed frame so the server never queues more
+    // images than the connection can absorb
+    session.call('viewport.image.push.flow', [-1, true, 2]);
+    session.subscribe('viewport.image.push.subscription', ([frame]) => {
+      if (frame.frameId !== undefined) {
+        session.call('viewport.image.push.ack', [frame.id, frame.frameId]);
+      }
+    });
+
+    let connected;
+    if (userParams.local === 'auto') {
+      // The server picks images or local rendering from the number of
+      // cells of each frame. The sliders are drawn in the server images,
+      // they are not shown while rendering locally.
+      connected = connectHybridRendering(session, divRenderer,
+        connectRemoteRendering, { background: [0, 0, 0] });
+    } else {
+      connected = Promise.resolve(connectRemoteRendering(session));
+    }
 
     session.call('tumor.initialize', []);
     // session.call('tumor.update_view', ['{"folder": "/pvw/apps/tumor/server", "filename": "output00000246.xml"}',]);
@@ -116,6 +146,9 @@ clientToConnect
       }
     });
 
+    return connected;
+  })
+  .then(() => {
     divRenderer.removeChild(divLoading);
     divRenderer.removeChild(txtLoading);
     divRenderer.classList.remove("parent");
@@ -252,6 +252,8 @@ class TumorProtocol(protocols.vtkWebProtocol):
                                    self.vtk_shader_callback)
 
         scene.add(self.spheres_actor)
+        self.getSharedObject('GEOMETRY').add_actor(
+            'cells', self.spheres_actor, len(centers))
 
         self.min_centers = np.min(centers, axis=0)
         self.max_centers = np.max(centers, axis=0)
@@ -262,6 +264,9 @@ class TumorProtocol(protocols.vtkWebProtocol):
                                      for i, v in enumerate(self.high_perc)])
         self.connect_sliders()
         scene.ResetCamera()
+        # New arrays for the local renderers, the delivery policy checks the
+        # new number of cells
+        self.getApplication().InvokeEvent('UpdateEvent')
 
     def disconnect_sliders(self):
         self.slider_clipping_plane_thrs_x.on_change = lambda slider: None
@@ -30,6 +30,17 @@ from wslink import server
 
 
 import argparse
+import os
+import sys
+
+# Shared fury-web server modules live at the root of the repository
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                             os.pardir, os.pardir, os.pardir)))
+from furyweb import startup, tracing
+from furyweb.delivery_policy import DeliveryPolicy
+from furyweb.geometry_delivery import FuryGeometryDelivery
+from furyweb.image_delivery import vtkWebPublishImageDelivery
+from furyweb.render_state import depth_peeling_hooks
 
 
 def boolean_string(s):
@@ -51,6 +62,10 @@ class _WebTumor(vtk_wslink.ServerProtocol):
         parser.add_argument("--load-default", default=False,
                             type=boolean_string, dest="demodata",
                             help="add some default data as an example.")
+        parser.add_argument("--metrics-file", default=None,
+                            dest="metrics_file",
+                            help="Prometheus textfile to periodically write "
+                                 "the image delivery metrics to.")
 
     @staticmethod
     def configure(args):
@@ -58,11 +73,14 @@ class _WebTumor(vtk_wslink.ServerProtocol):
         _WebTumor.authKey = args.authKey
         # does not work. Ask why
         _WebTumor.load_default = args.demodata
+        _WebTumor.metrics_file = args.metrics_file
+        _WebTumor.metrics_labels = {'app': 'tumor', 'port': args.port}
 
         print(args.demodata)
         print(args)
 
     def initialize(self):
+        startup.mark('initialize')
         # Bring used components
         self.registerVtkWebProtocol(protocols.vtkWebMouseHandler())
         self.registerVtkWebProtocol(protocols.vtkWebViewPort())
@@ -71,14 +89,27 @@ class _WebTumor(vtk_wslink.ServerProtocol):
         #self.registerVtkWebProtocol(protocols.vtkWebViewPortImageDelivery())
         # 2. Improvement on the initial protocol to allow images to be pushed
         # from the server without any client request (i.e.: animation, LOD, …)
-        self.registerVtkWebProtocol(protocols.vtkWebPublishImageDelivery(
-            decode=False))
+        image_delivery = vtkWebPublishImageDelivery(
+            decode=False, metricsLabels=_WebTumor.metrics_labels)
+        if _WebTumor.metrics_file:
+            image_delivery.startMetricsTextfile(_WebTumor.metrics_file)
+        # Transparency ordering is only done on the idle refinement frame
+        image_delivery.registerRenderStateHooks(*depth_peeling_hooks())
+        self.registerVtkWebProtocol(image_delivery)
         # Protocol for sending geometry for the vtk.js synchronized render
         # window
         # For local rendering using vtk.js
         #self.registerVtkWebProtocol(protocols.vtkWebViewPortGeometryDelivery())
         #self.registerVtkWebProtocol(protocols.vtkWebLocalRendering())
 
+        # Client-side rendering of the cells, picked by the delivery policy
+        # for the clients registered to it (?local=auto), from the size of
+        # each frame
+        geometry = FuryGeometryDelivery()
+        self.registerVtkWebProtocol(geometry)
+        self.registerVtkWebProtocol(DeliveryPolicy(image_delivery, geometry))
+        self.setSharedObject("GEOMETRY", geometry)
+
         # Custom API
         self.registerVtkWebProtocol(FuryProtocol())
         self.registerVtkWebProtocol(TumorProtocol(load_default=_WebTumor.load_default))
@@ -113,6 +144,11 @@ class _WebTumor(vtk_wslink.ServerProtocol):
             # self.getApplication().GetObjectIdMap().SetActiveObject(
             #     'SHOWM', show_m)
 
+        startup.mark('initialized')
+        startup.watch_first_frame(
+            self.getApplication().GetObjectIdMap().GetActiveObject("VIEW"))
+        tracing.instrument(self)
+
 
 # =============================================================================
 # Main: Parse args and start server
@@ -126,10 +162,12 @@ if __name__ == "__main__":
     # Add default arguments
     server.add_arguments(parser)
     _WebTumor.add_arguments(parser)
+    tracing.add_arguments(parser)
     # Extract arguments
     args = parser.parse_args()
     # Configure our current application
     _WebTumor.configure(args)
+    tracing.configure(args)
 
     # Start server
     server.start_webserver(options=args, protocol=_WebTumor)
@@ -1,12 +1,56 @@
 import xml.etree.ElementTree as ET
 import numpy as np
 import os
-import pandas as pd
-import scipy.io as sio
 import sys
 import warnings
 from pathlib import Path
 
+# MATLAB level 4 precisions (the P digit of the type), as numpy types
+_MAT4_DTYPES = {0: 'f8', 1: 'f4', 2: 'i4', 3: 'i2', 4: 'u2', 5: 'u1'}
+
+
+def load_mat_matrix(path, name):
+    """Read a numeric matrix of a MATLAB level 4 file.
+
+    BioFVM writes the PhysiCell cells as a level 4 file: for every matrix, a
+    header of five int32 (type, rows, columns, imaginary flag and name
+    length), the name and the values in column-major order. They are read
+    straight from the file, importing scipy.io costs more than reading a
+    frame. Anything else (level 5 files, complex matrices, ...) is read by
+    ``scipy.io.loadmat``.
+    """
+    with open(path, 'rb') as f:
+        while True:
+            header = f.read(20)
+            if len(header) < 20:
+                break
+            fields = np.frombuffer(header, dtype='<i4')
+            if not 0 <= fields[0] < 2000:
+                # Written by a big endian machine
+                fields = np.frombuffer(header, dtype='>i4')
+            mopt, rows, cols, imagf, namlen = (int(v) for v in fields)
+            machine, zero, precision, kind = \
+                mopt // 1000, mopt // 100 % 10, mopt // 10 % 10, mopt % 10
+            if machine > 1 or zero or precision not in _MAT4_DTYPES or \
+                    rows < 0 or cols < 0 or namlen <= 0:
+                break
+            dtype = np.dtype(('<' if machine == 0 else '>') +
+                             _MAT4_DTYPES[precision])
+            matrix_name = f.read(namlen).rstrip(b'\0').decode('latin-1')
+            count = rows * cols
+            if matrix_name == name:
+                if kind == 0 and not imagf:
+                    values = np.fromfile(f, dtype=dtype, count=count)
+                    if len(values) == count:
+                        return values.reshape((rows, cols), order='F')
+                break
+            f.seek(count * dtype.itemsize * (2 if imagf else 1), os.SEEK_CUR)
+
+    import scipy.io as sio
+
+    return sio.loadmat(path)[name]
+
+
 class pyMCDS_cells:
     """
     This class contains a dictionary of dictionaries that contains all of the 
@@ -262,6 +306,9 @@ class pyMCDS_cells:
         cells_df : pd.Dataframe, shape=[n_cells, n_variables]
             Dataframe containing the cell data for all cells at this time step
         """
+        # pandas is slow to import and not needed to render the cells
+        import pandas as pd
+
         cells_df = pd.DataFrame(self.data['discrete_cells'])
         return cells_df
     
@@ -492,7 +539,7 @@ class pyMCDS_cells:
         cell_file = cell_node.find('filename').text
         cell_path = os.path.join(output_path, cell_file)
         try:
-            cell_data = sio.loadmat(cell_path)['cells']
+            cell_data = load_mat_matrix(cell_path, 'cells')
         except:
             raise FileNotFoundError(
                 "No such file or directory:\n'{}' referenced in '{}'".format(cell_path, xml_file))
@@ -0,0 +1,12 @@
+"""Benchmarks of the FURY/Web application servers.
+
+The scripts of this package start the servers of ``apps/*/server`` and drive
+them with a headless wslink client, the same way the browser clients do. They
+are run from the root of the repository, for example::
+
+    $ python -m benchmarks.bench_apps --apps sdf tumor --output results.json
+
+They only need ``websockets`` on the client side (see
+``benchmarks/requirements.txt``); the servers themselves are started with
+``pvpython`` (or the interpreter given with ``--python``).
+"""
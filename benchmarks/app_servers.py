@@ -0,0 +1,157 @@
+"""Start the application servers locally for benchmarking.
+
+Each server runs in its own process, like under the launcher, with the
+environment forcing Mesa software rendering so that the benchmarks also run
+on CPU-only Linux hosts (the ``pvw-v5.7.1-osmesa`` images render offscreen
+already; ``--xvfb`` helps with VTK builds that need an X display).
+"""
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import time
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                        os.pardir))
+
+# delivery: 'push' for the servers publishing images through
+# furyweb.image_delivery, 'render' for the ones answering
+# viewport.image.render requests (vtkWebViewPortImageDelivery).
+APPS = {
+    'sdf': {'script': 'apps/sdf/server/vtk_server.py',
+            'args': ['--data', os.path.join(ROOT_DIR, 'data')],
+            'delivery': 'push',
+            'wheel': True},
+    'spheres': {'script': 'apps/spheres/server/fury_server.py',
+                'args': [],
+                'delivery': 'push',
+                'wheel': True},
+    'tumor': {'script': 'apps/tumor/server/fury_server.py',
+              'args': ['--load-default', 'true'],
+              'delivery': 'push',
+              'wheel': True},
+    'fury': {'script': 'apps/fury/server/fury_server.py',
+             'args': [],
+             'delivery': 'render',
+             'wheel': False},
+    'demo': {'script': 'apps/demo/server/vtk_server.py',
+             'args': [],
+             'delivery': 'render',
+             'wheel': False},
+}
+
+
+def default_python():
+    """pvpython when available, like the launcher, else this interpreter."""
+    return os.environ.get('PVPYTHON') or shutil.which('pvpython') or \
+        sys.executable
+
+
+def offscreen_env():
+    env = dict(os.environ)
+    env.setdefault('LIBGL_ALWAYS_SOFTWARE', '1')
+    env.setdefault('GALLIUM_DRIVER', 'llvmpipe')
+    env.setdefault('VTK_DEFAULT_OPENGL_WINDOW', 'vtkOSOpenGLRenderWindow')
+    env.setdefault('PYTHONUNBUFFERED', '1')
+    return env
+
+
+def free_port():
+    sock = socket.socket()
+    sock.bind(('localhost', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+class ServerProcess(object):
+    """An application server started on a local port.
+
+    Parameters
+    ----------
+    app : str
+        Name of the application, one of ``APPS``.
+    port : int, optional
+        Port to listen on (default: a free port).
+    python : str, optional
+        Interpreter used to run the server script.
+    secret : str, optional
+        Authentication key.
+    extra_args : list of str, optional
+        Additional server arguments (e.g. ``['--trace-rpc']``).
+    log_path : str, optional
+        File receiving the server output (default: discarded).
+    xvfb : bool, optional
+        Run the server under ``xvfb-run``.
+    profile_startup : bool, optional
+        Run the server through ``furyweb/startup.py``, which writes its
+        startup profile to the log once the first frame is rendered.
+    """
+
+    def __init__(self, app, port=None, python=None, secret='wslink-secret',
+                 extra_args=None, log_path=None, xvfb=False,
+                 profile_startup=False):
+        self.app = app
+        self.port = port or free_port()
+        self.secret = secret
+        self.log_path = log_path
+        config = APPS[app]
+        self.cmd = [python or default_python()]
+        if profile_startup:
+            self.cmd.append(os.path.join(ROOT_DIR, 'furyweb', 'startup.py'))
+        self.cmd += [os.path.join(ROOT_DIR, config['script']),
+                     '--port', str(self.port),
+                     '--authKey', secret] + config['args'] + \
+            list(extra_args or [])
+        if xvfb:
+            self.cmd = ['xvfb-run', '-a'] + self.cmd
+        self.process = None
+        self.startup_time = None
+        self.start_time = None
+
+    @property
+    def url(self):
+        return 'ws://localhost:{0}/ws'.format(self.port)
+
+    def start(self, timeout=60.):
+        """Start the server and wait until it accepts connections."""
+        log = open(self.log_path, 'w') if self.log_path else \
+            subprocess.DEVNULL
+        self.start_time = time.time()
+        self.process = subprocess.Popen(self.cmd, stdout=log,
+                                        stderr=subprocess.STDOUT,
+                                        env=offscreen_env(), cwd=ROOT_DIR)
+        if self.log_path:
+            log.close()
+
+        # The sdf server disables logging, so the launcher " Starting
+        # factory" ready line can not be relied on: wait for the port.
+        while time.time() - self.start_time < timeout:
+            if self.process.poll() is not None:
+                raise RuntimeError('{0} server exited with code {1}'.format(
+                    self.app, self.process.returncode))
+            try:
+                socket.create_connection(('localhost', self.port), .5).close()
+            except OSError:
+                time.sleep(.1)
+                continue
+            self.startup_time = time.time() - self.start_time
+            return self
+        self.stop()
+        raise RuntimeError('{0} server did not start within {1}s'.format(
+            self.app, timeout))
+
+    @property
+    def pid(self):
+        return self.process.pid if self.process else None
+
+    def stop(self):
+        if self.process is None or self.process.poll() is not None:
+            return
+        self.process.terminate()
+        try:
+            self.process.wait(10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
@@ -0,0 +1,168 @@
+r"""
+Benchmark every application server with a scripted headless client.
+
+For each application the server is started on a local port, a client
+connects, waits for the first image, replays an orbit and zoom sequence and,
+for the tumor application, scrubs through the simulation frames. The results
+are printed (or written) as JSON::
+
+    $ python -m benchmarks.bench_apps --apps sdf spheres tumor fury demo \
+        --python /opt/paraview/bin/pvpython --output bench.json
+
+Reported for each application:
+
+- ``startupSeconds``: process start until the port accepts connections,
+- ``timeToFirstImageSeconds``: connection until the first image,
+- ``interaction``: frames per second, bytes per second and p50/p99
+  input-to-image latency while replaying the sequence,
+- ``scrub`` (tumor): the same while loading frames,
+- ``server``: the ``viewport.metrics.get`` metrics, for the servers that
+  publish their images.
+"""
+import argparse
+import asyncio
+import glob
+import json
+import os
+import platform
+import sys
+import time
+
+from benchmarks import sequences
+from benchmarks.app_servers import APPS, ROOT_DIR, ServerProcess
+from benchmarks.session import InteractionSession
+
+
+def tumor_frames(folder, count):
+    files = sorted(os.path.basename(path) for path in
+                   glob.glob(os.path.join(folder, 'output*.xml')))
+    if not files:
+        return []
+    return [{'folder': folder, 'filename': files[i % len(files)]}
+            for i in range(count)]
+
+
+async def run_session(app, url, secret='wslink-secret', events=None,
+                      size=(800, 600), frames=None, scrub_interval=.5,
+                      first_image_timeout=60.):
+    """Run the scripted interaction against a running server.
+
+    Returns the dict of client side (and server side, if available)
+    measurements of the session.
+    """
+    config = APPS[app]
+    if events is None:
+        events = sequences.default_sequence(use_wheel=config['wheel'])
+    session = InteractionSession(url, secret, delivery=config['delivery'],
+                                 size=size)
+    await session.start()
+    try:
+        if app == 'tumor':
+            await session.client.call('tumor.initialize')
+        result = {'timeToFirstImageSeconds':
+                  await session.wait_first_image(first_image_timeout)}
+
+        start = time.time()
+        await session.replay(events)
+        # Let the last images of the interaction arrive
+        await asyncio.sleep(.5)
+        result['interaction'] = session.summary(start, time.time())
+
+        if frames:
+            session.latency.clear()
+            start = time.time()
+            await session.scrub(frames, scrub_interval)
+            result['scrub'] = session.summary(start, time.time())
+
+        result['bytesReceived'] = session.client.bytes_received
+        result['server'] = await session.metrics()
+    finally:
+        await session.close()
+    return result
+
+
+def bench_app(app, args, events):
+    log_path = os.path.join(args.log_dir, '{0}.log'.format(app)) \
+        if args.log_dir else None
+    server = ServerProcess(app, python=args.python, log_path=log_path,
+                           xvfb=args.xvfb,
+                           profile_startup=args.profile_startup)
+    result = {}
+    try:
+        server.start(args.startup_timeout)
+        result['startupSeconds'] = server.startup_time
+        frames = tumor_frames(args.tumor_frames, args.scrub_count) \
+            if app == 'tumor' else None
+        loop = asyncio.new_event_loop()
+        try:
+            result.update(loop.run_until_complete(run_session(
+                app, server.url, server.secret, events,
+                size=(args.width, args.height), frames=frames)))
+        finally:
+            loop.close()
+    except Exception as e:
+        result['error'] = repr(e)
+    finally:
+        server.stop()
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--apps', nargs='+', default=sorted(APPS),
+                        choices=sorted(APPS))
+    parser.add_argument('--python', default=None,
+                        help='interpreter running the servers (default: '
+                             '$PVPYTHON, pvpython or this interpreter).')
+    parser.add_argument('--sequence', default=None,
+                        help='recorded input sequence (JSON) to replay '
+                             'instead of the default orbit and zoom.')
+    parser.add_argument('--save-sequence', default=None,
+                        help='write the default sequence to this file.')
+    parser.add_argument('--tumor-frames',
+                        default=os.path.join(ROOT_DIR, 'apps', 'tumor',
+                                             'server'),
+                        help='folder of PhysiCell output*.xml files to '
+                             'scrub through.')
+    parser.add_argument('--scrub-count', type=int, default=10)
+    parser.add_argument('--width', type=int, default=800)
+    parser.add_argument('--height', type=int, default=600)
+    parser.add_argument('--startup-timeout', type=float, default=120.)
+    parser.add_argument('--log-dir', default=None,
+                        help='keep the server logs in this directory.')
+    parser.add_argument('--xvfb', action='store_true',
+                        help='run the servers under xvfb-run.')
+    parser.add_argument('--profile-startup', action='store_true',
+                        help='write the startup profile of each server to '
+                             'its log (see --log-dir).')
+    parser.add_argument('--output', default=None,
+                        help='JSON file to write (default: stdout).')
+    args = parser.parse_args(argv)
+
+    if args.save_sequence:
+        sequences.save_sequence(sequences.default_sequence(),
+                                args.save_sequence)
+    events = sequences.load_sequence(args.sequence) if args.sequence \
+        else None
+    if args.log_dir and not os.path.isdir(args.log_dir):
+        os.makedirs(args.log_dir)
+
+    results = {'host': {'platform': platform.platform(),
+                        'processor': platform.processor(),
+                        'cpus': os.cpu_count()},
+               'timestamp': time.time(),
+               'apps': {}}
+    for app in args.apps:
+        print('Benchmarking {0}...'.format(app), file=sys.stderr)
+        results['apps'][app] = bench_app(app, args, events)
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+r"""
+Benchmark the scaling of chunked billboard scenes with the number of points.
+
+For each ``--points`` count, the scene of the spheres application is built
+once as a single actor and once per ``--chunk-sizes`` value through
+``furyweb.chunked.ChunkedScene``, then rendered offscreen from an overview
+and from a close-up orbiting a little at every frame::
+
+    $ pvpython -m benchmarks.bench_chunks --points 1000000 10000000 \
+        --chunk-sizes 100000 1000000 --output chunks.json
+
+Reported for each scene: the build time, the growth of the peak resident
+memory, the p50/p99 frame times in milliseconds of both views, and the time
+to move ``--updates`` random points.
+"""
+import argparse
+import json
+import platform
+import resource
+import sys
+import time
+
+import numpy as np
+import vtk
+from fury import actor, window
+
+from furyweb import generators
+from furyweb.chunked import ChunkedScene
+from furyweb.metrics import Histogram
+from furyweb.primitive_buffers import PrimitiveBuffers
+
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.
+
+
+def build_actor(centers, colors, scales):
+    return actor.billboard(centers, colors=colors, scales=scales)
+
+
+def render_frames(scene, render_window, frames, zoom):
+    scene.ResetCamera()
+    scene.GetActiveCamera().Zoom(zoom)
+    render_window.Render()
+    histogram = Histogram(window=frames)
+    for _ in range(frames):
+        scene.GetActiveCamera().Azimuth(.5)
+        start = time.perf_counter()
+        render_window.Render()
+        histogram.observe(time.perf_counter() - start)
+    return {'p50Ms': round(histogram.percentile(50) * 1000, 3),
+            'p99Ms': round(histogram.percentile(99) * 1000, 3)}
+
+
+def bench_scene(n_points, chunk_size, frames=20, zoom=8., updates=1000,
+                size=(800, 600), distribution='uniform', seed=0):
+    points = generators.generate_points(
+        n_points, distribution, seed, fields=('centers', 'colors', 'scales'))
+    centers, colors, radius = \
+        points['centers'], points['colors'], points['scales']
+    rss = peak_rss_mb()
+    start = time.perf_counter()
+    scene = window.Scene()
+    if chunk_size:
+        chunks = ChunkedScene.from_arrays(build_actor, centers, colors,
+                                          radius, chunk_size=chunk_size)
+        chunks.add_to_scene(scene)
+        chunks.attach(scene)
+    else:
+        spheres_actor = build_actor(centers, colors, radius)
+        scene.add(spheres_actor)
+    result = {'buildMs': round((time.perf_counter() - start) * 1000, 3),
+              'peakRssGrowthMb': round(peak_rss_mb() - rss, 1)}
+
+    render_window = vtk.vtkRenderWindow()
+    render_window.SetOffScreenRendering(1)
+    render_window.SetSize(*size)
+    render_window.AddRenderer(scene)
+    result['overview'] = render_frames(scene, render_window, frames, 1.)
+    result['closeUp'] = render_frames(scene, render_window, frames, zoom)
+    if chunk_size:
+        result['chunks'] = chunks.stats['chunks']
+        result['visibleChunks'] = chunks.stats['visibleChunks']
+        result['drawnInstances'] = chunks.stats['drawnInstances']
+
+    rng = np.random.RandomState(seed + 1)
+    index = rng.choice(n_points, min(updates, n_points), replace=False)
+    moved = centers[index] + rng.rand(len(index), 3).astype(np.float32)
+    start = time.perf_counter()
+    if chunk_size:
+        result['updatedChunks'] = chunks.update(index, centers=moved)
+    else:
+        PrimitiveBuffers(spheres_actor, n_points).set_centers(moved, index)
+    render_window.Render()
+    result['updateMs'] = round((time.perf_counter() - start) * 1000, 3)
+    render_window.Finalize()
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--points', type=int, nargs='+',
+                        default=[100000, 1000000, 10000000])
+    parser.add_argument('--chunk-sizes', type=int, nargs='+',
+                        default=[100000, 1000000],
+                        help='points per chunk of the chunked scenes.')
+    parser.add_argument('--frames', type=int, default=20)
+    parser.add_argument('--zoom', type=float, default=8.,
+                        help='camera zoom factor of the close-up view.')
+    parser.add_argument('--updates', type=int, default=1000,
+                        help='number of points moved by the update test.')
+    parser.add_argument('--distribution', default='uniform',
+                        choices=generators.DISTRIBUTIONS)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default=None,
+                        help='JSON file to write (default: stdout).')
+    args = parser.parse_args(argv)
+
+    scenes = []
+    for n_points in args.points:
+        for chunk_size in [0] + args.chunk_sizes:
+            if chunk_size >= n_points:
+                continue
+            print('Rendering {0} points in chunks of {1}...'.format(
+                n_points, chunk_size or n_points), file=sys.stderr)
+            result = bench_scene(n_points, chunk_size, args.frames, args.zoom,
+                                 args.updates, distribution=args.distribution,
+                                 seed=args.seed)
+            result.update({'points': n_points, 'chunkSize': chunk_size})
+            scenes.append(result)
+
+    results = {'host': {'platform': platform.platform(),
+                        'processor': platform.processor()},
+               'timestamp': time.time(),
+               'zoom': args.zoom,
+               'distribution': args.distribution,
+               'seed': args.seed,
+               'scenes': scenes}
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+r"""
+Benchmark instance culling on a close-up view of a large billboard scene.
+
+The scene of the spheres application is built with ``--points`` generated
+spheres and rendered offscreen, the camera zoomed into a small region and
+orbiting a little at every frame, once drawing every instance and once
+through ``furyweb.culling.InstanceCuller``::
+
+    $ pvpython -m benchmarks.bench_culling --points 1000000 --zoom 8 \
+        --output culling.json
+
+Reported for both runs: the p50/p99 frame time in milliseconds and, with
+culling, the drawn instances and the time spent culling.
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+
+import vtk
+from fury import actor, window
+
+from furyweb import generators
+from furyweb.culling import InstanceCuller
+from furyweb.metrics import Histogram
+
+
+def build_scene(n_points, seed=0):
+    points = generators.generate_points(
+        n_points, seed=seed, fields=('centers', 'colors', 'scales'))
+    spheres_actor = actor.billboard(points['centers'],
+                                    colors=points['colors'],
+                                    scales=points['scales'])
+    scene = window.Scene()
+    scene.add(spheres_actor)
+    return scene, spheres_actor
+
+
+def render_frames(scene, render_window, frames, zoom):
+    scene.ResetCamera()
+    scene.GetActiveCamera().Zoom(zoom)
+    render_window.Render()
+    histogram = Histogram(window=frames)
+    for _ in range(frames):
+        scene.GetActiveCamera().Azimuth(.5)
+        start = time.perf_counter()
+        render_window.Render()
+        histogram.observe(time.perf_counter() - start)
+    return {'p50Ms': round(histogram.percentile(50) * 1000, 3),
+            'p99Ms': round(histogram.percentile(99) * 1000, 3)}
+
+
+def bench(n_points, frames=50, zoom=8., size=(800, 600), grid_size=32,
+          min_pixels=1.):
+    results = {}
+    for culled in (False, True):
+        scene, spheres_actor = build_scene(n_points)
+        render_window = vtk.vtkRenderWindow()
+        render_window.SetOffScreenRendering(1)
+        render_window.SetSize(*size)
+        render_window.AddRenderer(scene)
+
+        culler = None
+        if culled:
+            start = time.perf_counter()
+            culler = InstanceCuller([spheres_actor], n_points,
+                                    grid_size=grid_size,
+                                    min_pixels=min_pixels)
+            culler.attach(scene)
+            setup_ms = (time.perf_counter() - start) * 1000.
+
+        result = render_frames(scene, render_window, frames, zoom)
+        if culler is not None:
+            result['setupMs'] = round(setup_ms, 3)
+            result['drawnInstances'] = culler.stats['drawnInstances']
+            result['subpixelInstances'] = culler.stats['subpixelInstances']
+            result['cullMs'] = round(culler.stats['cullSeconds'] * 1000, 3)
+        results['culling' if culled else 'all'] = result
+        render_window.Finalize()
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--points', type=int, default=1000000)
+    parser.add_argument('--frames', type=int, default=50)
+    parser.add_argument('--zoom', type=float, default=8.,
+                        help='camera zoom factor of the close-up view.')
+    parser.add_argument('--grid-size', type=int, default=32)
+    parser.add_argument('--min-pixels', type=float, default=1.)
+    parser.add_argument('--output', default=None,
+                        help='JSON file to write (default: stdout).')
+    args = parser.parse_args(argv)
+
+    print('Rendering {0} points...'.format(args.points), file=sys.stderr)
+    results = {'host': {'platform': platform.platform(),
+                        'processor': platform.processor()},
+               'timestamp': time.time(),
+               'points': args.points,
+               'zoom': args.zoom,
+               'frames': bench(args.points, args.frames, args.zoom,
+                               grid_size=args.grid_size,
+                               min_pixels=args.min_pixels)}
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
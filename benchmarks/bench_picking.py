@@ -0,0 +1,129 @@
+r"""
+Benchmark click picking on surfaces of increasing size.
+
+Each surface is rendered offscreen, then picked at random display positions
+on its silhouette, once with a plain ``vtkCellPicker`` (what the brain demo
+used to do) and once with ``furyweb.picking.surface_picker`` (prebuilt cell
+locators)::
+
+    $ pvpython -m benchmarks.bench_picking --resolutions 100 400 1000 \
+        --gifti data/pial_left.gii --output picking.json
+
+The construction time of the locators and the p50/p99 pick latency of both
+pickers are reported for every surface, in milliseconds.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import time
+
+import vtk
+
+from furyweb.metrics import Histogram
+from furyweb.picking import surface_picker
+
+
+def sphere_surface(resolution):
+    source = vtk.vtkSphereSource()
+    source.SetRadius(50)
+    source.SetThetaResolution(resolution)
+    source.SetPhiResolution(resolution)
+    source.Update()
+    return source.GetOutput()
+
+
+def gifti_surface(path):
+    from furyweb import mesh_cache
+
+    return mesh_cache.polydata_from_mesh(*mesh_cache.load_gifti_mesh(path))
+
+
+def time_picks(picker, renderer, positions):
+    histogram = Histogram(window=len(positions))
+    hits = 0
+    for x, y in positions:
+        start = time.perf_counter()
+        hits += picker.Pick(x, y, 0, renderer)
+        histogram.observe(time.perf_counter() - start)
+    return {'p50Ms': round(histogram.percentile(50) * 1000, 3),
+            'p99Ms': round(histogram.percentile(99) * 1000, 3),
+            'maxMs': round(histogram.percentile(100) * 1000, 3),
+            'hits': hits}
+
+
+def bench_surface(polydata, picks=200, size=(800, 600), seed=0):
+    mapper = vtk.vtkPolyDataMapper()
+    mapper.SetInputData(polydata)
+    surface_actor = vtk.vtkActor()
+    surface_actor.SetMapper(mapper)
+
+    renderer = vtk.vtkRenderer()
+    renderer.AddActor(surface_actor)
+    render_window = vtk.vtkRenderWindow()
+    render_window.SetOffScreenRendering(1)
+    render_window.SetSize(*size)
+    render_window.AddRenderer(renderer)
+    renderer.ResetCamera()
+    render_window.Render()
+
+    # Clicks around the center, where the surface covers the view
+    rng = random.Random(seed)
+    positions = [(size[0] / 2 + rng.uniform(-.25, .25) * size[0],
+                  size[1] / 2 + rng.uniform(-.25, .25) * size[1])
+                 for _ in range(picks)]
+
+    plain = vtk.vtkCellPicker()
+    plain.SetTolerance(0.01)
+
+    start = time.perf_counter()
+    fast = surface_picker([surface_actor], tolerance=0.01)
+    build_ms = (time.perf_counter() - start) * 1000.
+
+    result = {'triangles': polydata.GetNumberOfCells(),
+              'locatorBuildMs': round(build_ms, 3),
+              'cellPicker': time_picks(plain, renderer, positions),
+              'locatorPicker': time_picks(fast, renderer, positions)}
+    render_window.Finalize()
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--resolutions', type=int, nargs='+',
+                        default=[100, 300, 1000],
+                        help='theta and phi resolutions of the synthetic '
+                             'spheres (2 * r^2 triangles).')
+    parser.add_argument('--gifti', nargs='*', default=[],
+                        help='GIFTI surfaces to benchmark as well.')
+    parser.add_argument('--picks', type=int, default=200)
+    parser.add_argument('--output', default=None,
+                        help='JSON file to write (default: stdout).')
+    args = parser.parse_args(argv)
+
+    surfaces = [('sphere-{0}'.format(r), lambda r=r: sphere_surface(r))
+                for r in args.resolutions]
+    surfaces += [(os.path.basename(path), lambda p=path: gifti_surface(p))
+                 for path in args.gifti]
+
+    results = {'host': {'platform': platform.platform(),
+                        'processor': platform.processor(),
+                        'vtk': vtk.vtkVersion.GetVTKVersion()},
+               'timestamp': time.time(),
+               'surfaces': {}}
+    for name, load in surfaces:
+        print('Picking on {0}...'.format(name), file=sys.stderr)
+        results['surfaces'][name] = bench_surface(load(), picks=args.picks)
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
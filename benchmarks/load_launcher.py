@@ -0,0 +1,290 @@
+r"""
+Multi-session load test of the launcher.
+
+Sessions are requested through the launcher HTTP endpoint, exactly like the
+web clients do, and each of them runs the scripted interaction of
+``benchmarks.bench_apps``. The number of concurrent sessions is ramped up and,
+for every step, the per-session frame rate, input-to-image latency, memory
+(RSS) and CPU usage of the server processes are recorded::
+
+    $ python -m benchmarks.load_launcher --app tumor \
+        --launcher http://localhost:9000/paraview --sessions 1 2 4 8 16 \
+        --output load.json
+
+The report flags the first step where the median frame rate falls below
+``--fps-drop`` times the single session one, the p99 latency grows above
+``--latency-growth`` times the single session one, or sessions fail: this is
+where one host saturates. RSS and CPU are only measured when ``psutil`` is
+installed and the launcher runs on this host.
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import time
+import urllib.request
+import uuid
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+from benchmarks import sequences
+from benchmarks.app_servers import APPS
+from benchmarks.bench_apps import run_session
+from furyweb import prewarm
+
+
+def request_session(launcher_url, app, secret, fields=None):
+    """POST to the launcher and return the session it started."""
+    body = dict(fields or {}, application=app, secret=secret)
+    request = urllib.request.Request(
+        launcher_url, data=json.dumps(body).encode('utf8'),
+        headers={'Content-Type': 'application/json'})
+    with urllib.request.urlopen(request) as response:
+        return json.loads(response.read().decode('utf8'))
+
+
+def stop_session(launcher_url, session_id):
+    request = urllib.request.Request(
+        '{0}/{1}'.format(launcher_url.rstrip('/'), session_id),
+        method='DELETE')
+    try:
+        urllib.request.urlopen(request).close()
+    except OSError:
+        pass
+
+
+def find_server_process(secret):
+    """Find the server process of a session from its unique secret.
+
+    Sessions started from a pool of pre-warmed interpreters are served by a
+    worker whose command line is the pool one, the process started by the
+    launcher only proxies it and gives its pid.
+    """
+    if psutil is None:
+        return None
+    for process in psutil.process_iter(['cmdline']):
+        if secret in (process.info['cmdline'] or []):
+            worker_pid = prewarm.read_worker_pid(process.pid)
+            if worker_pid is None:
+                return process
+            try:
+                return psutil.Process(worker_pid)
+            except psutil.Error:
+                return None
+    return None
+
+
+class ResourceSampler(object):
+    """Sample the RSS and CPU usage of a server process."""
+
+    def __init__(self, process):
+        self.process = process
+        self.rss = []
+        if process is not None:
+            # The first call only starts the CPU time measurement
+            process.cpu_percent(None)
+
+    async def run(self, interval=.5):
+        while self.process is not None:
+            try:
+                self.rss.append(self.process.memory_info().rss)
+            except psutil.Error:
+                return
+            await asyncio.sleep(interval)
+
+    def to_dict(self):
+        if self.process is None:
+            return {}
+        try:
+            cpu = self.process.cpu_percent(None)
+        except psutil.Error:
+            cpu = None
+        return {'pid': self.process.pid,
+                'cpuPercent': cpu,
+                'rssPeakBytes': max(self.rss) if self.rss else None,
+                'rssMeanBytes': statistics.mean(self.rss) if self.rss
+                else None}
+
+
+async def run_launcher_session(args, events):
+    loop = asyncio.get_event_loop()
+    secret = uuid.uuid4().hex
+    result = {}
+    session = None
+    sampler = None
+    sampling = None
+    try:
+        start = time.time()
+        session = await loop.run_in_executor(
+            None, request_session, args.launcher, args.app, secret,
+            args.fields)
+        result['launchSeconds'] = time.time() - start
+        if 'error' in session:
+            raise RuntimeError(session['error'])
+
+        sampler = ResourceSampler(find_server_process(secret))
+        sampling = asyncio.ensure_future(sampler.run())
+        url = args.session_url.format(**session) if args.session_url \
+            else session['sessionURL']
+        result.update(await run_session(args.app, url, secret, events,
+                                        size=(args.width, args.height)))
+    except Exception as e:
+        result['error'] = repr(e)
+    finally:
+        if sampling is not None:
+            sampling.cancel()
+            result['resources'] = sampler.to_dict()
+        if session and 'id' in session:
+            await loop.run_in_executor(None, stop_session, args.launcher,
+                                       session['id'])
+    return result
+
+
+def summarize_step(n_sessions, sessions):
+    ok = [s for s in sessions if 'error' not in s]
+    fps = [s['interaction']['fps'] for s in ok]
+    p50 = [s['interaction'].get('interactionLatency', {}).get('p50Ms', 0)
+           for s in ok]
+    p99 = [s['interaction'].get('interactionLatency', {}).get('p99Ms', 0)
+           for s in ok]
+    resources = [s.get('resources', {}) for s in sessions]
+    cpu = [r['cpuPercent'] for r in resources if r.get('cpuPercent')]
+    rss = [r['rssPeakBytes'] for r in resources if r.get('rssPeakBytes')]
+    return {'sessions': n_sessions,
+            'failed': len(sessions) - len(ok),
+            'fpsMedian': statistics.median(fps) if fps else 0.,
+            'fpsMin': min(fps) if fps else 0.,
+            'latencyP50MsMedian': statistics.median(p50) if p50 else None,
+            'latencyP99MsMax': max(p99) if p99 else None,
+            'cpuPercentTotal': sum(cpu) if cpu else None,
+            'rssPeakBytesTotal': sum(rss) if rss else None,
+            'rssPeakBytesPerSession': statistics.mean(rss) if rss else None,
+            'hostLoad': list(psutil.getloadavg()) if psutil else None}
+
+
+def find_saturation(steps, fps_drop, latency_growth):
+    """Return the first step where the quality degrades, and why."""
+    if not steps:
+        return None
+    baseline = steps[0]
+    for step in steps:
+        reasons = []
+        if step['failed']:
+            reasons.append('{0} failed sessions'.format(step['failed']))
+        if baseline['fpsMedian'] and \
+                step['fpsMedian'] < fps_drop * baseline['fpsMedian']:
+            reasons.append('median fps {0:.1f} < {1:.0%} of {2:.1f}'.format(
+                step['fpsMedian'], fps_drop, baseline['fpsMedian']))
+        if baseline['latencyP99MsMax'] and step['latencyP99MsMax'] and \
+                step['latencyP99MsMax'] > \
+                latency_growth * baseline['latencyP99MsMax']:
+            reasons.append('p99 latency {0:.0f}ms > {1}x {2:.0f}ms'.format(
+                step['latencyP99MsMax'], latency_growth,
+                baseline['latencyP99MsMax']))
+        if reasons:
+            return {'sessions': step['sessions'], 'reasons': reasons}
+    return None
+
+
+def print_report(steps, saturation):
+    print('{0:>8} {1:>6} {2:>9} {3:>8} {4:>10} {5:>10} {6:>8} {7:>10}'.format(
+        'sessions', 'failed', 'fps(med)', 'fps(min)', 'p50ms(med)',
+        'p99ms(max)', 'cpu%', 'rss/sess'), file=sys.stderr)
+    for step in steps:
+        rss = step['rssPeakBytesPerSession']
+        print('{0:>8} {1:>6} {2:>9.1f} {3:>8.1f} {4:>10} {5:>10} {6:>8} '
+              '{7:>10}'.format(
+                  step['sessions'], step['failed'], step['fpsMedian'],
+                  step['fpsMin'],
+                  '%.0f' % step['latencyP50MsMedian']
+                  if step['latencyP50MsMedian'] is not None else '-',
+                  '%.0f' % step['latencyP99MsMax']
+                  if step['latencyP99MsMax'] is not None else '-',
+                  '%.0f' % step['cpuPercentTotal']
+                  if step['cpuPercentTotal'] is not None else '-',
+                  '%.0fM' % (rss / 2 ** 20) if rss else '-'),
+              file=sys.stderr)
+    if saturation:
+        print('Saturated at {0} sessions: {1}'.format(
+            saturation['sessions'], ', '.join(saturation['reasons'])),
+            file=sys.stderr)
+    else:
+        print('No saturation observed', file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--app', default='tumor', choices=sorted(APPS))
+    parser.add_argument('--launcher',
+                        default='http://localhost:9000/paraview',
+                        help='launcher endpoint sessions are requested from.')
+    parser.add_argument('--field', action='append', default=[],
+                        dest='field_list', metavar='KEY=VALUE',
+                        help='extra launcher field, e.g. demodata=true.')
+    parser.add_argument('--session-url', default=None,
+                        help='format of the websocket url built from the '
+                             'launcher response, e.g. '
+                             '"ws://localhost:{port}/ws" (default: its '
+                             'sessionURL).')
+    parser.add_argument('--sessions', nargs='+', type=int,
+                        default=[1, 2, 4, 8, 16],
+                        help='numbers of concurrent sessions to ramp up to.')
+    parser.add_argument('--sequence', default=None,
+                        help='recorded input sequence (JSON) to replay.')
+    parser.add_argument('--width', type=int, default=800)
+    parser.add_argument('--height', type=int, default=600)
+    parser.add_argument('--fps-drop', type=float, default=.8)
+    parser.add_argument('--latency-growth', type=float, default=2.)
+    parser.add_argument('--cooldown', type=float, default=5.,
+                        help='seconds to wait between steps.')
+    parser.add_argument('--output', default=None,
+                        help='JSON report to write (default: stdout).')
+    args = parser.parse_args(argv)
+    args.fields = dict(field.split('=', 1) for field in args.field_list)
+    if args.app == 'tumor':
+        args.fields.setdefault('demodata', 'true')
+
+    events = sequences.load_sequence(args.sequence) if args.sequence \
+        else sequences.default_sequence(use_wheel=APPS[args.app]['wheel'])
+
+    steps = []
+    details = []
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        for n_sessions in args.sessions:
+            print('Running {0} concurrent {1} sessions...'.format(
+                n_sessions, args.app), file=sys.stderr)
+            sessions = loop.run_until_complete(asyncio.gather(*[
+                run_launcher_session(args, events)
+                for _ in range(n_sessions)]))
+            steps.append(summarize_step(n_sessions, sessions))
+            details.append({'sessions': n_sessions, 'results': sessions})
+            time.sleep(args.cooldown)
+    finally:
+        loop.close()
+
+    saturation = find_saturation(steps, args.fps_drop, args.latency_growth)
+    print_report(steps, saturation)
+    report = {'app': args.app,
+              'launcher': args.launcher,
+              'cpus': psutil.cpu_count() if psutil else None,
+              'memoryBytes': psutil.virtual_memory().total if psutil
+              else None,
+              'steps': steps,
+              'saturation': saturation,
+              'details': details}
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
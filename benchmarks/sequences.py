@@ -0,0 +1,94 @@
+"""Input sequences replayed by the benchmark client.
+
+A sequence is a list of events ``{"t": seconds, "method": rpc, "args": [...]}``
+sorted by time. Sequences recorded from a browser session (for example by
+logging the RPCs sent by the client) can be saved in this format and replayed
+with ``--sequence``; otherwise a default orbit followed by a zoom is generated.
+"""
+import json
+import math
+
+
+def mouse_event(action, x, y, left=False, right=False, view=-1):
+    return {'view': view, 'action': action,
+            'buttonLeft': left, 'buttonMiddle': False, 'buttonRight': right,
+            'shiftKey': False, 'ctrlKey': False, 'altKey': False,
+            'metaKey': False, 'x': x, 'y': y}
+
+
+def orbit(start=0., duration=4., rate=60., radius=.25):
+    """Left button drag along a circle around the center of the view."""
+    n_moves = int(duration * rate)
+    events = [{'t': start, 'method': 'viewport.mouse.interaction',
+               'args': [mouse_event('down', .5 + radius, .5, left=True)]}]
+    for i in range(1, n_moves + 1):
+        angle = 2 * math.pi * i / n_moves
+        x = .5 + radius * math.cos(angle)
+        y = .5 + radius * math.sin(angle)
+        events.append({'t': start + i / rate,
+                       'method': 'viewport.mouse.interaction',
+                       'args': [mouse_event('move', x, y, left=True)]})
+    events.append({'t': start + duration + 1. / rate,
+                   'method': 'viewport.mouse.interaction',
+                   'args': [mouse_event('up', .5 + radius, .5)]})
+    return events
+
+
+def wheel(start=0., duration=2., rate=30., spin=.5):
+    """Zoom in then out with the mouse wheel."""
+    n_steps = int(duration * rate)
+    events = [{'t': start, 'method': 'viewport.mouse.zoom.wheel',
+               'args': [{'type': 'StartMouseWheel', 'view': -1}]}]
+    for i in range(n_steps):
+        spin_y = spin if i < n_steps // 2 else -spin
+        events.append({'t': start + i / rate,
+                       'method': 'viewport.mouse.zoom.wheel',
+                       'args': [{'type': 'MouseWheel', 'view': -1,
+                                 'spinY': spin_y}]})
+    events.append({'t': start + duration,
+                   'method': 'viewport.mouse.zoom.wheel',
+                   'args': [{'type': 'EndMouseWheel', 'view': -1}]})
+    return events
+
+
+def right_drag_zoom(start=0., duration=2., rate=60.):
+    """Zoom in then out by dragging with the right button (trackball)."""
+    n_moves = int(duration * rate)
+    events = [{'t': start, 'method': 'viewport.mouse.interaction',
+               'args': [mouse_event('down', .5, .5, right=True)]}]
+    for i in range(1, n_moves + 1):
+        phase = i / n_moves
+        y = .5 + .3 * (phase if phase < .5 else 1 - phase)
+        events.append({'t': start + i / rate,
+                       'method': 'viewport.mouse.interaction',
+                       'args': [mouse_event('move', .5, y, right=True)]})
+    events.append({'t': start + duration + 1. / rate,
+                   'method': 'viewport.mouse.interaction',
+                   'args': [mouse_event('up', .5, .5)]})
+    return events
+
+
+def default_sequence(use_wheel=True, orbit_duration=4., zoom_duration=2.):
+    """Orbit around the scene, then zoom in and out.
+
+    Servers without a ``viewport.mouse.zoom.wheel`` RPC get a right button
+    drag instead of the wheel events.
+    """
+    events = orbit(0., orbit_duration)
+    start = orbit_duration + .5
+    if use_wheel:
+        events += wheel(start, zoom_duration)
+    else:
+        events += right_drag_zoom(start, zoom_duration)
+    return events
+
+
+def load_sequence(path):
+    with open(path) as f:
+        events = json.load(f)
+    return sorted(events, key=lambda event: event['t'])
+
+
+def save_sequence(events, path):
+    with open(path, 'w') as f:
+        json.dump(events, f, indent=1)
@@ -0,0 +1,164 @@
+"""Scripted interaction session measuring what a user would perceive.
+
+The session connects to a server like the browser client does, replays an
+input sequence and records every image received. Each input is timestamped
+when sent and resolved by the first image received after it, which gives the
+input-to-image latency.
+"""
+import asyncio
+import collections
+import time
+
+from furyweb.metrics import Histogram
+
+from benchmarks.wslink_client import WslinkClient
+
+
+class InteractionSession(object):
+    """Drive one server session.
+
+    Parameters
+    ----------
+    url : str
+        Websocket url of the server.
+    secret : str, optional
+        Authentication key.
+    delivery : {'push', 'render'}, optional
+        Whether images are published by the server
+        (``viewport.image.push.subscription``) or requested by the client
+        (``viewport.image.render``).
+    size : tuple of int, optional
+        Size of the view in pixels.
+    flow_control : bool, optional
+        Acknowledge pushed frames, like the application clients do.
+    """
+
+    def __init__(self, url, secret='wslink-secret', delivery='push',
+                 size=(800, 600), flow_control=True):
+        self.client = WslinkClient(url, secret)
+        self.delivery = delivery
+        self.size = list(size)
+        self.flow_control = flow_control
+        self.connect_time = None
+        self.first_image_time = None
+        self.frames = []
+        self.latency = collections.defaultdict(
+            lambda: Histogram(window=100000))
+        self._pending_inputs = collections.defaultdict(list)
+        self._first_image = None
+        self._dirty = None
+        self._render_task = None
+        self._mtime = 0
+
+    async def start(self):
+        self._first_image = asyncio.Event()
+        self._dirty = asyncio.Event()
+        self.connect_time = time.time()
+        await self.client.connect()
+
+        if self.delivery == 'push':
+            self.client.subscribe('viewport.image.push.subscription',
+                                  self._on_push)
+            if self.flow_control:
+                await self.client.call('viewport.image.push.flow',
+                                       [-1, True, 2])
+            await self.client.call('viewport.image.push.observer.add', [-1])
+            await self.client.call('viewport.image.push.original.size',
+                                   [-1] + self.size)
+            await self.client.call('viewport.image.push', [{'view': -1}])
+        else:
+            self._render_task = asyncio.ensure_future(self._render_loop())
+            self._dirty.set()
+
+    async def wait_first_image(self, timeout=60.):
+        await asyncio.wait_for(self._first_image.wait(), timeout)
+        return self.first_image_time - self.connect_time
+
+    def send_input(self, method, args, kind='interaction'):
+        """Send an input RPC without waiting for its result."""
+        self._pending_inputs[kind].append(time.time())
+        self._dirty.set()
+        return self.client.call(method, args)
+
+    async def replay(self, events, speed=1.):
+        """Send the events of a sequence at their recorded times."""
+        loop = asyncio.get_event_loop()
+        start = loop.time()
+        calls = []
+        for event in events:
+            delay = start + event['t'] / speed - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            calls.append(self.send_input(event['method'], event['args']))
+        await asyncio.gather(*calls, return_exceptions=True)
+
+    async def scrub(self, frames, interval=.5):
+        """Load each tumor frame and ask for the resulting image."""
+        for data in frames:
+            await self.send_input('tumor.update_view', [data], kind='scrub')
+            # What the client view.render() does after an update
+            if self.delivery == 'push':
+                await self.client.call('viewport.image.push', [{'view': -1}])
+            await asyncio.sleep(interval)
+
+    async def metrics(self):
+        """Server side metrics of the view, when the server exposes them."""
+        try:
+            return await self.client.call('viewport.metrics.get')
+        except Exception:
+            return None
+
+    async def close(self):
+        if self._render_task is not None:
+            self._render_task.cancel()
+            await asyncio.gather(self._render_task, return_exceptions=True)
+        await self.client.close()
+
+    def _on_image(self, nbytes):
+        now = time.time()
+        self.frames.append((now, nbytes))
+        if self.first_image_time is None:
+            self.first_image_time = now
+            self._first_image.set()
+        for kind, pending in self._pending_inputs.items():
+            for sent in pending:
+                self.latency[kind].observe(now - sent)
+            del pending[:]
+
+    def _on_push(self, reply):
+        image = reply.get('image')
+        if not image:
+            return
+        self._on_image(len(image))
+        if self.flow_control and 'frameId' in reply:
+            self.client.call('viewport.image.push.ack',
+                             [reply['id'], reply['frameId']])
+
+    async def _render_loop(self):
+        # Same request/reply loop as the vtk.js RemoteView: one render in
+        # flight, repeated while the server says the image is stale.
+        while True:
+            await self._dirty.wait()
+            self._dirty.clear()
+            reply = await self.client.call('viewport.image.render', [{
+                'size': self.size, 'view': -1, 'mtime': self._mtime,
+                'quality': 100, 'localTime': time.time()}])
+            if reply.get('image'):
+                self._mtime = reply.get('mtime', self._mtime)
+                self._on_image(len(reply['image']))
+            if reply.get('stale'):
+                self._dirty.set()
+
+    def summary(self, start, end):
+        """Frame rate, throughput and latency between start and end."""
+        frames = [(t, n) for t, n in self.frames if start <= t <= end]
+        duration = max(end - start, 1e-6)
+        result = {'frames': len(frames),
+                  'fps': len(frames) / duration,
+                  'bytesPerSecond': sum(n for _, n in frames) / duration}
+        for kind, histogram in self.latency.items():
+            result[kind + 'Latency'] = {
+                'count': histogram.count,
+                'p50Ms': histogram.percentile(50) * 1000,
+                'p99Ms': histogram.percentile(99) * 1000}
+        return result
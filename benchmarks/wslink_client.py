@@ -0,0 +1,121 @@
+"""Minimal asyncio client of the wslink protocol.
+
+It speaks the same messages as the JavaScript ``SmartConnect`` client: a
+``wslink.hello`` handshake carrying the secret, JSON-RPC like calls and
+published messages. Binary attachments, announced by a
+``wslink.binary.attachment`` message and sent as the next binary frame, are
+substituted back into the result that references them.
+"""
+import asyncio
+import itertools
+import json
+
+import websockets
+
+
+class WslinkError(Exception):
+    """Error returned by the server for an RPC."""
+
+
+class WslinkClient(object):
+    """Connection to a wslink server.
+
+    Parameters
+    ----------
+    url : str
+        Websocket url of the server, e.g. ``ws://localhost:1234/ws``.
+    secret : str, optional
+        Authentication key the server was started with.
+    """
+
+    def __init__(self, url, secret='wslink-secret'):
+        self.url = url
+        self.secret = secret
+        self.client_id = None
+        self.bytes_received = 0
+        self._ws = None
+        self._reader = None
+        self._ids = itertools.count(1)
+        self._pending = {}
+        self._subscriptions = {}
+        self._attachment_keys = []
+        self._attachments = {}
+
+    async def connect(self):
+        self._ws = await websockets.connect(self.url, max_size=None)
+        self._reader = asyncio.ensure_future(self._read())
+        result = await self._send('system:c0:0', 'wslink.hello',
+                                  [{'secret': self.secret}])
+        self.client_id = result['clientID']
+        return self
+
+    async def close(self):
+        if self._ws is not None:
+            await self._ws.close()
+        if self._reader is not None:
+            await asyncio.gather(self._reader, return_exceptions=True)
+
+    def subscribe(self, topic, callback):
+        """Call ``callback(message)`` for every message published on topic."""
+        self._subscriptions.setdefault(topic, []).append(callback)
+
+    def call(self, method, args=None, kwargs=None):
+        """Call an RPC and return a future of its result."""
+        rpc_id = 'rpc:{0}:{1}'.format(self.client_id, next(self._ids))
+        return self._send(rpc_id, method, args or [], kwargs or {})
+
+    def _send(self, rpc_id, method, args, kwargs=None):
+        future = asyncio.get_event_loop().create_future()
+        self._pending[rpc_id] = future
+        message = {'wslink': '1.0', 'id': rpc_id, 'method': method,
+                   'args': args, 'kwargs': kwargs or {}}
+        asyncio.ensure_future(self._ws.send(json.dumps(message)))
+        return future
+
+    async def _read(self):
+        try:
+            async for data in self._ws:
+                self.bytes_received += len(data)
+                if isinstance(data, bytes):
+                    if self._attachment_keys:
+                        key = self._attachment_keys.pop(0)
+                        self._attachments[key] = data
+                    continue
+                self._dispatch(json.loads(data))
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(WslinkError('Connection closed'))
+            self._pending.clear()
+
+    def _dispatch(self, message):
+        if message.get('method') == 'wslink.binary.attachment':
+            self._attachment_keys.extend(message['args'])
+            return
+
+        rpc_id = message.get('id', '')
+        if rpc_id.startswith('publish:'):
+            topic = rpc_id.split(':')[1]
+            result = self._resolve(message.get('result'))
+            for callback in self._subscriptions.get(topic, []):
+                callback(result)
+            return
+
+        future = self._pending.pop(rpc_id, None)
+        if future is None or future.done():
+            return
+        if 'error' in message:
+            future.set_exception(WslinkError(message['error']))
+        else:
+            future.set_result(self._resolve(message.get('result')))
+
+    def _resolve(self, value):
+        if isinstance(value, str) and value in self._attachments:
+            return self._attachments.pop(value)
+        if isinstance(value, dict):
+            return dict((k, self._resolve(v)) for k, v in value.items())
+        if isinstance(value, list):
+            return [self._resolve(v) for v in value]
+        return value
@@ -0,0 +1,7 @@
+"""Server-side modules shared by the FURY/Web applications.
+
+The application servers under ``apps/*/server`` are started by the launcher
+as standalone ``pvpython`` scripts. Each of them adds the root of this
+repository to ``sys.path`` so the modules below can be imported as
+``furyweb.<module>``.
+"""
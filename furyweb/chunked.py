@@ -0,0 +1,189 @@
+"""Very large instance scenes split into chunks of actors.
+
+A single fury actor for tens of millions of instances needs giant
+contiguous allocations, and any change uploads all of its buffers again.
+The instances of a ``ChunkedScene`` are ordered along a Z-order (Morton)
+curve, so that consecutive instances are close in space, and split into
+chunks of a fixed size, each its own actor with its bounding box.
+Visibility and level of detail are decided per chunk, and updates only
+touch the chunks of the modified instances.
+"""
+import time
+
+import numpy as np
+from vtk.util import numpy_support
+
+from furyweb import culling
+from furyweb.primitive_buffers import PrimitiveBuffers
+
+
+def morton_order(centers, bits=10):
+    """Indices sorting the centers along a Z-order curve."""
+    low = centers.min(axis=0)
+    span = np.maximum(centers.max(axis=0) - low, 1e-9)
+    codes = np.zeros(len(centers), dtype=np.uint64)
+    for axis in range(3):
+        quantized = ((centers[:, axis] - low[axis]) / span[axis] *
+                     (2 ** bits - 1)).astype(np.uint64)
+        for bit in range(bits):
+            codes |= ((quantized >> np.uint64(bit)) & np.uint64(1)) << \
+                np.uint64(3 * bit + axis)
+    return np.argsort(codes, kind='stable')
+
+
+class ChunkedScene(object):
+    """Instances split into spatially coherent actors.
+
+    Parameters
+    ----------
+    build_actor : callable
+        Called with the centers, colors and scales of a chunk, returns its
+        actor (e.g. ``actor.billboard`` with the application shader).
+    min_pixels : float, optional
+        Chunks whose projected diameter is smaller than this number of
+        pixels are hidden.
+    lod_density : float, optional
+        Maximum number of instances drawn per pixel of the projected area
+        of a chunk; denser chunks only draw every 2nd, 4th, ... instance
+        (0: always draw them all).
+    on_update : callable, optional
+        Called with the ``stats`` dict after each visibility update.
+    """
+
+    def __init__(self, build_actor, min_pixels=1., lod_density=1.,
+                 on_update=None):
+        self.build_actor = build_actor
+        self.min_pixels = min_pixels
+        self.lod_density = lod_density
+        self.on_update = on_update
+        self.chunks = []
+        self.stats = {'chunks': 0, 'visibleChunks': 0, 'drawnInstances': 0,
+                      'updatedChunks': 0, 'cullSeconds': 0.}
+        self._bounds = None
+        self._lookup = None
+        self._view_state = None
+
+    @classmethod
+    def from_arrays(cls, build_actor, centers, colors, scales=1.,
+                    chunk_size=100000, **kwargs):
+        """Sort the instances along a Z-order curve and chunk them."""
+        chunked = cls(build_actor, **kwargs)
+        order = morton_order(centers)
+        scales = np.broadcast_to(scales, (len(centers),))
+        for start in range(0, len(centers), chunk_size):
+            index = order[start:start + chunk_size]
+            chunked.add_chunk(centers[index], colors[index], scales[index],
+                              index)
+        return chunked
+
+    def add_chunk(self, centers, colors, scales, index):
+        """Add a chunk of instances, of global ids index."""
+        prim_actor = self.build_actor(centers, colors, scales)
+        chunk = {'actor': prim_actor, 'index': np.asarray(index),
+                 'cells': culling.instance_cells(prim_actor, len(centers)),
+                 'stride': 1, 'buffers': None}
+        self.chunks.append(chunk)
+        self._measure(chunk)
+        self._bounds = None
+        self._lookup = None
+        return chunk
+
+    def _measure(self, chunk):
+        points = chunk['actor'].GetMapper().GetInput().GetPoints()
+        positions = numpy_support.vtk_to_numpy(points.GetData())
+        chunk['low'] = positions.min(axis=0)
+        chunk['high'] = positions.max(axis=0)
+
+    def add_to_scene(self, scene):
+        for chunk in self.chunks:
+            scene.add(chunk['actor'])
+
+    def attach(self, renderer):
+        """Update the chunks before each render of the renderer."""
+        renderer.AddObserver('StartEvent',
+                             lambda obj, event: self.update_visibility(obj))
+
+    def update_visibility(self, renderer):
+        """Show the chunks in the view, at their level of detail."""
+        camera = renderer.GetActiveCamera()
+        view_state = (camera.GetMTime(),) + tuple(renderer.GetSize())
+        if self._bounds is not None and view_state == self._view_state:
+            return
+        start = time.time()
+        self._view_state = view_state
+        if self._bounds is None:
+            low = np.array([chunk['low'] for chunk in self.chunks])
+            high = np.array([chunk['high'] for chunk in self.chunks])
+            self._bounds = (low, high)
+        low, high = self._bounds
+
+        outside, _ = culling.classify_boxes(
+            low, high, *culling.frustum_planes(renderer))
+        pixels = culling.projected_pixels(
+            renderer, (low + high) / 2,
+            np.sqrt(((high - low) ** 2).sum(axis=1)) / 2)
+
+        drawn = visible_chunks = 0
+        for chunk, hidden, chunk_pixels in zip(self.chunks, outside, pixels):
+            visible = not hidden and chunk_pixels >= self.min_pixels
+            chunk['actor'].SetVisibility(visible)
+            if not visible:
+                continue
+            visible_chunks += 1
+            count = len(chunk['cells'])
+            stride = 1
+            if self.lod_density:
+                budget = max(self.lod_density * chunk_pixels ** 2, 1.)
+                while count / stride > budget:
+                    stride *= 2
+            if stride != chunk['stride']:
+                chunk['stride'] = stride
+                culling.draw_instances(chunk['actor'], chunk['cells'],
+                                       slice(None, None, stride)
+                                       if stride > 1 else None)
+            drawn += -(-count // stride)
+
+        self.stats.update({'chunks': len(self.chunks),
+                           'visibleChunks': visible_chunks,
+                           'drawnInstances': drawn,
+                           'cullSeconds': time.time() - start})
+        if self.on_update:
+            self.on_update(self.stats)
+
+    def _locate(self, index):
+        """Chunk and position in the chunk of the instances of index."""
+        if self._lookup is None:
+            ids = np.concatenate([chunk['index'] for chunk in self.chunks])
+            sizes = [len(chunk['index']) for chunk in self.chunks]
+            chunk_ids = np.repeat(np.arange(len(self.chunks)), sizes)
+            local = np.concatenate([np.arange(size) for size in sizes])
+            order = np.argsort(ids)
+            self._lookup = (ids[order], chunk_ids[order], local[order])
+        ids, chunk_ids, local = self._lookup
+        position = np.searchsorted(ids, index)
+        if np.any(position >= len(ids)) or \
+                np.any(ids[np.minimum(position, len(ids) - 1)] != index):
+            raise IndexError('Unknown instance ids')
+        return chunk_ids[position], local[position]
+
+    def update(self, index, centers=None, colors=None):
+        """Move or recolor instances, only rewriting their chunks."""
+        index = np.asarray(index)
+        chunk_ids, local = self._locate(index)
+        updated = np.unique(chunk_ids)
+        for chunk_id in updated:
+            chunk = self.chunks[chunk_id]
+            if chunk['buffers'] is None:
+                chunk['buffers'] = PrimitiveBuffers(chunk['actor'],
+                                                    len(chunk['index']))
+            mask = chunk_ids == chunk_id
+            if centers is not None:
+                chunk['buffers'].set_centers(np.asarray(centers)[mask],
+                                             local[mask])
+                self._measure(chunk)
+                self._bounds = None
+            if colors is not None:
+                chunk['buffers'].set_colors(np.asarray(colors)[mask],
+                                            local[mask])
+        self.stats['updatedChunks'] = len(updated)
+        return len(updated)
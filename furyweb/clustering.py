@@ -0,0 +1,284 @@
+r"""
+Cached QuickBundles clusters of tractograms.
+
+Clustering millions of streamlines takes minutes, far too long to do again
+at the start of every session or on every move of a threshold slider.
+``ClusteringService`` runs QuickBundles in a worker process, off both the
+reactor and the rendering, and keeps the result next to the tractogram
+(see ``furyweb.tractography.cache_prefix``), keyed by the hash of its
+content and the threshold:
+
+* ``<prefix>.qb<threshold>.centroids.npy``, float32 ``(n_clusters, 12, 3)``;
+* ``<prefix>.qb<threshold>.labels.npy``, the cluster of each streamline in
+  the smallest unsigned integer type holding the number of clusters.
+
+A larger threshold is not computed from the streamlines again when the
+clusters of a smaller one are cached: the finer centroids are clustered
+themselves and the labels of the streamlines mapped through, the way
+QuickBundlesX builds its hierarchy. A streamline then follows the centroid
+of its finer cluster, which only approximates clustering it directly.
+"""
+import ctypes
+import glob
+import multiprocessing
+import os
+import re
+import signal
+import threading
+import time
+
+import numpy as np
+from twisted.internet import defer, reactor, threads
+
+from furyweb import mesh_cache, tractography
+
+# Points of the streamlines compared by QuickBundles, one of the
+# tractography levels
+CLUSTER_POINTS = 12
+
+# prctl option killing a process when its parent dies (Linux)
+PR_SET_PDEATHSIG = 1
+
+
+def _paths(prefix, threshold):
+    return ['%s.qb%g.%s.npy' % (prefix, threshold, name)
+            for name in ('centroids', 'labels')]
+
+
+def cached_thresholds(prefix):
+    """Thresholds of the clusters cached for a tractogram."""
+    if prefix is None:
+        return []
+    pattern = re.compile(re.escape(os.path.basename(prefix)) +
+                         r'\.qb([0-9.e+-]+)\.labels\.npy$')
+    thresholds = []
+    for path in glob.glob(glob.escape(prefix) + '.qb*.labels.npy'):
+        match = pattern.match(os.path.basename(path))
+        if match and os.path.isfile(_paths(prefix, float(match.group(1)))[0]):
+            thresholds.append(float(match.group(1)))
+    return sorted(thresholds)
+
+
+def load_clusters(prefix, threshold):
+    """Memory-mapped centroids and labels, or None if not cached."""
+    if prefix is None:
+        return None
+    paths = _paths(prefix, threshold)
+    if not all(os.path.isfile(path) for path in paths):
+        return None
+    return tuple(np.load(path, mmap_mode='r') for path in paths)
+
+
+def save_clusters(prefix, threshold, centroids, labels):
+    centroids_path, labels_path = _paths(prefix, threshold)
+    labels = labels.astype(np.min_scalar_type(max(len(centroids) - 1, 0)))
+    # Labels last, their file marks complete clusters
+    mesh_cache._save(centroids_path, centroids.astype(np.float32))
+    mesh_cache._save(labels_path, labels)
+
+
+def quickbundles(streamlines, threshold):
+    """QuickBundles of streamlines with the same number of points.
+
+    Returns
+    -------
+    centroids : ndarray (n_clusters, n_points, 3) float32
+    labels : ndarray (n_streamlines,) uint32
+    """
+    from dipy.segment.clustering import QuickBundles
+    from dipy.segment.metric import AveragePointwiseEuclideanMetric
+
+    # The streamlines are resampled already
+    qb = QuickBundles(threshold=threshold,
+                      metric=AveragePointwiseEuclideanMetric())
+    clusters = qb.cluster(streamlines)
+    labels = np.empty(len(streamlines), dtype=np.uint32)
+    for i, cluster in enumerate(clusters):
+        labels[cluster.indices] = i
+    centroids = np.array([cluster.centroid for cluster in clusters],
+                         dtype=np.float32).reshape(-1, streamlines.shape[1], 3)
+    return centroids, labels
+
+
+def merge_clusters(centroids, sizes, threshold):
+    """Coarser clusters made of finer ones.
+
+    Parameters
+    ----------
+    centroids : ndarray (n_clusters, n_points, 3)
+    sizes : ndarray (n_clusters,)
+        Streamlines of each cluster, the weight of its centroid.
+    threshold : float
+        Threshold of the coarser clusters, in mm.
+
+    Returns
+    -------
+    centroids : ndarray (n_coarse_clusters, n_points, 3) float32
+    mapping : ndarray (n_clusters,) uint32
+        Coarser cluster of each cluster.
+    """
+    _, mapping = quickbundles(np.ascontiguousarray(centroids,
+                                                   dtype=np.float32),
+                              threshold)
+    merged = np.empty((mapping.max() + 1 if len(mapping) else 0,) +
+                      centroids.shape[1:], dtype=np.float32)
+    for i in range(len(merged)):
+        members = centroids[mapping == i]
+        weights = sizes[mapping == i].astype(np.float64)
+        # Same orientation as the first member before averaging, as
+        # QuickBundles does with the flipped streamlines
+        direct = np.abs(members - members[0]).sum(axis=(1, 2))
+        flipped = np.abs(members[:, ::-1] - members[0]).sum(axis=(1, 2))
+        members = np.where((flipped < direct)[:, None, None],
+                           members[:, ::-1], members)
+        merged[i] = np.tensordot(weights, members, axes=1) / weights.sum()
+    return merged, mapping
+
+
+def compute_clusters(path, threshold, cache_dir=None):
+    """Cluster a tractogram, reusing the cache, in the worker process.
+
+    Returns
+    -------
+    source : str
+        'cached', 'merged' (from finer clusters) or 'computed'.
+    finer : float or None
+        Threshold of the merged clusters.
+    clusters : tuple or None
+        Centroids and labels, only when the cache is not available (the
+        parent process reads them from the cache otherwise).
+    """
+    tractogram = tractography.load_tractogram(path, cache_dir)
+    prefix = tractography.cache_prefix(path, cache_dir)
+    if load_clusters(prefix, threshold) is not None:
+        return 'cached', None, None
+
+    finer = [t for t in cached_thresholds(prefix) if t < threshold]
+    if finer:
+        source, finer = 'merged', max(finer)
+        centroids, labels = load_clusters(prefix, finer)
+        sizes = np.bincount(labels, minlength=len(centroids))
+        centroids, mapping = merge_clusters(np.asarray(centroids), sizes,
+                                            threshold)
+        labels = mapping[labels]
+    else:
+        source, finer = 'computed', None
+        resampled = tractography.resample_levels(
+            tractogram, (CLUSTER_POINTS,),
+            cache_dir=cache_dir)[CLUSTER_POINTS]
+        centroids, labels = quickbundles(resampled, threshold)
+
+    if prefix is not None:
+        try:
+            save_clusters(prefix, threshold, centroids, labels)
+            return source, finer, None
+        except OSError:
+            pass
+    return source, finer, (centroids, labels)
+
+
+def _exit_with_parent(parent_pid):
+    """Pool initializer: end the worker as soon as the session dies.
+
+    A killed session would otherwise leave its worker running QuickBundles
+    to the end, reparented to init.
+    """
+    try:
+        ctypes.CDLL(None, use_errno=True).prctl(PR_SET_PDEATHSIG,
+                                                signal.SIGKILL)
+    except (OSError, AttributeError):
+        # No prctl: polled, only between the steps releasing the GIL
+        def watch():
+            while os.getppid() == parent_pid:
+                time.sleep(1.)
+            os._exit(1)
+
+        threading.Thread(target=watch, daemon=True).start()
+    if os.getppid() != parent_pid:
+        # Died before prctl
+        os._exit(1)
+
+
+class ClusteringService(object):
+    """QuickBundles clusters of a tractogram, computed in a worker process.
+
+    The worker is forked when the service is created, before the reactor
+    starts any thread, and kept for the following requests. It exits with
+    the session process, ``close`` stops it earlier.
+
+    Parameters
+    ----------
+    path : str
+        ``.trk`` or ``.tck`` file.
+    cache_dir : str, optional
+        See ``tractography.load_tractogram``.
+    """
+
+    def __init__(self, path, cache_dir=None):
+        self.path = path
+        self.cache_dir = cache_dir
+        self.pending = {}
+        self.stats = {'cached': 0, 'merged': 0, 'computed': 0}
+        # Hashes the tractogram the first time, only known off the reactor
+        self.prefix = None
+        self._pool = multiprocessing.Pool(processes=1,
+                                          initializer=_exit_with_parent,
+                                          initargs=(os.getpid(),))
+
+    def _load_cached(self, threshold):
+        if self.prefix is None:
+            self.prefix = tractography.cache_prefix(self.path, self.cache_dir)
+        return load_clusters(self.prefix, threshold)
+
+    def cached_thresholds(self):
+        """Cached thresholds, none until a first request found the cache."""
+        return cached_thresholds(self.prefix)
+
+    def clusters(self, threshold):
+        """Deferred firing with the centroids and labels of a threshold."""
+        threshold = float(threshold)
+        deferred = defer.Deferred()
+        if threshold in self.pending:
+            self.pending[threshold].append(deferred)
+            return deferred
+        self.pending[threshold] = [deferred]
+
+        def loaded(clusters):
+            if clusters is not None:
+                self._done(threshold, ('cached', None, clusters))
+                return
+            self._pool.apply_async(
+                compute_clusters, (self.path, threshold, self.cache_dir),
+                callback=lambda result: reactor.callFromThread(
+                    self._done, threshold, result),
+                error_callback=lambda error: reactor.callFromThread(
+                    self._failed, threshold, error))
+
+        # Hashing the tractogram the first time is slow
+        threads.deferToThread(self._load_cached, threshold).addCallbacks(
+            loaded, lambda failure: self._failed(threshold, failure))
+        return deferred
+
+    def _done(self, threshold, result):
+        source, finer, clusters = result
+        if clusters is None:
+            # Saved by the worker, under the prefix found by clusters()
+            clusters = load_clusters(self.prefix, threshold)
+        if clusters is None:
+            self._failed(threshold, IOError(
+                'Clusters of {0} at {1:g}mm missing from the cache'.format(
+                    self.path, threshold)))
+            return
+        self.stats[source] += 1
+        print('Clusters of {0} at {1:g}mm: {2} clusters, {3}{4}'.format(
+            self.path, threshold, len(clusters[0]), source,
+            ' from {:g}mm'.format(finer) if finer is not None else ''))
+        for deferred in self.pending.pop(threshold):
+            deferred.callback(clusters)
+
+    def _failed(self, threshold, error):
+        for deferred in self.pending.pop(threshold, []):
+            deferred.errback(error)
+
+    def close(self):
+        self._pool.terminate()
@@ -0,0 +1,179 @@
+"""CPU culling of the instances of fury primitive actors.
+
+Billboard and sdf actors draw every instance, and each of them costs a
+fragment shader run (a ray march for the sdf primitives) on the software
+rendered views. Before each render where the camera or the view size
+changed, the culler selects the instances inside the view frustum and
+larger than a pixel on screen, and keeps only their triangles in the cell
+arrays of the actors (the index buffer, the vertex buffers are untouched).
+
+The instances are binned in a regular grid: the cells outside the frustum
+are rejected and the ones inside accepted as a whole, only the instances of
+the cells crossing a frustum plane are tested one by one.
+"""
+import time
+
+import numpy as np
+from vtk.util import numpy_support
+
+from furyweb import mesh_cache
+
+
+def instance_cells(prim_actor, n_instances):
+    """Cells of a primitive actor, one row of triangles per instance."""
+    polys = prim_actor.GetMapper().GetInput().GetPolys()
+    # GetData is the legacy [3, i, j, k] layout, whatever the VTK version
+    legacy = numpy_support.vtk_to_numpy(polys.GetData()).reshape(-1, 4)
+    cells = mesh_cache.cells_from_triangles(legacy[:, 1:])
+    return cells.reshape(n_instances, -1)
+
+
+def draw_instances(prim_actor, cells, index):
+    """Keep the triangles of the instances of index (None: all)."""
+    if index is not None:
+        cells = cells[index]
+    prim_actor.GetMapper().GetInput().SetPolys(mesh_cache.cell_array(
+        cells.reshape(-1, 4 if mesh_cache.LEGACY_CELLS else 3)))
+
+
+def frustum_planes(renderer):
+    """Inward normals (6, 3) and offsets (6,) of the view frustum planes."""
+    planes = [0.] * 24
+    renderer.GetActiveCamera().GetFrustumPlanes(
+        renderer.GetTiledAspectRatio(), planes)
+    planes = np.array(planes).reshape(6, 4)
+    return planes[:, :3], planes[:, 3]
+
+
+def classify_boxes(low, high, normals, offsets):
+    """Return the (outside, inside) masks of axis aligned boxes.
+
+    A box is outside when beyond one of the planes, inside when within all
+    of them; boxes neither outside nor inside cross the frustum.
+    """
+    distances = ((low + high) / 2).dot(normals.T) + offsets
+    reach = ((high - low) / 2).dot(np.abs(normals).T)
+    return (distances < -reach).any(axis=1), (distances >= reach).all(axis=1)
+
+
+def projected_pixels(renderer, centers, radii):
+    """Projected diameter, in pixels, of spheres."""
+    camera = renderer.GetActiveCamera()
+    height = renderer.GetSize()[1]
+    if camera.GetParallelProjection():
+        return radii * height / camera.GetParallelScale()
+    direction = np.array(camera.GetDirectionOfProjection())
+    depth = (centers - camera.GetPosition()).dot(direction)
+    half_angle = np.radians(camera.GetViewAngle()) / 2
+    return radii * height / (np.maximum(depth, 1e-9) * np.tan(half_angle))
+
+
+class InstanceCuller(object):
+    """Draw only the visible instances of primitive actors.
+
+    Parameters
+    ----------
+    actors : list of vtkActor
+        Actors built by fury from the same centers (e.g. an sdf actor and
+        its billboard preview).
+    n_instances : int
+        Number of instances of each actor.
+    grid_size : int, optional
+        Number of grid cells along each axis.
+    min_pixels : float, optional
+        Instances whose projected diameter is smaller than this number of
+        pixels are not drawn.
+    on_update : callable, optional
+        Called with the ``stats`` dict after each culling.
+    """
+
+    def __init__(self, actors, n_instances, grid_size=32, min_pixels=1.,
+                 on_update=None):
+        self.actors = actors
+        self.n_instances = n_instances
+        self.grid_size = grid_size
+        self.min_pixels = min_pixels
+        self.on_update = on_update
+        self.cells = [instance_cells(prim_actor, n_instances)
+                      for prim_actor in actors]
+        self.stats = {'drawnInstances': n_instances, 'culledInstances': 0,
+                      'subpixelInstances': 0, 'cullSeconds': 0.}
+        self._grid = None
+        self._view_state = None
+        self._visible = None
+
+    def attach(self, renderer):
+        """Cull before each render of the renderer."""
+        renderer.AddObserver('StartEvent',
+                             lambda obj, event: self.update(obj))
+
+    def invalidate(self):
+        """Rebuild the grid on the next render, once instances moved."""
+        self._grid = None
+
+    def _build_grid(self):
+        points = self.actors[0].GetMapper().GetInput().GetPoints()
+        positions = numpy_support.vtk_to_numpy(points.GetData()).reshape(
+            self.n_instances, -1, 3)
+        centers = positions.mean(axis=1)
+        radii = np.sqrt(((positions - centers[:, None]) ** 2).sum(-1)).max(1)
+
+        low, high = centers.min(axis=0), centers.max(axis=0)
+        size = np.maximum((high - low) / self.grid_size, 1e-9)
+        ijk = np.minimum(((centers - low) / size).astype(np.int64),
+                         self.grid_size - 1)
+        cell_ids = np.ravel_multi_index(ijk.T, (self.grid_size,) * 3)
+        order = np.argsort(cell_ids, kind='stable')
+        _, starts, counts = np.unique(cell_ids[order], return_index=True,
+                                      return_counts=True)
+
+        # Bounds of the instances of each occupied cell
+        extent = radii[order, None]
+        self._grid = {
+            'centers': centers, 'radii': radii, 'order': order,
+            'counts': counts,
+            'low': np.minimum.reduceat(centers[order] - extent, starts),
+            'high': np.maximum.reduceat(centers[order] + extent, starts)}
+
+    def update(self, renderer):
+        """Cull the instances for the current camera of renderer."""
+        camera = renderer.GetActiveCamera()
+        width, height = renderer.GetSize()
+        view_state = (camera.GetMTime(), width, height)
+        if self._grid is not None and view_state == self._view_state:
+            return
+        start = time.time()
+        if self._grid is None:
+            self._build_grid()
+        self._view_state = view_state
+        grid = self._grid
+
+        normals, offsets = frustum_planes(renderer)
+        outside, inside = classify_boxes(grid['low'], grid['high'],
+                                         normals, offsets)
+
+        def instances(cell_mask):
+            # The instances are sorted by cell
+            return grid['order'][np.repeat(cell_mask, grid['counts'])]
+
+        crossing = instances(~outside & ~inside)
+        in_frustum = (grid['centers'][crossing].dot(normals.T) + offsets >=
+                      -grid['radii'][crossing, None]).all(axis=1)
+        visible = np.concatenate([instances(inside), crossing[in_frustum]])
+
+        large = projected_pixels(renderer, grid['centers'][visible],
+                                 grid['radii'][visible]) >= self.min_pixels
+        visible = np.sort(visible[large])
+
+        if self._visible is None or not np.array_equal(visible,
+                                                       self._visible):
+            self._visible = visible
+            for prim_actor, cells in zip(self.actors, self.cells):
+                draw_instances(prim_actor, cells, visible)
+
+        self.stats = {'drawnInstances': len(visible),
+                      'culledInstances': self.n_instances - len(visible),
+                      'subpixelInstances': int((~large).sum()),
+                      'cullSeconds': time.time() - start}
+        if self.on_update:
+            self.on_update(self.stats)
@@ -0,0 +1,178 @@
+r"""
+Choice between image push and geometry sync for each view.
+
+Pushing images costs bytes in proportion to the pixels of every frame and
+a server render per frame, sending the geometry costs the instance arrays
+once and nothing while the client orbits. ``DeliveryPolicy`` estimates, for
+``window`` seconds of interaction, the transfer and render time of both
+modes from the actors of the ``FuryGeometryDelivery`` and the frame sizes,
+render times and round trips measured by the image delivery, and picks the
+cheapest one. Switching needs the other mode to be cheaper by a
+``hysteresis`` factor.
+
+Only views of clients able to render locally take part, they register with
+``fury.delivery.register``. The choice is made again whenever the bytes
+of the instance arrays or the size of the view change (e.g. a new tumor
+frame). Mode changes are published on ``fury.delivery.subscription`` and
+logged with their inputs, the last decisions are returned by
+``fury.delivery.decisions``. No image is pushed to a view in geometry
+mode, even once it is observed again by the image delivery.
+"""
+import collections
+import time
+
+from vtk.web import protocols as vtk_protocols
+from wslink import register as exportRpc
+
+IMAGE = 'image'
+GEOMETRY = 'geometry'
+
+# JPEG frame size estimate before any frame is measured
+JPEG_BYTES_PER_PIXEL = .15
+
+
+class DeliveryPolicy(vtk_protocols.vtkWebProtocol):
+    """Pick image push or geometry sync per view.
+
+    Parameters
+    ----------
+    image_delivery : vtkWebPublishImageDelivery
+    geometry_delivery : FuryGeometryDelivery
+    window : float, optional
+        Seconds of interaction the costs are estimated over.
+    hysteresis : float, optional
+        Relative gain needed to switch mode.
+    max_local_instances : int, optional
+        Larger scenes are never rendered by the clients.
+    default_bandwidth : float, optional
+        Bytes per second assumed until round trips are measured.
+    """
+
+    def __init__(self, image_delivery, geometry_delivery, window=10.,
+                 hysteresis=.25, max_local_instances=5000000,
+                 default_bandwidth=10e6):
+        super(DeliveryPolicy, self).__init__()
+        self.image_delivery = image_delivery
+        self.geometry_delivery = geometry_delivery
+        self.window = window
+        self.hysteresis = hysteresis
+        self.max_local_instances = max_local_instances
+        self.default_bandwidth = default_bandwidth
+        self.views = {}
+        self.decisions = collections.deque(maxlen=64)
+        self._observer = None
+        # Checked by every push, whatever the image delivery tracks
+        image_delivery.registerPushFilter(
+            lambda vId: self.mode(vId) == IMAGE)
+
+    def mode(self, vId):
+        """Mode of a view, image push for the views not registered."""
+        return self.views.get(vId, {}).get('mode', IMAGE)
+
+    def inputs(self, vId):
+        """Measured and estimated values the costs are computed from."""
+        width, height = self.getView(vId).GetSize()
+        metrics = self.image_delivery.metrics.view(vId)
+        frames = metrics.counters['framesPublished']
+        if frames:
+            frame_bytes = metrics.counters['bytesSent'] / float(frames)
+        else:
+            frame_bytes = width * height * JPEG_BYTES_PER_PIXEL
+        rtt = self.image_delivery.trackingViews.get(vId, {}).get('rtt', 0)
+        instances, geometry_bytes = self.geometry_delivery.estimate()
+        return {'width': width, 'height': height,
+                'frameBytes': frame_bytes,
+                'frameBytesMeasured': bool(frames),
+                'renderSeconds': metrics.histograms['render'].percentile(50),
+                'encodeSeconds': metrics.histograms['encode'].percentile(50),
+                'fps': self.image_delivery.maxFrameRate,
+                'bandwidth': frame_bytes / rtt if frames and rtt
+                else self.default_bandwidth,
+                'bandwidthMeasured': bool(frames and rtt),
+                'instances': instances,
+                'geometryBytes': geometry_bytes}
+
+    def costs(self, inputs):
+        """Seconds spent by each mode over the interaction window."""
+        frames = inputs['fps'] * self.window
+        image = frames * max(inputs['frameBytes'] / inputs['bandwidth'],
+                             inputs['renderSeconds'] + inputs['encodeSeconds'])
+        geometry = inputs['geometryBytes'] / inputs['bandwidth']
+        return {IMAGE: image, GEOMETRY: geometry}
+
+    def _key(self, vId):
+        # Not the compressed estimate, it changes with every array sent
+        return (self.geometry_delivery.raw_bytes(),
+                tuple(self.getView(vId).GetSize()))
+
+    def evaluate(self, vId, reason):
+        """Choose the mode of a view, apply and log the decision."""
+        state = self.views[vId]
+        state['key'] = self._key(vId)
+        inputs = self.inputs(vId)
+        costs = self.costs(inputs)
+        current = state['mode']
+        other = GEOMETRY if current == IMAGE else IMAGE
+        if inputs['instances'] > self.max_local_instances:
+            mode, why = IMAGE, 'too many instances for the client'
+        elif not inputs['instances']:
+            mode, why = IMAGE, 'no instances to send'
+        elif costs[other] * (1 + self.hysteresis) < costs[current]:
+            mode, why = other, 'cheaper'
+        else:
+            mode, why = current, 'not cheaper by %d%%' % (
+                100 * self.hysteresis)
+
+        decision = {'id': vId, 'mode': mode, 'previousMode': current,
+                    'reason': reason, 'why': why, 'time': time.time(),
+                    'costs': costs, 'inputs': inputs}
+        self.decisions.append(decision)
+        self.image_delivery.metrics.view(vId).set_gauge(
+            'geometryDelivery', int(mode == GEOMETRY))
+        if mode == current:
+            return decision
+
+        print('Delivery of view {0}: {1} ({2}, {3}), image {4:.3f}s, '
+              'geometry {5:.3f}s, inputs {6}'.format(
+                  vId, mode, reason, why, costs[IMAGE], costs[GEOMETRY],
+                  inputs))
+        state['mode'] = mode
+        if mode == IMAGE and vId in self.image_delivery.trackingViews:
+            self.image_delivery.requestRender(vId)
+        self.publish('fury.delivery.subscription', decision)
+        return decision
+
+    def evaluateChanged(self):
+        """Choose again for the views whose scene or size changed."""
+        for vId, state in self.views.items():
+            if state['key'] != self._key(vId):
+                self.evaluate(vId, 'scene changed')
+
+    @exportRpc("fury.delivery.register")
+    def register(self, viewId='-1'):
+        """Let the policy choose the mode of a view of this client."""
+        sView = self.getView(viewId)
+        if not sView:
+            return {'error': 'Unable to get view with id %s' % viewId}
+
+        realViewId = str(self.getGlobalId(sView))
+        self.views.setdefault(realViewId, {'mode': IMAGE, 'key': None})
+        if self._observer is None:
+            self._observer = self.getApplication().AddObserver(
+                'UpdateEvent', lambda *args: self.evaluateChanged())
+        return self.evaluate(realViewId, 'registered')
+
+    @exportRpc("fury.delivery.unregister")
+    def unregister(self, viewId='-1'):
+        sView = self.getView(viewId)
+        if sView:
+            realViewId = str(self.getGlobalId(sView))
+            state = self.views.pop(realViewId, None)
+            if state and state['mode'] == GEOMETRY and \
+                    realViewId in self.image_delivery.trackingViews:
+                self.image_delivery.requestRender(realViewId)
+        return {'result': 'success'}
+
+    @exportRpc("fury.delivery.decisions")
+    def getDecisions(self):
+        return list(self.decisions)
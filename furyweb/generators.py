@@ -0,0 +1,303 @@
+r"""
+Deterministic synthetic scenes for the servers and the benchmarks.
+
+The points are generated by blocks of ``BLOCK_SIZE``, each from its own
+random state seeded with ``(seed, block)``: a scene only depends on its
+size, distribution and seed, not on the chunk size used to produce it, and
+chunks of a 100M points scene are generated one at a time without ever
+holding the whole scene in memory. Distributions:
+
+- ``uniform``: in a cube of side ``extent``,
+- ``clustered``: gaussian blobs around ``CLUSTERS`` random centers,
+- ``shell``: in a thin spherical shell of diameter ``extent``.
+
+Each point has a center, a color (uint8), a scale, a direction and an sdf
+primitive type code. Write a scene (structured ``.npy``, memory-mapped by
+:func:`furyweb.primitive_io.load_primitives`) or a synthetic PhysiCell
+output directory for the tumor application with::
+
+    $ python furyweb/generators.py points scene.npy --n-points 100000000 \
+        --distribution clustered --seed 1
+    $ python furyweb/generators.py physicell output --n-cells 1000000 \
+        --frames 10
+"""
+import argparse
+import os
+import struct
+import xml.etree.ElementTree as ET
+
+import numpy as np
+
+DISTRIBUTIONS = ('uniform', 'clustered', 'shell')
+FIELDS = ('centers', 'colors', 'scales', 'directions', 'primitives')
+BLOCK_SIZE = 1 << 16
+CLUSTERS = 32
+CLUSTER_SPREAD = .03   # of the extent
+SHELL_THICKNESS = .05  # of the radius
+
+# sphere, ellipsoid and torus codes of primitive_io.PRIMITIVE_CODES
+_SDF_CODES = np.array([1, 3, 2], dtype=np.uint8)
+
+_POINT_DTYPE = np.dtype([('centers', '<f4', (3,)), ('colors', 'u1', (3,)),
+                         ('scales', '<f4'), ('directions', '<f4', (3,)),
+                         ('primitives', 'u1')])
+
+
+def add_arguments(parser):
+    """Add the synthetic scene options to the server argument parser."""
+    parser.add_argument("--n-points", default=10000, type=int,
+                        dest="n_points",
+                        help="number of generated primitives.")
+    parser.add_argument("--distribution", default="uniform",
+                        choices=DISTRIBUTIONS, dest="distribution",
+                        help="spatial distribution of the primitives.")
+    parser.add_argument("--seed", default=0, type=int, dest="seed",
+                        help="seed of the generated scene.")
+
+
+def _points_block(rng, size, distribution, extent, clusters):
+    if distribution == 'uniform':
+        centers = extent * rng.rand(size, 3) - extent / 2
+    elif distribution == 'clustered':
+        which = rng.randint(len(clusters), size=size)
+        centers = clusters[which] + rng.normal(
+            scale=CLUSTER_SPREAD * extent, size=(size, 3))
+    elif distribution == 'shell':
+        centers = rng.normal(size=(size, 3))
+        centers /= np.maximum(np.linalg.norm(centers, axis=1), 1e-12)[:, None]
+        centers *= extent / 2 * (1 - SHELL_THICKNESS * rng.rand(size))[:, None]
+    else:
+        raise ValueError('Unknown distribution {0!r}, expected one of {1}'
+                         .format(distribution, ', '.join(DISTRIBUTIONS)))
+    return {'centers': centers.astype(np.float32),
+            'colors': (255 * rng.rand(size, 3)).astype(np.uint8),
+            'scales': rng.rand(size).astype(np.float32),
+            'directions': rng.rand(size, 3).astype(np.float32),
+            'primitives': _SDF_CODES[rng.randint(len(_SDF_CODES), size=size)]}
+
+
+def point_chunks(n_points, distribution='uniform', seed=0,
+                 chunk_size=1 << 20, extent=100., fields=FIELDS):
+    """Yield the points by chunks, dicts of arrays of the given fields.
+
+    The chunk size is rounded up to a multiple of ``BLOCK_SIZE``.
+    """
+    clusters = extent * np.random.RandomState(seed).rand(CLUSTERS, 3) - \
+        extent / 2
+    blocks_per_chunk = max(1, -(-chunk_size // BLOCK_SIZE))
+    n_blocks = -(-n_points // BLOCK_SIZE)
+    for first in range(0, n_blocks, blocks_per_chunk):
+        blocks = []
+        for block in range(first, min(first + blocks_per_chunk, n_blocks)):
+            size = min(BLOCK_SIZE, n_points - block * BLOCK_SIZE)
+            rng = np.random.RandomState([seed, block])
+            blocks.append(_points_block(rng, size, distribution, extent,
+                                        clusters))
+        yield {name: np.concatenate([points[name] for points in blocks])
+               for name in fields}
+
+
+def generate_points(n_points, distribution='uniform', seed=0, extent=100.,
+                    fields=FIELDS):
+    """Return the dict of arrays of a whole scene."""
+    points = None
+    start = 0
+    for chunk in point_chunks(n_points, distribution, seed, extent=extent,
+                              fields=fields):
+        if points is None:
+            points = {name: np.empty((n_points,) + array.shape[1:],
+                                     dtype=array.dtype)
+                      for name, array in chunk.items()}
+        size = len(next(iter(chunk.values())))
+        for name, array in chunk.items():
+            points[name][start:start + size] = array
+        start += size
+    return points
+
+
+def save_points(path, n_points, distribution='uniform', seed=0,
+                chunk_size=1 << 20, extent=100.):
+    """Write a scene as a structured ``.npy``, one chunk at a time."""
+    points = np.lib.format.open_memmap(path, mode='w+', dtype=_POINT_DTYPE,
+                                       shape=(n_points,))
+    start = 0
+    for chunk in point_chunks(n_points, distribution, seed, chunk_size,
+                              extent):
+        size = len(chunk['centers'])
+        for name, array in chunk.items():
+            points[name][start:start + size] = array
+        start += size
+        points.flush()
+    del points
+
+
+# =============================================================================
+# PhysiCell output
+# =============================================================================
+
+# Cell data labels (name, columns) of PhysiCell 1.7 outputs
+PHYSICELL_LABELS = (
+    ('ID', 1), ('position', 3), ('total_volume', 1), ('cell_type', 1),
+    ('cycle_model', 1), ('current_phase', 1), ('elapsed_time_in_phase', 1),
+    ('nuclear_volume', 1), ('cytoplasmic_volume', 1), ('fluid_fraction', 1),
+    ('calcified_fraction', 1), ('orientation', 3), ('polarity', 1),
+    ('migration_speed', 1), ('motility_vector', 3), ('migration_bias', 1),
+    ('motility_bias_direction', 3), ('persistence_time', 1),
+    ('motility_reserved', 1), ('oncoprotein', 1), ('elastic coefficient', 1),
+    ('kill rate', 1), ('attachment lifetime', 1), ('attachment rate', 1))
+_COLUMNS = {}
+_column = 0
+for _name, _size in PHYSICELL_LABELS:
+    _COLUMNS[_name] = _column if _size == 1 else slice(_column,
+                                                       _column + _size)
+    _column += _size
+PHYSICELL_COLUMNS = _column
+
+CELL_VOLUME = 2494.   # cubic microns, the PhysiCell default
+FRAME_MINUTES = 60.
+
+# MAT-file level 5 data types and classes
+_MI_INT8, _MI_INT32, _MI_UINT32, _MI_DOUBLE, _MI_MATRIX = 1, 5, 6, 9, 14
+_MX_DOUBLE_CLASS = 6
+
+
+def _write_mat_header(f, name, rows, columns):
+    """Start a MAT-file holding a single (rows, columns) double matrix.
+
+    The matrix data, in column-major order, is written after the header.
+    """
+    name = name.encode('ascii')
+    padded_name = name + b'\0' * (-len(name) % 8)
+    data_bytes = 8 * rows * columns
+    matrix_bytes = 16 + 16 + 8 + len(padded_name) + 8 + data_bytes
+    if matrix_bytes >= 1 << 32:
+        raise ValueError('{0} values do not fit in a MAT-file level 5 '
+                         'matrix'.format(rows * columns))
+    text = 'MATLAB 5.0 MAT-file, written by furyweb.generators'
+    f.write(text.encode('ascii').ljust(116, b' '))
+    f.write(b'\0' * 8 + struct.pack('<H', 0x0100) + b'IM')
+    f.write(struct.pack('<II', _MI_MATRIX, matrix_bytes))
+    f.write(struct.pack('<IIII', _MI_UINT32, 8, _MX_DOUBLE_CLASS, 0))
+    f.write(struct.pack('<IIii', _MI_INT32, 8, rows, columns))
+    f.write(struct.pack('<II', _MI_INT8, len(name)) + padded_name)
+    f.write(struct.pack('<II', _MI_DOUBLE, data_bytes))
+
+
+def _physicell_xml(path, frame, cells_file, n_cells):
+    root = ET.Element('MultiCellDS', version='0.5',
+                      type='snapshot/simulation')
+    metadata = ET.SubElement(root, 'metadata')
+    ET.SubElement(metadata, 'current_time', units='min').text = \
+        '{0:f}'.format(frame * FRAME_MINUTES)
+    ET.SubElement(metadata, 'current_runtime', units='sec').text = \
+        '{0:f}'.format(0.)
+    custom = ET.SubElement(ET.SubElement(ET.SubElement(ET.SubElement(
+        root, 'cellular_information'), 'cell_populations'),
+        'cell_population', type='individual'), 'custom')
+    data = ET.SubElement(custom, 'simplified_data', type='matlab',
+                         source='PhysiCell')
+    labels = ET.SubElement(data, 'labels')
+    index = 0
+    for name, size in PHYSICELL_LABELS:
+        ET.SubElement(labels, 'label', index=str(index),
+                      size=str(size)).text = name
+        index += size
+    ET.SubElement(data, 'filename').text = cells_file
+    ET.ElementTree(root).write(path, xml_declaration=True, encoding='utf-8')
+
+
+def _cells_block(seed, frame, block, size, n_frames, radius):
+    # Cells keep their place in the spheroid from a frame to the next
+    rng = np.random.RandomState([seed, block])
+    directions = rng.normal(size=(size, 3))
+    directions /= np.maximum(np.linalg.norm(directions, axis=1),
+                             1e-12)[:, None]
+    depth = np.cbrt(rng.rand(size))
+    cell_type = (rng.rand(size) < .5).astype(np.float64)
+    oncoprotein = np.clip(rng.normal(1., .25, size), 0., 2.)
+    rng = np.random.RandomState([seed, block, frame])
+    growth = np.cbrt((frame + 1.) / n_frames)
+
+    cells = np.zeros((size, PHYSICELL_COLUMNS))
+    cells[:, _COLUMNS['ID']] = block * BLOCK_SIZE + np.arange(size)
+    cells[:, _COLUMNS['position']] = \
+        directions * (radius * growth * depth)[:, None] + \
+        rng.normal(scale=1., size=(size, 3))
+    volume = CELL_VOLUME * rng.uniform(.8, 1.2, size)
+    cells[:, _COLUMNS['total_volume']] = volume
+    cells[:, _COLUMNS['nuclear_volume']] = .2 * volume
+    cells[:, _COLUMNS['cytoplasmic_volume']] = .8 * volume
+    cells[:, _COLUMNS['cell_type']] = cell_type
+    # Live cells (cycle model 5), apoptotic (100) and a necrotic core (101)
+    necrotic = depth < .6 * (frame + 1.) / n_frames
+    apoptotic = ~necrotic & (rng.rand(size) < .02)
+    cells[:, _COLUMNS['cycle_model']] = np.where(
+        necrotic, 101, np.where(apoptotic, 100, 5))
+    cells[:, _COLUMNS['current_phase']] = cells[:, _COLUMNS['cycle_model']]
+    cells[:, _COLUMNS['oncoprotein']] = oncoprotein
+    cells[:, _COLUMNS['orientation']] = directions
+    return cells
+
+
+def save_physicell(path, n_cells, n_frames=1, seed=0, chunk_size=1 << 20):
+    """Write a synthetic PhysiCell output directory.
+
+    A tumor spheroid of n_cells cells growing over n_frames frames,
+    ``outputXXXXXXXX.xml`` with its ``outputXXXXXXXX_cells_physicell.mat``
+    for each frame, as read by the tumor application.
+    """
+    os.makedirs(path, exist_ok=True)
+    # Cells packed at about 70% in the final spheroid
+    radius = np.cbrt(n_cells * CELL_VOLUME / .7 * .75 / np.pi)
+    blocks_per_chunk = max(1, -(-chunk_size // BLOCK_SIZE))
+    n_blocks = -(-n_cells // BLOCK_SIZE)
+    for frame in range(n_frames):
+        prefix = 'output{0:08d}'.format(frame)
+        cells_file = prefix + '_cells_physicell.mat'
+        with open(os.path.join(path, cells_file), 'wb') as f:
+            _write_mat_header(f, 'cells', PHYSICELL_COLUMNS, n_cells)
+            for first in range(0, n_blocks, blocks_per_chunk):
+                chunk = [_cells_block(seed, frame, block,
+                                      min(BLOCK_SIZE,
+                                          n_cells - block * BLOCK_SIZE),
+                                      n_frames, radius)
+                         for block in range(first, min(first +
+                                                       blocks_per_chunk,
+                                                       n_blocks))]
+                # Rows of cells are the columns of the column-major matrix
+                f.write(np.concatenate(chunk).astype('<f8').tobytes())
+        _physicell_xml(os.path.join(path, prefix + '.xml'), frame,
+                       cells_file, n_cells)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Generate synthetic scenes and PhysiCell outputs.')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+    points = commands.add_parser('points', help='primitive scene (.npy)')
+    points.add_argument('output', help='.npy file to write')
+    add_arguments(points)
+    points.add_argument('--extent', default=100., type=float,
+                        help='size of the scene.')
+    physicell = commands.add_parser('physicell',
+                                    help='PhysiCell output directory')
+    physicell.add_argument('output', help='directory to write')
+    physicell.add_argument('--n-cells', default=100000, type=int)
+    physicell.add_argument('--frames', default=1, type=int)
+    physicell.add_argument('--seed', default=0, type=int)
+    for command in (points, physicell):
+        command.add_argument('--chunk-size', default=1 << 20, type=int,
+                             help='points generated at once.')
+    args = parser.parse_args(argv)
+
+    if args.command == 'points':
+        save_points(args.output, args.n_points, args.distribution, args.seed,
+                    args.chunk_size, args.extent)
+    else:
+        save_physicell(args.output, args.n_cells, args.frames, args.seed,
+                       args.chunk_size)
+
+
+if __name__ == '__main__':
+    main()
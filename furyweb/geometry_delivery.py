@@ -0,0 +1,233 @@
+r"""
+Client-side rendering of fury billboard actors.
+
+Instead of images, ``FuryGeometryDelivery`` sends the instance arrays of
+billboard actors (centers, colors and radii) so that the client draws them
+as spheres itself and orbits without any round trip to the server. The sdf
+actors are not delivered: their direction and primitive type need a ray
+marching the vtk.js clients do not have.
+
+Every array goes as a typed binary attachment, zlib compressed when that
+pays off, and is identified by the hash of its content: the client lists
+the hashes it holds in ``fury.geometry.get`` and only receives the missing
+arrays. Hashes the client evicts from its cache are reported with
+``fury.geometry.forget`` and sent with their data again. Once subscribed
+with ``fury.geometry.subscribe``, the arrays
+modified since the last update (moved or recolored instances, simulation
+steps) are pushed on ``fury.geometry.subscription`` after every
+``UpdateEvent`` of the application; arrays whose vtk modification time did
+not change are not even hashed again.
+"""
+import collections
+import hashlib
+import zlib
+
+import numpy as np
+from vtk.util import numpy_support
+from vtk.web import protocols as vtk_protocols
+from wslink import register as exportRpc
+
+# vtk point arrays of the billboard actors, by name of the sent array
+_INSTANCE_ARRAYS = (('centers', 'center'), ('colors', 'colors'))
+
+# Type of the sent arrays, one the clients build typed arrays of
+WIRE_DTYPES = {'centers': np.float32, 'radii': np.float32,
+               'colors': np.uint8}
+
+
+def array_hash(array):
+    return hashlib.blake2b(array.tobytes(), digest_size=16).hexdigest()
+
+
+def wire_array(name, values):
+    """Contiguous copy of an instance array in its type on the wire.
+
+    Raises a TypeError for non numeric arrays and a ValueError when
+    integer values do not fit in the wire type.
+    """
+    dtype = np.dtype(WIRE_DTYPES[name])
+    if values.dtype.kind not in 'biuf':
+        raise TypeError('Cannot send %s of type %s' % (name, values.dtype))
+    cast = np.ascontiguousarray(values, dtype=dtype)
+    if dtype.kind in 'iu' and values.dtype != dtype and \
+            not np.array_equal(cast, values):
+        raise ValueError('%s do not fit in %s' % (name, dtype.name))
+    return cast
+
+
+class _TrackedActor(object):
+    """Instance arrays of a fury actor, rebuilt when their vtk arrays change.
+    """
+
+    def __init__(self, name, prim_actor, n_instances):
+        self.name = name
+        self.actor = prim_actor
+        self.n_instances = n_instances
+        self.mtimes = {}
+        self.arrays = {}
+        self.hashes = {}
+
+    def _sources(self):
+        polydata = self.actor.GetMapper().GetInput()
+        point_data = polydata.GetPointData()
+        sources = {'positions': polydata.GetPoints().GetData()}
+        for name, vtk_name in _INSTANCE_ARRAYS:
+            vtk_array = point_data.GetArray(vtk_name)
+            if vtk_array is not None:
+                sources[name] = vtk_array
+        return sources
+
+    def instance_bytes(self):
+        """Bytes of the arrays sent for each instance."""
+        sources = self._sources()
+        total = 0
+        for name, vtk_array in sources.items():
+            if name == 'positions':
+                total += np.dtype(WIRE_DTYPES['radii']).itemsize
+            else:
+                total += vtk_array.GetNumberOfComponents() * \
+                    np.dtype(WIRE_DTYPES[name]).itemsize
+        return total
+
+    def refresh(self):
+        """Return the names of the arrays whose content changed."""
+        sources = self._sources()
+        changed = []
+        verts = sources['positions'].GetNumberOfTuples() // self.n_instances
+        for name, vtk_array in sources.items():
+            if self.mtimes.get(name) == vtk_array.GetMTime():
+                continue
+            self.mtimes[name] = vtk_array.GetMTime()
+            values = numpy_support.vtk_to_numpy(vtk_array)
+            if name == 'positions':
+                # Billboards only have their size in the vertex positions
+                values = values.reshape(self.n_instances, verts, 3)
+                name = 'radii'
+                values = np.abs(values - values.mean(axis=1)[:, None]).max(
+                    axis=(1, 2))
+            else:
+                values = values[::verts]
+            values = wire_array(name, values)
+            digest = array_hash(values)
+            if self.hashes.get(name) != digest:
+                self.arrays[name] = values
+                self.hashes[name] = digest
+                changed.append(name)
+        return changed
+
+
+class FuryGeometryDelivery(vtk_protocols.vtkWebProtocol):
+    """Send the instance arrays of billboard actors for client-side
+    rendering.
+
+    Parameters
+    ----------
+    compression_level : int, optional
+        zlib level of the compressed arrays (0: never compress).
+    min_gain : float, optional
+        Arrays are sent compressed only when it saves this fraction of
+        their size.
+    """
+
+    def __init__(self, compression_level=1, min_gain=.1):
+        super(FuryGeometryDelivery, self).__init__()
+        self.compression_level = compression_level
+        self.min_gain = min_gain
+        self.actors = collections.OrderedDict()
+        self.subscribed = False
+        self.client_hashes = set()
+        self.stats = {'arraysSent': 0, 'arraysDeduplicated': 0,
+                      'bytesSent': 0, 'rawBytes': 0}
+        self._observer = None
+
+    def add_actor(self, name, prim_actor, n_instances):
+        """Deliver the instances of a billboard actor."""
+        self.actors[name] = _TrackedActor(name, prim_actor, n_instances)
+
+    def raw_bytes(self):
+        """Bytes of the instance arrays of every actor, uncompressed."""
+        return sum(tracked.n_instances * tracked.instance_bytes()
+                   for tracked in self.actors.values())
+
+    def estimate(self):
+        """Number of instances and bytes to send them all, compressed as so
+        far."""
+        instances = sum(tracked.n_instances
+                        for tracked in self.actors.values())
+        ratio = float(self.stats['bytesSent']) / self.stats['rawBytes'] \
+            if self.stats['rawBytes'] else 1.
+        return instances, self.raw_bytes() * ratio
+
+    def _encode(self, array):
+        raw = array.tobytes()
+        data, compression = raw, None
+        if self.compression_level and len(raw) > 1024:
+            compressed = zlib.compress(raw, self.compression_level)
+            if len(compressed) <= (1 - self.min_gain) * len(raw):
+                data, compression = compressed, 'zlib'
+        self.stats['bytesSent'] += len(data)
+        self.stats['rawBytes'] += len(raw)
+        return self.addAttachment(data), compression
+
+    def _describe(self, tracked, names, known):
+        arrays = {}
+        for name in names:
+            array = tracked.arrays[name]
+            digest = tracked.hashes[name]
+            description = {'hash': digest, 'dtype': array.dtype.name,
+                           'shape': list(array.shape)}
+            if digest in known:
+                self.stats['arraysDeduplicated'] += 1
+            else:
+                description['data'], description['compression'] = \
+                    self._encode(array)
+                known.add(digest)
+                self.stats['arraysSent'] += 1
+            arrays[name] = description
+        return {'name': tracked.name, 'count': tracked.n_instances, 'arrays': arrays}
+
+    @exportRpc("fury.geometry.get")
+    def getGeometry(self, known=None):
+        """Every actor, with the data of the arrays not in known hashes."""
+        self.client_hashes = set(known or [])
+        actors = []
+        for tracked in self.actors.values():
+            tracked.refresh()
+            actors.append(self._describe(tracked, sorted(tracked.arrays),
+                                         self.client_hashes))
+        return {'actors': actors}
+
+    @exportRpc("fury.geometry.forget")
+    def forget(self, hashes):
+        """Hashes evicted by the client, sent with their data from now on."""
+        self.client_hashes.difference_update(hashes)
+        return {'forgotten': len(hashes)}
+
+    @exportRpc("fury.geometry.subscribe")
+    def subscribe(self, enabled=True):
+        """Push the modified arrays after each update of the scene."""
+        self.subscribed = enabled
+        if enabled and self._observer is None:
+            self._observer = self.getApplication().AddObserver(
+                'UpdateEvent', lambda *args: self.pushUpdates())
+        elif not enabled and self._observer is not None:
+            self.getApplication().RemoveObserver(self._observer)
+            self._observer = None
+        return {'subscribed': enabled}
+
+    def pushUpdates(self):
+        if not self.subscribed:
+            return
+        actors = []
+        for tracked in self.actors.values():
+            changed = tracked.refresh()
+            if changed:
+                actors.append(self._describe(tracked, changed,
+                                             self.client_hashes))
+        if actors:
+            self.publish('fury.geometry.subscription', {'actors': actors})
+
+    @exportRpc("fury.geometry.stats")
+    def getStats(self):
+        return dict(self.stats, actors=len(self.actors),
+                    subscribed=self.subscribed)
@@ -0,0 +1,794 @@
+r"""
+Publish-based image delivery shared by the FURY/Web application servers.
+
+This is a fork of ``vtk.web.protocols.vtkWebPublishImageDelivery`` that adds
+client-acknowledged flow control on top of the upstream protocol. Once a
+client enables it through ``viewport.image.push.flow``, every published frame
+carries a ``frameId`` that the client acknowledges with
+``viewport.image.push.ack``. The server keeps at most ``maxFramesInFlight``
+unacknowledged frames per view; renders requested while the view is out of
+credits are dropped and a single render of the latest state is pushed as
+soon as a credit comes back. The measured round-trip time caps the animation
+frame rate.
+
+While a view is interacting, an adaptive controller keeps the frame time
+within ``interactiveFrameBudget`` milliseconds by walking down
+``qualityLevels``: the image ratio is lowered first, then the JPEG quality.
+The levels are driven by a moving average of the measured ``workTime`` and
+are echoed back in every pushed frame so the client can upscale.
+
+Rendering is progressive: applications register "fast" and "full" render
+state hooks with ``registerRenderStateHooks`` (turning transparency ordering
+off, swapping in LOD actors, ...). The fast state is applied while the view
+interacts and is kept until the view has been idle for
+``idleRefinementDelay`` seconds; a single full-quality still then replaces
+the last preview frame.
+
+Renders are never issued directly from observers or RPCs. They go through a
+per-view ``RenderScheduler`` so that every request made before the view's
+timer fires is merged into a single ``StillRenderToBuffer`` call, with
+interaction frames taking precedence over stale refinements and idle
+updates. Size changes sent by the client are debounced for
+``resizeDebounce`` seconds and applied before a single render.
+
+Render, encode and publish latencies, bytes sent, dropped frames and the
+achieved frame rate of every view are kept in a ``MetricsRegistry``
+available through ``viewport.metrics.get``.
+"""
+import base64
+import collections
+import time
+
+from vtk.web import protocols as vtk_protocols
+from wslink import register as exportRpc
+
+from furyweb.metrics import MetricsRegistry
+from furyweb.render_scheduler import RenderScheduler
+
+# import Twisted reactor for later callback
+from twisted.internet import reactor, task
+
+
+class vtkWebPublishImageDelivery(vtk_protocols.vtkWebProtocol):
+    def __init__(self, decode=True, maxFramesInFlight=2, metricsLabels=None):
+        super(vtkWebPublishImageDelivery, self).__init__()
+        self.trackingViews = {}
+        self.metrics = MetricsRegistry(metricsLabels)
+        self.scheduler = RenderScheduler(self.renderView)
+        self.deltaStaleTimeBeforeRender = 0.5  # 0.5s
+        self.resizeDebounce = 0.1  # 0.1s
+        self.maxResizeRetries = 5  # a size the window clamps is never taken
+        self.decode = decode
+        self.viewsInAnimations = []
+        self.targetFrameRate = 30.0
+        self.minFrameRate = 12.0
+        self.maxFrameRate = 30.0
+        # Flow control
+        self.maxFramesInFlight = maxFramesInFlight
+        self.ackTimeout = 2.0  # frames not acknowledged after 2s are lost
+        self.rttSmoothing = 0.2
+        self.viewsFlowControl = {}
+        # Adaptive interactive quality, as (ratio, quality) from best to worst
+        self.adaptiveQuality = True
+        self.interactiveFrameBudget = 1000.0 / self.maxFrameRate  # ms
+        self.workTimeWindow = 5
+        self.qualityLevels = [(1.0, 100), (0.75, 100), (0.5, 100),
+                              (0.5, 70), (0.5, 50), (0.35, 40), (0.25, 30)]
+        # Progressive refinement
+        self.progressive = True
+        self.idleRefinementDelay = 0.3  # 0.3s
+        self.renderStateHooks = []
+        # Callables (vId) -> bool, no image is pushed when one is False
+        self.pushFilters = []
+
+    def hasFrameCredit(self, vId):
+        """Return True if a new frame can be published for the view.
+
+        Frames that were never acknowledged within ``ackTimeout`` are
+        considered lost and give their credit back.
+        """
+        viewInfo = self.trackingViews[vId]
+        if not viewInfo["flowControl"]:
+            return True
+
+        inFlight = viewInfo["inFlight"]
+        now = time.time()
+        for frameId in [fId for fId, sendTime in inFlight.items()
+                        if now - sendTime > self.ackTimeout]:
+            del inFlight[frameId]
+
+        return len(inFlight) < viewInfo["maxFramesInFlight"]
+
+    def getAnimationFrameRate(self):
+        """Target frame rate capped by what the slowest client can absorb.
+
+        With N frames allowed in flight, a client can not consume more than
+        N frames per round-trip time.
+        """
+        frameRate = self.targetFrameRate
+        for vId in self.viewsInAnimations:
+            viewInfo = self.trackingViews.get(vId)
+            if not viewInfo or not viewInfo["flowControl"] \
+                    or not viewInfo["rtt"]:
+                continue
+            frameRate = min(frameRate,
+                            viewInfo["maxFramesInFlight"] / viewInfo["rtt"])
+        return max(frameRate, 1.0)
+
+    def getRenderLevel(self, vId, fullQuality=False):
+        """Return the (ratio, quality) to render the view with.
+
+        The ratio and quality requested by the client are upper bounds that
+        the adaptive controller lowers while the view is interacting; a
+        full-quality frame only lifts that adaptive downgrade.
+        """
+        viewInfo = self.trackingViews[vId]
+        ratio = viewInfo["ratio"]
+        quality = viewInfo["quality"]
+        if fullQuality:
+            return ratio, quality
+
+        if self.adaptiveQuality and viewInfo["interacting"]:
+            levelRatio, levelQuality = \
+                self.qualityLevels[viewInfo["qualityLevel"]]
+            ratio *= levelRatio
+            quality = min(quality, levelQuality)
+
+        return ratio, quality
+
+    def updateQualityLevel(self, vId, workTime):
+        """Move the interactive quality level to fit the frame budget."""
+        viewInfo = self.trackingViews[vId]
+        if not self.adaptiveQuality or not viewInfo["interacting"]:
+            return
+
+        workTimes = viewInfo["workTimes"]
+        workTimes.append(workTime)
+        if len(workTimes) < workTimes.maxlen:
+            return
+
+        averageWorkTime = sum(workTimes) / len(workTimes)
+        level = viewInfo["qualityLevel"]
+        if averageWorkTime > self.interactiveFrameBudget and \
+                level < len(self.qualityLevels) - 1:
+            level += 1
+        elif averageWorkTime < 0.5 * self.interactiveFrameBudget and \
+                level > 0:
+            level -= 1
+
+        if level != viewInfo["qualityLevel"]:
+            viewInfo["qualityLevel"] = level
+            # Measure the new level on its own frames only
+            workTimes.clear()
+
+    def requestRender(self, vId, priority=RenderScheduler.IDLE, delay=0):
+        """Ask for an image of the view to be pushed.
+
+        The request is merged with any render already scheduled for the
+        view. Animated views are left to their next animation frame.
+        """
+        if vId not in self.trackingViews:
+            return
+
+        if vId in self.viewsInAnimations:
+            return
+
+        # The debounced resize will push the latest state at the new size
+        if self.isResizePending(vId):
+            return
+
+        self.scheduler.request(vId, priority, delay)
+
+    def renderView(self, vId, priority):
+        """Scheduler callback pushing a single image of the view."""
+        if vId not in self.trackingViews:
+            return
+
+        frameStartTime = time.time()
+        refineTime = self.trackingViews[vId]["refineTime"]
+        fullQuality = refineTime is not None and frameStartTime >= refineTime
+        viewMetrics = self.metrics.view(vId)
+        if fullQuality:
+            self.trackingViews[vId]["refineTime"] = None
+            self.setRenderState(vId, fast=False)
+            self.getApplication().InvalidateCache(self.getView(vId))
+            viewMetrics.increment('refinementRenders')
+        elif priority == RenderScheduler.STALE and refineTime is None:
+            viewMetrics.increment('staleRenders')
+
+        self.pushRender(vId, fullQuality)
+        self.updateSchedulerMetrics(vId)
+
+        if vId in self.viewsInAnimations:
+            self.scheduleAnimationFrame(vId, frameStartTime)
+        elif refineTime is not None and not fullQuality:
+            # Preview frame, the full one comes once the view is idle
+            self.scheduler.request(vId, RenderScheduler.STALE,
+                                   refineTime - time.time())
+
+    def registerRenderStateHooks(self, fast, full):
+        """Register callables switching the scene to its fast or full state.
+
+        Both are called with the view (render window) whenever its render
+        state changes; ``fast`` when an interaction starts and ``full``
+        right before the idle refinement frame.
+        """
+        self.renderStateHooks.append((fast, full))
+
+    def registerPushFilter(self, pushFilter):
+        """Only push the images of the views pushFilter(vId) accepts.
+
+        Unlike the ``enabled`` flag of the tracked views, the filters still
+        apply to views observed again after a reconnection.
+        """
+        self.pushFilters.append(pushFilter)
+
+    def setRenderState(self, vId, fast):
+        viewInfo = self.trackingViews[vId]
+        if viewInfo["fastRenderState"] == fast:
+            return
+
+        viewInfo["fastRenderState"] = fast
+        view = self.getView(vId)
+        for fastHook, fullHook in self.renderStateHooks:
+            if fast:
+                fastHook(view)
+            else:
+                fullHook(view)
+
+    def scheduleAnimationFrame(self, vId, frameStartTime):
+        nextAnimateTime = frameStartTime + 1.0 / self.getAnimationFrameRate()
+        nextAnimateTime -= time.time()
+
+        if self.targetFrameRate > self.maxFrameRate:
+            self.targetFrameRate = self.maxFrameRate
+
+        if nextAnimateTime < 0:
+            if nextAnimateTime < -1.0:
+                self.targetFrameRate = 1
+            if self.targetFrameRate > self.minFrameRate:
+                self.targetFrameRate -= 1.0
+            nextAnimateTime = 0.001
+        else:
+            if self.targetFrameRate < self.maxFrameRate and nextAnimateTime > 0.005:
+                self.targetFrameRate += 1.0
+
+        self.metrics.view(vId).target_frame_rate = \
+            self.getAnimationFrameRate()
+        self.scheduler.request(vId, RenderScheduler.INTERACTION,
+                               nextAnimateTime)
+
+    def updateSchedulerMetrics(self, vId):
+        stats = self.scheduler.getStats(vId)
+        viewMetrics = self.metrics.view(vId)
+        viewMetrics.set_counter('renderRequests', stats['requests'])
+        viewMetrics.set_counter('renders', stats['renders'])
+        viewMetrics.set_counter('mergedRenders', stats['merged'])
+
+    def pushRender(self, vId, fullQuality=False):
+        if vId not in self.trackingViews:
+            return
+
+        if not self.trackingViews[vId]["enabled"]:
+            return
+
+        if not all(pushFilter(vId) for pushFilter in self.pushFilters):
+            return
+
+        if not self.hasFrameCredit(vId):
+            # Drop this frame, the latest state is pushed on the next ack,
+            # or once the frames in flight expire if their acks are lost
+            viewInfo = self.trackingViews[vId]
+            viewInfo["pendingRender"] = True
+            self.metrics.view(vId).increment('framesDropped')
+            dropTimer = viewInfo["dropTimer"]
+            if dropTimer is None or not dropTimer.active():
+                viewInfo["dropTimer"] = reactor.callLater(
+                    self.ackTimeout, self.requestRender, vId)
+            return
+        self.trackingViews[vId]["pendingRender"] = False
+
+        if "originalSize" not in self.trackingViews[vId]:
+            view = self.getView(vId)
+            self.trackingViews[vId]["originalSize"] = list(view.GetSize())
+
+        if "ratio" not in self.trackingViews[vId]:
+            self.trackingViews[vId]["ratio"] = 1
+
+        ratio, quality = self.getRenderLevel(vId, fullQuality)
+        mtime = self.trackingViews[vId]["mtime"]
+        size = [int(s * ratio)
+                for s in self.trackingViews[vId]["originalSize"]]
+
+        reply = self.stillRender({"view": vId,
+                                  "mtime": mtime,
+                                  "quality": quality,
+                                  "size": size})
+        viewMetrics = self.metrics.view(vId)
+        viewMetrics.increment('stillRenderCalls', reply["renderCalls"])
+        viewMetrics.observe('render', reply["renderTime"])
+        viewMetrics.observe('encode', max(
+            reply["workTime"] / 1000.0 - reply["renderTime"], 0))
+        if reply["resized"]:
+            viewMetrics.increment('resizes')
+            if not reply["sizeConfirmed"]:
+                # The view did not take the size before rendering, render
+                # again once it did, a few times for each new size.
+                retries = self.trackingViews[vId]["resizeRetries"]
+                if retries[0] != size:
+                    retries[:] = [size, 0]
+                if retries[1] < self.maxResizeRetries:
+                    retries[1] += 1
+                    viewMetrics.increment('resizeExtraRenders')
+                    self.scheduler.request(vId)
+        self.updateQualityLevel(vId, reply["workTime"])
+        stale = reply["stale"]
+        if reply["image"]:
+            publishStartTime = time.time()
+            # depending on whether the app has encoding enabled:
+            if self.decode:
+                reply["image"] = base64.standard_b64decode(reply["image"])
+
+            imageSize = len(reply["image"])
+            reply["image"] = self.addAttachment(reply["image"])
+            reply["format"] = "jpeg"
+            # save mtime for next call.
+            self.trackingViews[vId]["mtime"] = reply["mtime"]
+            # echo back real ID, instead of -1 for 'active'
+            reply["id"] = vId
+            # levels used for this frame, so the client can upscale
+            reply["ratio"] = ratio
+            reply["quality"] = quality
+            reply["qualityLevel"] = self.trackingViews[vId]["qualityLevel"] \
+                if self.trackingViews[vId]["interacting"] else 0
+            self.trackingViews[vId]["frameId"] += 1
+            reply["frameId"] = self.trackingViews[vId]["frameId"]
+            if self.trackingViews[vId]["flowControl"]:
+                self.trackingViews[vId]["inFlight"][reply["frameId"]] = \
+                    time.time()
+            self.publish('viewport.image.push.subscription', reply)
+            publishEndTime = time.time()
+            viewMetrics.observe('publish', publishEndTime - publishStartTime)
+            viewMetrics.frame_published(imageSize, publishEndTime)
+        else:
+            # Nothing changed since the last pushed image
+            viewMetrics.increment('framesSkipped')
+        if stale:
+            self.scheduler.request(vId, RenderScheduler.STALE,
+                                   self.deltaStaleTimeBeforeRender)
+
+    @exportRpc("viewport.image.animation.fps.max")
+    def setMaxFrameRate(self, fps=30):
+        self.maxFrameRate = fps
+
+    @exportRpc("viewport.image.animation.fps.get")
+    def getCurrentFrameRate(self):
+        return self.targetFrameRate
+
+    @exportRpc("viewport.image.animation.start")
+    def startViewAnimation(self, viewId='-1'):
+        sView = self.getView(viewId)
+        realViewId = str(self.getGlobalId(sView))
+
+        if realViewId in self.viewsInAnimations:
+            return
+
+        if realViewId in self.trackingViews:
+            self.trackingViews[realViewId]["interacting"] = True
+            self.trackingViews[realViewId]["refineTime"] = None
+            if self.progressive:
+                self.setRenderState(realViewId, fast=True)
+
+        self.viewsInAnimations.append(realViewId)
+        self.scheduler.request(realViewId, RenderScheduler.INTERACTION)
+
+    @exportRpc("viewport.image.animation.stop")
+    def stopViewAnimation(self, viewId='-1'):
+        sView = self.getView(viewId)
+        realViewId = str(self.getGlobalId(sView))
+
+        if realViewId in self.viewsInAnimations:
+            self.viewsInAnimations.remove(realViewId)
+
+        viewInfo = self.trackingViews.get(realViewId)
+        if viewInfo and viewInfo["interacting"]:
+            viewInfo["interacting"] = False
+            viewInfo["workTimes"].clear()
+            # Replace the last degraded frame with a full-quality still
+            # once the view stays idle
+            if self.progressive:
+                viewInfo["refineTime"] = time.time() + self.idleRefinementDelay
+                self.requestRender(realViewId, RenderScheduler.STALE,
+                                   self.idleRefinementDelay)
+            elif self.adaptiveQuality:
+                viewInfo["refineTime"] = time.time()
+                self.requestRender(realViewId)
+
+    @exportRpc("viewport.image.push")
+    def imagePush(self, options):
+        sView = self.getView(options["view"])
+        realViewId = str(self.getGlobalId(sView))
+        # Make sure an image is pushed
+        self.getApplication().InvalidateCache(sView)
+        self.requestRender(realViewId)
+
+    def applyViewSize(self, view, size):
+        """Resize the view and return True if the new size is effective."""
+        if hasattr(view, 'SetSize'):
+            view.SetSize(size)
+        else:
+            view.ViewSize = size
+        return list(view.GetSize()[0:2]) == list(size)
+
+    def isResizePending(self, vId):
+        timer = self.trackingViews[vId]["resizeTimer"]
+        return timer is not None and timer.active()
+
+    def applyPendingSize(self, vId):
+        if vId not in self.trackingViews:
+            return
+
+        observerInfo = self.trackingViews[vId]
+        observerInfo["resizeTimer"] = None
+        observerInfo["originalSize"] = observerInfo.pop("pendingSize")
+        self.getApplication().InvalidateCache(self.getView(vId))
+        if vId in self.viewsInAnimations:
+            self.scheduler.request(vId, RenderScheduler.INTERACTION)
+        else:
+            self.requestRender(vId)
+
+    def getLastRenderTime(self, view):
+        """Time in seconds spent by the renderers of the view in the last
+        render, without the image capture and encoding."""
+        renderTime = 0
+        if not hasattr(view, 'GetRenderers'):
+            return renderTime
+        renderers = view.GetRenderers()
+        renderers.InitTraversal()
+        renderer = renderers.GetNextItem()
+        while renderer is not None:
+            renderTime += renderer.GetLastRenderTimeInSeconds()
+            renderer = renderers.GetNextItem()
+        return renderTime
+
+    # Internal function since the reply[image] is not
+    # JSON(serializable) it can not be an RPC one
+    def stillRender(self, options):
+        """
+        RPC Callback to render a view and obtain the rendered image.
+        """
+        beginTime = int(round(time.time() * 1000))
+        renderCalls = 0
+        view = self.getView(options["view"])
+        size = list(view.GetSize()[0:2])
+        resize = size != list(options.get("size", size))
+        sizeConfirmed = True
+        if resize:
+            size = list(options["size"])
+            if size[0] > 10 and size[1] > 10:
+                sizeConfirmed = self.applyViewSize(view, size)
+            else:
+                resize = False
+        t = 0
+        if options and "mtime" in options:
+            t = options["mtime"]
+        quality = 100
+        if options and "quality" in options:
+            quality = options["quality"]
+        localTime = 0
+        if options and "localTime" in options:
+            localTime = options["localTime"]
+        reply = {}
+        app = self.getApplication()
+        if t == 0 or resize:
+            app.InvalidateCache(view)
+        if self.decode:
+            stillRender = app.StillRenderToString
+        else:
+            stillRender = app.StillRenderToBuffer
+        reply_image = stillRender(view, t, quality)
+        renderCalls += 1
+
+        if not resize and options and ("clearCache" in options) and options["clearCache"]:
+            app.InvalidateCache(view)
+            reply_image = stillRender(view, t, quality)
+            renderCalls += 1
+
+        reply["renderTime"] = self.getLastRenderTime(view)
+        reply["stale"] = app.GetHasImagesBeingProcessed(view)
+        reply["mtime"] = app.GetLastStillRenderToMTime()
+        reply["size"] = view.GetSize()[0:2]
+        reply["memsize"] = reply_image.GetDataSize() if reply_image else 0
+        reply["format"] = "jpeg;base64" if self.decode else "jpeg"
+        reply["global_id"] = str(self.getGlobalId(view))
+        reply["localTime"] = localTime
+        if self.decode:
+            reply["image"] = reply_image
+        else:
+            # Convert the vtkUnsignedCharArray into a bytes object, required by Autobahn websockets
+            reply["image"] = memoryview(reply_image).tobytes() if reply_image else None
+
+        endTime = int(round(time.time() * 1000))
+        reply["workTime"] = (endTime - beginTime)
+        reply["renderCalls"] = renderCalls
+        reply["resized"] = resize
+        reply["sizeConfirmed"] = sizeConfirmed
+
+        return reply
+
+    @exportRpc("viewport.image.push.observer.add")
+    def addRenderObserver(self, viewId):
+        sView = self.getView(viewId)
+        if not sView:
+            return {'error': 'Unable to get view with id %s' % viewId}
+
+        realViewId = str(self.getGlobalId(sView))
+
+        if not realViewId in self.trackingViews:
+            observerCallback = lambda *args, **kwargs: self.requestRender(realViewId)
+            startCallback = lambda *args, **kwargs: self.startViewAnimation(realViewId)
+            stopCallback = lambda *args, **kwargs: self.stopViewAnimation(realViewId)
+            tag = self.getApplication().AddObserver('UpdateEvent', observerCallback)
+            tagStart = self.getApplication().AddObserver('StartInteractionEvent', startCallback)
+            tagStop = self.getApplication().AddObserver('EndInteractionEvent', stopCallback)
+            # TODO: do we need
+            # self.getApplication().AddObserver('ResetActiveView', resetActiveView())
+            self.trackingViews[realViewId] = {'tags': [tag, tagStart, tagStop],
+                                              'observerCount': 1,
+                                              'mtime': 0,
+                                              'enabled': True,
+                                              'quality': 100,
+                                              'frameId': 0,
+                                              'flowControl': False,
+                                              'maxFramesInFlight': self.maxFramesInFlight,
+                                              'inFlight': {},
+                                              'pendingRender': False,
+                                              'rtt': 0,
+                                              'interacting': False,
+                                              'qualityLevel': 0,
+                                              'workTimes': collections.deque(
+                                                  maxlen=self.workTimeWindow),
+                                              'refineTime': None,
+                                              'fastRenderState': False,
+                                              'resizeTimer': None,
+                                              'resizeRetries': [None, 0],
+                                              'dropTimer': None}
+            self.trackingViews[realViewId].update(
+                self.viewsFlowControl.get(realViewId, {}))
+        else:
+            # There is an observer on this view already
+            self.trackingViews[realViewId]['observerCount'] += 1
+
+        self.requestRender(realViewId)
+        return {'success': True, 'viewId': realViewId}
+
+    @exportRpc("viewport.image.push.observer.remove")
+    def removeRenderObserver(self, viewId):
+        sView = self.getView(viewId)
+        if not sView:
+            return {'error': 'Unable to get view with id %s' % viewId}
+
+        realViewId = str(self.getGlobalId(sView))
+
+        observerInfo = None
+        if realViewId in self.trackingViews:
+            observerInfo = self.trackingViews[realViewId]
+
+        if not observerInfo:
+            return {'error': 'Unable to find subscription for view %s' % realViewId}
+
+        observerInfo['observerCount'] -= 1
+
+        if observerInfo['observerCount'] <= 0:
+            for tag in observerInfo['tags']:
+                self.getApplication().RemoveObserver(tag)
+            self.scheduler.cancel(realViewId)
+            self.setRenderState(realViewId, fast=False)
+            if self.isResizePending(realViewId):
+                observerInfo['resizeTimer'].cancel()
+            if observerInfo['dropTimer'] is not None and \
+                    observerInfo['dropTimer'].active():
+                observerInfo['dropTimer'].cancel()
+            del self.trackingViews[realViewId]
+
+        return { 'result': 'success' }
+
+    @exportRpc("viewport.image.push.flow")
+    def setFlowControl(self, viewId, enabled=True, maxFramesInFlight=None):
+        """Enable client-acknowledged flow control for a view.
+
+        Once enabled, the client must acknowledge every pushed frame with
+        ``viewport.image.push.ack``. The setting is kept if the view has no
+        image observer yet and applied when the observer is added.
+        """
+        sView = self.getView(viewId)
+        if not sView:
+            return {'error': 'Unable to get view with id %s' % viewId}
+
+        realViewId = str(self.getGlobalId(sView))
+        flowControl = self.viewsFlowControl.setdefault(
+            realViewId, {'flowControl': False,
+                         'maxFramesInFlight': self.maxFramesInFlight})
+        flowControl['flowControl'] = enabled
+        if maxFramesInFlight:
+            flowControl['maxFramesInFlight'] = max(1, int(maxFramesInFlight))
+
+        if realViewId in self.trackingViews:
+            self.trackingViews[realViewId].update(flowControl)
+            self.trackingViews[realViewId]['inFlight'] = {}
+
+        return {'result': 'success',
+                'maxFramesInFlight': flowControl['maxFramesInFlight']}
+
+    @exportRpc("viewport.image.push.ack")
+    def ackFrame(self, viewId, frameId):
+        """Give back the credit of a frame received by the client."""
+        sView = self.getView(viewId)
+        if not sView:
+            return {'error': 'Unable to get view with id %s' % viewId}
+
+        realViewId = str(self.getGlobalId(sView))
+        observerInfo = self.trackingViews.get(realViewId)
+        if not observerInfo:
+            return {'error': 'Unable to find subscription for view %s' % realViewId}
+
+        sendTime = observerInfo['inFlight'].pop(frameId, None)
+        if sendTime is not None:
+            rtt = time.time() - sendTime
+            if observerInfo['rtt']:
+                observerInfo['rtt'] += self.rttSmoothing * \
+                    (rtt - observerInfo['rtt'])
+            else:
+                observerInfo['rtt'] = rtt
+
+        # Render whatever was dropped while waiting, unless the animation
+        # loop is already going to push the latest state.
+        if observerInfo['pendingRender']:
+            self.requestRender(realViewId)
+
+        return {'result': 'success'}
+
+    @exportRpc("viewport.image.push.adaptive")
+    def setAdaptiveQuality(self, enabled=True, frameBudget=None):
+        """Enable the adaptive interactive quality with a frame budget in ms.
+        """
+        self.adaptiveQuality = enabled
+        if frameBudget:
+            self.interactiveFrameBudget = float(frameBudget)
+
+        return {'result': 'success',
+                'frameBudget': self.interactiveFrameBudget,
+                'levels': self.qualityLevels}
+
+    @exportRpc("viewport.image.push.render.stats")
+    def getRenderStats(self, viewId):
+        """Number of render requests against actual renders for a view.
+
+        Every request used to trigger its own render; ``requests`` is that
+        count, ``renders`` what the scheduler really pushed and
+        ``stillRenderCalls`` the resulting ``StillRenderToBuffer`` calls.
+        """
+        sView = self.getView(viewId)
+        if not sView:
+            return {'error': 'Unable to get view with id %s' % viewId}
+
+        realViewId = str(self.getGlobalId(sView))
+        observerInfo = self.trackingViews.get(realViewId)
+        if not observerInfo:
+            return {'error': 'Unable to find subscription for view %s' % realViewId}
+
+        stats = self.scheduler.getStats(realViewId)
+        counters = self.metrics.view(realViewId).counters
+        for name in ('stillRenderCalls', 'framesDropped', 'resizes',
+                     'resizeExtraRenders', 'debouncedResizes'):
+            stats[name] = counters[name]
+        return stats
+
+    @exportRpc("viewport.metrics.get")
+    def getMetrics(self):
+        """Render, encode and publish metrics of every view."""
+        for vId in self.trackingViews:
+            self.updateSchedulerMetrics(vId)
+        return self.metrics.to_dict()
+
+    def startMetricsTextfile(self, path, interval=15.):
+        """Periodically export the metrics in the Prometheus text format."""
+        def writeMetrics():
+            for vId in self.trackingViews:
+                self.updateSchedulerMetrics(vId)
+            self.metrics.write_textfile(path)
+
+        self.metricsWriter = task.LoopingCall(writeMetrics)
+        self.metricsWriter.start(interval, now=False)
+
+    @exportRpc("viewport.image.push.progressive")
+    def setProgressive(self, enabled=True, idleDelay=None):
+        """Enable the fast preview / idle full-quality refinement mode."""
+        self.progressive = enabled
+        if idleDelay is not None:
+            self.idleRefinementDelay = float(idleDelay)
+
+        return {'result': 'success', 'idleDelay': self.idleRefinementDelay}
+
+    @exportRpc("viewport.image.push.quality")
+    def setViewQuality(self, viewId, quality, ratio=1):
+        sView = self.getView(viewId)
+        if not sView:
+            return {'error': 'Unable to get view with id %s' % viewId}
+
+        realViewId = str(self.getGlobalId(sView))
+        observerInfo = None
+        if realViewId in self.trackingViews:
+            observerInfo = self.trackingViews[realViewId]
+
+        if not observerInfo:
+            return {'error': 'Unable to find subscription for view %s' % realViewId}
+
+        observerInfo['quality'] = quality
+        observerInfo['ratio'] = ratio
+
+        # Update image size right now!
+        if "originalSize" in self.trackingViews[realViewId]:
+            size = [int(s * ratio) for s in self.trackingViews[realViewId]["originalSize"]]
+            if hasattr(sView, 'SetSize'):
+                sView.SetSize(size)
+            else:
+                sView.ViewSize = size
+
+        return {'result': 'success'}
+
+    @exportRpc("viewport.image.push.original.size")
+    def setViewSize(self, viewId, width, height):
+        sView = self.getView(viewId)
+        if not sView:
+            return {'error': 'Unable to get view with id %s' % viewId}
+
+        realViewId = str(self.getGlobalId(sView))
+        observerInfo = None
+        if realViewId in self.trackingViews:
+            observerInfo = self.trackingViews[realViewId]
+
+        if not observerInfo:
+            return {'error': 'Unable to find subscription for view %s' % realViewId}
+
+        # The first size is applied right away, browser resizes only once
+        # they settle down.
+        observerInfo['pendingSize'] = [width, height]
+        if 'originalSize' not in observerInfo:
+            self.applyPendingSize(realViewId)
+        elif self.isResizePending(realViewId):
+            self.metrics.view(realViewId).increment('debouncedResizes')
+            observerInfo['resizeTimer'].reset(self.resizeDebounce)
+        else:
+            observerInfo['resizeTimer'] = reactor.callLater(
+                self.resizeDebounce, self.applyPendingSize, realViewId)
+
+        return {'result': 'success'}
+
+    @exportRpc("viewport.image.push.enabled")
+    def enableView(self, viewId, enabled):
+        sView = self.getView(viewId)
+        if not sView:
+            return {'error': 'Unable to get view with id %s' % viewId}
+
+        realViewId = str(self.getGlobalId(sView))
+        observerInfo = None
+        if realViewId in self.trackingViews:
+            observerInfo = self.trackingViews[realViewId]
+
+        if not observerInfo:
+            return {'error': 'Unable to find subscription for view %s' % realViewId}
+
+        observerInfo['enabled'] = enabled
+
+        return {'result': 'success'}
+
+    @exportRpc("viewport.image.push.invalidate.cache")
+    def invalidateCache(self, viewId):
+        sView = self.getView(viewId)
+        if not sView:
+            return {'error': 'Unable to get view with id %s' % viewId}
+
+        self.getApplication().InvalidateCache(sView)
+        self.getApplication().InvokeEvent('UpdateEvent')
+        return {'result': 'success'}
@@ -0,0 +1,212 @@
+"""Binary cache of surface meshes.
+
+Parsing a GIFTI file (XML with base64 encoded, often compressed, arrays)
+costs much more than reading the same arrays from disk. The first load of a
+mesh stores its vertices and triangles as ``.npy`` files in a cache
+directory next to the source file, keyed by the hash of its content; the
+following loads memory-map them and wrap them in VTK arrays without copy.
+Decimated versions of the meshes, used as levels of detail, are cached the
+same way.
+
+The triangles are stored in the cell layout of the running VTK version:
+``(n, 4)`` rows ``[3, i, j, k]`` before VTK 9, plain ``(n, 3)`` connectivity
+since, so that ``vtkCellArray`` can use them as they are.
+"""
+import hashlib
+import os
+import tempfile
+
+import numpy as np
+import vtk
+from vtk.util import numpy_support
+
+CACHE_DIR_NAME = '.furyweb_cache'
+
+LEGACY_CELLS = vtk.vtkVersion.GetVTKMajorVersion() < 9
+
+
+def file_hash(path, chunk_size=1 << 20):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _cache_dir(path, cache_dir=None):
+    """Cache directory next to path, or in the temp dir if not writable."""
+    candidates = [cache_dir] if cache_dir else [
+        os.path.join(os.path.dirname(os.path.abspath(path)), CACHE_DIR_NAME),
+        os.path.join(tempfile.gettempdir(), 'furyweb', CACHE_DIR_NAME)]
+    for directory in candidates:
+        try:
+            os.makedirs(directory, exist_ok=True)
+        except OSError:
+            continue
+        if os.access(directory, os.W_OK):
+            return directory
+    return None
+
+
+def _save(path, array):
+    # Write then rename, so that concurrent sessions never read a partial file
+    tmp_path = '%s.%d.tmp' % (path, os.getpid())
+    with open(tmp_path, 'wb') as f:
+        np.save(f, array)
+    os.replace(tmp_path, path)
+
+
+def cells_from_triangles(triangles):
+    """Triangles as the cell array layout of the running VTK version."""
+    id_type = numpy_support.ID_TYPE_CODE
+    if not LEGACY_CELLS:
+        return np.ascontiguousarray(triangles, dtype=id_type)
+    cells = np.empty((len(triangles), 4), dtype=id_type)
+    cells[:, 0] = 3
+    cells[:, 1:] = triangles
+    return cells
+
+
+def _cache_prefix(path, cache_dir=None):
+    """Path prefix of the cache files of a mesh (None: no cache)."""
+    directory = _cache_dir(path, cache_dir)
+    if directory is None:
+        return None
+    return os.path.join(directory, '%s.%s' % (os.path.basename(path),
+                                              file_hash(path)[:16]))
+
+
+def _cached_paths(prefix):
+    layout = 'cells4' if LEGACY_CELLS else 'cells3'
+    return prefix + '.vertices.npy', '%s.%s.npy' % (prefix, layout)
+
+
+def _load_cached(prefix):
+    if prefix is None:
+        return None
+    vertices_path, cells_path = _cached_paths(prefix)
+    if os.path.isfile(vertices_path) and os.path.isfile(cells_path):
+        return (np.load(vertices_path, mmap_mode='c'),
+                np.load(cells_path, mmap_mode='c'))
+    return None
+
+
+def _store(prefix, vertices, cells):
+    """Cache a mesh, returning its memory-mapped arrays when possible."""
+    if prefix is None:
+        return vertices, cells
+    vertices_path, cells_path = _cached_paths(prefix)
+    try:
+        _save(vertices_path, vertices)
+        _save(cells_path, cells)
+    except OSError:
+        return vertices, cells
+    return (np.load(vertices_path, mmap_mode='c'),
+            np.load(cells_path, mmap_mode='c'))
+
+
+def load_gifti_mesh(path, cache_dir=None):
+    """Return the vertices and cells of a GIFTI surface.
+
+    Parameters
+    ----------
+    path : str
+        GIFTI file, whose first data array is the pointset and the second
+        the triangles.
+    cache_dir : str, optional
+        Directory of the binary cache (default: a ``.furyweb_cache`` folder
+        next to path, or in the temp directory if not writable).
+
+    Returns
+    -------
+    vertices : ndarray (n_vertices, 3)
+    cells : ndarray (n_triangles, 4) or (n_triangles, 3)
+        See ``cells_from_triangles``. Both arrays are memory-mapped
+        copy-on-write when the cache is available.
+    """
+    return _load_gifti_mesh(path, _cache_prefix(path, cache_dir))
+
+
+def _load_gifti_mesh(path, prefix):
+    mesh = _load_cached(prefix)
+    if mesh is not None:
+        return mesh
+
+    import nibabel as nib
+
+    gii = nib.load(path)
+    vertices = np.ascontiguousarray(gii.darrays[0].data)  # POINTSET
+    cells = cells_from_triangles(gii.darrays[1].data)     # TRIANGLE
+    return _store(prefix, vertices, cells)
+
+
+def decimate_mesh(vertices, cells, ratio):
+    """Return a mesh with about ratio times the triangles of the given one.
+
+    The arrays are the ones of ``load_gifti_mesh``; the result is a new
+    (vertices, cells) pair in the same layout.
+    """
+    decimation = vtk.vtkQuadricDecimation()
+    decimation.SetInputData(polydata_from_mesh(vertices, cells))
+    decimation.SetTargetReduction(1. - ratio)
+    decimation.Update()
+    output = decimation.GetOutput()
+
+    vertices = np.array(numpy_support.vtk_to_numpy(
+        output.GetPoints().GetData()))
+    # GetData is the legacy [3, i, j, k] layout, whatever the VTK version
+    triangles = numpy_support.vtk_to_numpy(
+        output.GetPolys().GetData()).reshape(-1, 4)[:, 1:]
+    return vertices, cells_from_triangles(triangles)
+
+
+def load_decimated_mesh(path, ratio, cache_dir=None):
+    """Return a decimated version of a GIFTI surface, cached like it.
+
+    Parameters
+    ----------
+    path : str
+        GIFTI file, see ``load_gifti_mesh``.
+    ratio : float
+        Fraction of the triangles to keep, e.g. 0.1 or 0.01.
+    cache_dir : str, optional
+        See ``load_gifti_mesh``.
+    """
+    # The source file is hashed once for both meshes
+    mesh_prefix = _cache_prefix(path, cache_dir)
+    prefix = None if mesh_prefix is None else \
+        '%s.lod%04d' % (mesh_prefix, round(ratio * 10000))
+    mesh = _load_cached(prefix)
+    if mesh is not None:
+        return mesh
+    vertices, cells = decimate_mesh(*_load_gifti_mesh(path, mesh_prefix),
+                                    ratio=ratio)
+    return _store(prefix, vertices, cells)
+
+
+def polydata_from_mesh(vertices, cells):
+    """Wrap mesh arrays in a vtkPolyData, without copying them.
+
+    The VTK arrays keep a reference to the numpy ones.
+    """
+    points = vtk.vtkPoints()
+    points.SetData(numpy_support.numpy_to_vtk(vertices, deep=False))
+
+    polydata = vtk.vtkPolyData()
+    polydata.SetPoints(points)
+    polydata.SetPolys(cell_array(cells))
+    return polydata
+
+
+def cell_array(cells):
+    """vtkCellArray of triangles sharing the memory of cells (see
+    ``cells_from_triangles``)."""
+    cells = np.ascontiguousarray(cells)
+    connectivity = numpy_support.numpy_to_vtkIdTypeArray(cells.ravel(),
+                                                         deep=False)
+    polys = vtk.vtkCellArray()
+    if LEGACY_CELLS:
+        polys.SetCells(len(cells), connectivity)
+    else:
+        polys.SetData(3, connectivity)
+    return polys
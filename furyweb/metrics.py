@@ -0,0 +1,231 @@
+"""Per-view metrics for the image delivery protocol.
+
+The registry keeps, for every view, latency histograms (render, encode,
+publish), counters (frames, bytes, drops, stale renders, ...) and the frame
+rate achieved against the target one. It can be serialized to a dict for the
+``viewport.metrics.get`` RPC or to the Prometheus text exposition format,
+optionally written periodically to a file for the node exporter textfile
+collector.
+"""
+import collections
+import os
+import time
+
+# Latency buckets in seconds, from 1ms to 10s
+DEFAULT_BUCKETS = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1., 2.5,
+                   5., 10.)
+
+
+class Histogram(object):
+    """Cumulative latency histogram keeping a window of recent samples.
+
+    Parameters
+    ----------
+    buckets : tuple of float, optional
+        Upper bounds of the buckets, in seconds.
+    window : int, optional
+        Number of most recent samples used to compute percentiles.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, window=1024):
+        self.buckets = buckets
+        self.bucket_counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.
+        self.samples = collections.deque(maxlen=window)
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        self.samples.append(value)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.bucket_counts[i] += 1
+                break
+
+    def percentile(self, q):
+        """Return the q-th percentile (0-100) of the recent samples."""
+        if not self.samples:
+            return 0.
+        ordered = sorted(self.samples)
+        index = min(int(round(q / 100. * (len(ordered) - 1))),
+                    len(ordered) - 1)
+        return ordered[index]
+
+    def cumulative_counts(self):
+        counts = []
+        total = 0
+        for bound, bucket_count in zip(self.buckets, self.bucket_counts):
+            total += bucket_count
+            counts.append((bound, total))
+        return counts
+
+    def to_dict(self):
+        return {'count': self.count,
+                'sum': self.sum,
+                'p50': self.percentile(50),
+                'p90': self.percentile(90),
+                'p99': self.percentile(99),
+                'buckets': self.cumulative_counts()}
+
+
+class ViewMetrics(object):
+    """Metrics of a single view."""
+
+    HISTOGRAMS = ('render', 'encode', 'publish')
+    COUNTERS = ('framesPublished', 'bytesSent', 'framesDropped',
+                'framesSkipped', 'staleRenders', 'refinementRenders',
+                'stillRenderCalls', 'renderRequests', 'renders',
+                'mergedRenders', 'resizes', 'resizeExtraRenders',
+                'debouncedResizes')
+
+    def __init__(self, fps_window=2.):
+        self.histograms = dict((name, Histogram())
+                               for name in self.HISTOGRAMS)
+        self.counters = dict.fromkeys(self.COUNTERS, 0)
+        # Values set by the applications, e.g. the instances drawn
+        self.gauges = {}
+        self.target_frame_rate = 0.
+        self.fps_window = fps_window
+        self.frame_times = collections.deque()
+
+    def increment(self, name, value=1):
+        self.counters[name] += value
+
+    def set_counter(self, name, value):
+        self.counters[name] = value
+
+    def set_gauge(self, name, value):
+        self.gauges[name] = value
+
+    def set_gauges(self, values):
+        """Set several gauges, e.g. the stats of a culler."""
+        for name, value in values.items():
+            self.set_gauge(name, value)
+
+    def observe(self, name, seconds):
+        self.histograms[name].observe(seconds)
+
+    def frame_published(self, nbytes, timestamp=None):
+        timestamp = time.time() if timestamp is None else timestamp
+        self.counters['framesPublished'] += 1
+        self.counters['bytesSent'] += nbytes
+        self.frame_times.append(timestamp)
+        self._prune_frame_times(timestamp)
+
+    def _prune_frame_times(self, now):
+        while self.frame_times and now - self.frame_times[0] > self.fps_window:
+            self.frame_times.popleft()
+
+    def frame_rate(self):
+        """Frames per second published over the last ``fps_window`` s."""
+        self._prune_frame_times(time.time())
+        if len(self.frame_times) < 2:
+            return 0.
+        span = self.frame_times[-1] - self.frame_times[0]
+        return (len(self.frame_times) - 1) / span if span > 0 else 0.
+
+    def to_dict(self):
+        metrics = dict(self.counters)
+        metrics['fps'] = self.frame_rate()
+        metrics['targetFps'] = self.target_frame_rate
+        metrics.update(self.gauges)
+        for name, histogram in self.histograms.items():
+            metrics[name] = histogram.to_dict()
+        return metrics
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{%s}' % ','.join('%s="%s"' % (key, str(value).replace('"', '\\"'))
+                             for key, value in sorted(labels.items()))
+
+
+def _snake_case(name):
+    return ''.join('_' + c.lower() if c.isupper() else c for c in name)
+
+
+class MetricsRegistry(object):
+    """Metrics of all the views of a server process.
+
+    Parameters
+    ----------
+    labels : dict, optional
+        Constant labels added to every exported Prometheus sample (for
+        example the application name or the launcher port).
+    """
+
+    def __init__(self, labels=None):
+        self.labels = labels or {}
+        self.views = {}
+
+    def view(self, vId):
+        if vId not in self.views:
+            self.views[vId] = ViewMetrics()
+        return self.views[vId]
+
+    def to_dict(self):
+        return {'timestamp': time.time(),
+                'labels': self.labels,
+                'views': dict((vId, metrics.to_dict())
+                              for vId, metrics in self.views.items())}
+
+    def to_prometheus(self, prefix='furyweb_view'):
+        """Serialize the registry in the Prometheus text format."""
+        lines = []
+
+        def labels_for(vId, **extra):
+            labels = dict(self.labels, view=vId)
+            labels.update(extra)
+            return _format_labels(labels)
+
+        for name in ViewMetrics.COUNTERS:
+            metric = '%s_%s_total' % (prefix, _snake_case(name))
+            lines.append('# TYPE %s counter' % metric)
+            for vId, metrics in sorted(self.views.items()):
+                lines.append('%s%s %d' % (metric, labels_for(vId),
+                                          metrics.counters[name]))
+
+        for name, value in (('fps', ViewMetrics.frame_rate),
+                            ('target_fps',
+                             lambda m: m.target_frame_rate)):
+            metric = '%s_%s' % (prefix, name)
+            lines.append('# TYPE %s gauge' % metric)
+            for vId, metrics in sorted(self.views.items()):
+                lines.append('%s%s %f' % (metric, labels_for(vId),
+                                          value(metrics)))
+
+        gauges = sorted(set(name for metrics in self.views.values()
+                            for name in metrics.gauges))
+        for name in gauges:
+            metric = '%s_%s' % (prefix, _snake_case(name))
+            lines.append('# TYPE %s gauge' % metric)
+            for vId, metrics in sorted(self.views.items()):
+                if name in metrics.gauges:
+                    lines.append('%s%s %f' % (metric, labels_for(vId),
+                                              metrics.gauges[name]))
+
+        for name in ViewMetrics.HISTOGRAMS:
+            metric = '%s_%s_seconds' % (prefix, name)
+            lines.append('# TYPE %s histogram' % metric)
+            for vId, metrics in sorted(self.views.items()):
+                histogram = metrics.histograms[name]
+                for bound, count in histogram.cumulative_counts():
+                    lines.append('%s_bucket%s %d' % (
+                        metric, labels_for(vId, le=repr(bound)), count))
+                lines.append('%s_bucket%s %d' % (
+                    metric, labels_for(vId, le='+Inf'), histogram.count))
+                lines.append('%s_sum%s %f' % (metric, labels_for(vId),
+                                              histogram.sum))
+                lines.append('%s_count%s %d' % (metric, labels_for(vId),
+                                                histogram.count))
+
+        return '\n'.join(lines) + '\n'
+
+    def write_textfile(self, path):
+        """Atomically write the Prometheus text export to ``path``."""
+        tmp_path = '%s.%d.tmp' % (path, os.getpid())
+        with open(tmp_path, 'w') as f:
+            f.write(self.to_prometheus())
+        os.replace(tmp_path, path)
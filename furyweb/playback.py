@@ -0,0 +1,147 @@
+"""Playback of time series of scene states.
+
+The states are read in a background thread a few steps ahead of the one
+displayed, so that the reactor only copies decoded arrays into the scene
+and playback never waits on the disk. When a step is not decoded in time,
+the timer simply tries again on its next tick (counted as a late step).
+"""
+import threading
+
+import numpy as np
+from twisted.internet import task
+
+
+class SeriesPlayer(object):
+    """Play a series of states at a given rate.
+
+    Parameters
+    ----------
+    series : dict
+        Arrays of shape (steps, ...) by name, usually memory-mapped.
+    apply : callable
+        Called on the reactor thread with a step index and the dict of the
+        arrays of that step, to update the scene.
+    fps : float, optional
+        Steps per second while playing.
+    readahead : int, optional
+        Number of steps kept decoded ahead of the displayed one.
+    loop : bool, optional
+        Start again from the first step after the last one.
+    """
+
+    def __init__(self, series, apply, fps=10., readahead=16, loop=True):
+        self.series = series
+        self.steps = min(len(array) for array in series.values())
+        self.apply = apply
+        self.fps = fps
+        self.readahead = max(1, min(readahead, self.steps))
+        self.loop = loop
+        self.step = None
+        self.playing = False
+        self.late_steps = 0
+        self._pending = None
+        self._next = 0
+        self._decoded = {}
+        self._condition = threading.Condition()
+        self._timer = task.LoopingCall(self._tick)
+        self._decoder = threading.Thread(target=self._decode_loop,
+                                         name='series-decoder')
+        self._decoder.daemon = True
+        self._decoder.start()
+
+    # Decoding thread
+
+    def _window(self):
+        steps = [self._next + offset for offset in range(self.readahead)]
+        if self.loop:
+            return [step % self.steps for step in steps]
+        return [step for step in steps if step < self.steps]
+
+    def _decode_loop(self):
+        while True:
+            with self._condition:
+                missing = [step for step in self._window()
+                           if step not in self._decoded]
+                while not missing:
+                    self._condition.wait()
+                    missing = [step for step in self._window()
+                               if step not in self._decoded]
+            step = missing[0]
+            # Copying the step out of the memory maps does the disk reads
+            state = {name: np.array(array[step])
+                     for name, array in self.series.items()}
+            with self._condition:
+                self._decoded[step] = state
+                self._prune()
+
+    def _prune(self):
+        window = set(self._window())
+        for step in [step for step in self._decoded if step not in window]:
+            del self._decoded[step]
+
+    def _decode_from(self, step):
+        with self._condition:
+            self._next = step
+            self._prune()
+            self._condition.notify()
+
+    # Reactor thread
+
+    def show(self, step):
+        """Apply a step if it is decoded, return False otherwise."""
+        with self._condition:
+            state = self._decoded.get(step)
+        if state is None:
+            return False
+        self.step = step
+        self.apply(step, state)
+        self._decode_from(step + 1)
+        return True
+
+    def _tick(self):
+        if self._pending is not None:
+            if self.show(self._pending):
+                self._pending = None
+            else:
+                self.late_steps += 1
+        elif self.playing:
+            step = self.step + 1 if self.step is not None else 0
+            if step >= self.steps and not self.loop:
+                self.pause()
+            elif not self.show(step % self.steps):
+                self.late_steps += 1
+        if not self.playing and self._pending is None and \
+                self._timer.running:
+            self._timer.stop()
+
+    def _start_timer(self):
+        if not self._timer.running:
+            self._timer.start(1. / self.fps, now=True)
+
+    def play(self):
+        self.playing = True
+        self._start_timer()
+
+    def pause(self):
+        self.playing = False
+
+    def seek(self, step):
+        """Display a step, as soon as it is decoded."""
+        step = int(step) % self.steps if self.loop else \
+            max(0, min(int(step), self.steps - 1))
+        self._pending = step
+        self._decode_from(step)
+        self._start_timer()
+
+    def set_fps(self, fps):
+        self.fps = max(float(fps), .1)
+        if self._timer.running:
+            self._timer.stop()
+            self._timer.start(1. / self.fps, now=False)
+
+    def state(self):
+        return {'step': self.step,
+                'steps': self.steps,
+                'playing': self.playing,
+                'fps': self.fps,
+                'lateSteps': self.late_steps}
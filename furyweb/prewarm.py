@@ -0,0 +1,357 @@
+r"""
+Pool of pre-warmed server processes.
+
+Starting a session from scratch means importing vtk, fury, numpy, ... and
+loading the static data of the application before the server can accept a
+client. In pool mode a daemon does this work once per application and keeps
+``--pool-size`` forked interpreters waiting on a unix socket::
+
+    $ pvpython /pvw/furyweb/prewarm.py serve --pool-size 2 \
+        --socket /tmp/furyweb-fury.sock /pvw/apps/fury/server/fury_server.py
+
+The launcher then starts sessions through the ``run`` command, which hands
+its arguments and its stdout/stderr (the launcher log, where the ready line
+is looked for) to an idle interpreter and waits for it to exit::
+
+    $ pvpython /pvw/furyweb/prewarm.py run --socket /tmp/furyweb-fury.sock \
+        /pvw/apps/fury/server/fury_server.py --port 9001 --authKey secret
+
+Without a running pool, ``run`` simply starts the script itself, so the
+launcher configuration works both ways. With a pool, the process started by
+the launcher is only a proxy: the pid of the interpreter really serving the
+session is written to ``worker_pid_path(os.getpid())`` while it runs, for
+tools measuring the resources of a session, and the interpreter stops its
+reactor as soon as the proxy exits, even when killed.
+
+Before forking, the daemon runs the application script with ``__name__`` set
+to ``"__prewarm__"`` and calls its ``prewarm()`` function, if any. Static
+data loaded there with :func:`cached` is shared (copy-on-write) by every
+session. Nothing creating an OpenGL context must happen at this point.
+
+The applications import the Twisted reactor, so it exists before the fork
+and every session has to replace its poller and waker (``_reinit_reactor``).
+That relies on Twisted internals, the pool only starts with the Twisted
+versions in ``TWISTED_VERSIONS``; with any other, sessions are started cold.
+"""
+import argparse
+import array
+import importlib
+import json
+import os
+import runpy
+import select
+import signal
+import socket
+import struct
+import sys
+import tempfile
+import traceback
+
+# Imported before forking in addition to what the script itself imports
+DEFAULT_PRELOAD = ('numpy', 'vtk', 'fury', 'twisted.internet.reactor')
+
+# Twisted versions whose posix reactor internals _reinit_reactor knows
+# (ParaView 5.7 bundles 19.x), as [min, max)
+TWISTED_VERSIONS = ((16, 0), (23, 0))
+
+_cache = {}
+
+
+def cached(key, loader):
+    """Return the value stored under key, calling ``loader()`` once.
+
+    Data loaded by ``prewarm()`` in the pool daemon is found here by the
+    forked sessions instead of being loaded again.
+    """
+    if key not in _cache:
+        _cache[key] = loader()
+    return _cache[key]
+
+
+def _send_fds(sock, message, fds):
+    sock.sendmsg([message], [(socket.SOL_SOCKET, socket.SCM_RIGHTS,
+                              array.array('i', fds))])
+
+
+def _recv_fds(sock, max_fds=2, bufsize=65536):
+    fds = array.array('i')
+    message, ancdata, _, _ = sock.recvmsg(
+        bufsize, socket.CMSG_LEN(max_fds * fds.itemsize))
+    for level, kind, data in ancdata:
+        if level == socket.SOL_SOCKET and kind == socket.SCM_RIGHTS:
+            fds.frombytes(data[:len(data) - (len(data) % fds.itemsize)])
+    return message, list(fds)
+
+
+def worker_pid_path(run_pid):
+    """File holding the pid of the worker serving a ``run`` process."""
+    return os.path.join(tempfile.gettempdir(),
+                        'furyweb-worker-%d.pid' % run_pid)
+
+
+def read_worker_pid(run_pid):
+    """Pid of the worker serving a ``run`` process, None if started cold."""
+    try:
+        with open(worker_pid_path(run_pid)) as f:
+            return int(f.read())
+    except (OSError, ValueError):
+        return None
+
+
+def twisted_supported():
+    import twisted
+    version = tuple(int(part) for part in
+                    twisted.__version__.split('.')[:2] if part.isdigit())
+    return TWISTED_VERSIONS[0] <= version < TWISTED_VERSIONS[1]
+
+
+def _reinit_reactor():
+    """Give a forked process its own reactor poller and waker.
+
+    The inherited epoll instance is shared with the daemon and the sibling
+    forks: it is replaced by a new one before anything is unregistered.
+    """
+    reactor = sys.modules.get('twisted.internet.reactor')
+    if reactor is None or getattr(reactor, 'waker', None) is None:
+        return
+    waker = reactor.waker
+    poller = getattr(reactor, '_poller', None)
+    if hasattr(select, 'epoll') and isinstance(poller, select.epoll):
+        reactor._poller = select.epoll(1024)
+        poller.close()
+        fd = waker.fileno()
+        reactor._reads.discard(fd)
+        reactor._writes.discard(fd)
+        reactor._selectables.pop(fd, None)
+        # Whatever else was registered before the fork
+        for fd in reactor._reads | reactor._writes:
+            reactor._poller.register(
+                fd, (select.EPOLLIN if fd in reactor._reads else 0) |
+                (select.EPOLLOUT if fd in reactor._writes else 0))
+    else:
+        # poll() and select() state is not shared with the other processes
+        reactor.removeReader(waker)
+    getattr(reactor, '_internalReaders', set()).discard(waker)
+    waker.connectionLost(None)
+    reactor.waker = None
+    reactor.installWaker()
+
+
+class _ProxyWatcher(object):
+    """Stop the session when the connection to its ``run`` proxy closes.
+
+    The launcher stops sessions by killing the proxy, with SIGKILL, which
+    cannot be forwarded: without this the worker would keep serving the
+    port the launcher hands to the next session.
+    """
+
+    def __init__(self, conn):
+        from twisted.internet import reactor
+        self.conn = conn
+        self.reactor = reactor
+        reactor.addReader(self)
+
+    def fileno(self):
+        return self.conn.fileno()
+
+    def logPrefix(self):
+        return 'prewarm'
+
+    def doRead(self):
+        try:
+            data = self.conn.recv(4096)
+        except OSError:
+            data = b''
+        if not data:
+            self.reactor.removeReader(self)
+            print('Session proxy gone, stopping the session')
+            sys.stdout.flush()
+            if self.reactor.running:
+                self.reactor.stop()
+
+    def connectionLost(self, reason):
+        pass
+
+
+def _worker(server, script, ready_fd):
+    conn, _ = server.accept()
+    server.close()
+    # Tell the daemon to fork a replacement
+    os.write(ready_fd, struct.pack('i', os.getpid()))
+    os.close(ready_fd)
+
+    message, fds = _recv_fds(conn)
+    request = json.loads(message.decode('utf8'))
+    sys.stdout.flush()
+    sys.stderr.flush()
+    for fd, target in zip(fds, (1, 2)):
+        os.dup2(fd, target)
+        os.close(fd)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.default_int_handler)
+    conn.sendall(json.dumps({'pid': os.getpid()}).encode('utf8') + b'\n')
+
+    _reinit_reactor()
+    _ProxyWatcher(conn)
+    if request.get('cwd'):
+        os.chdir(request['cwd'])
+    sys.argv = [script] + request['argv']
+    status = 0
+    try:
+        runpy.run_path(script, run_name='__main__')
+    except SystemExit as e:
+        status = e.code if isinstance(e.code, int) else int(bool(e.code))
+    except BaseException:
+        traceback.print_exc()
+        status = 1
+    sys.stdout.flush()
+    sys.stderr.flush()
+    try:
+        conn.sendall(json.dumps({'status': status}).encode('utf8') + b'\n')
+    except OSError:
+        pass
+    os._exit(status)
+
+
+def _fork_worker(server, script, ready_fd):
+    pid = os.fork()
+    if pid == 0:
+        try:
+            _worker(server, script, ready_fd)
+        finally:
+            os._exit(1)
+    return pid
+
+
+def serve(script, socket_path, pool_size=2, preload=DEFAULT_PRELOAD):
+    """Warm up the application and keep pool_size idle forks of it."""
+    if not twisted_supported():
+        import twisted
+        print('Twisted {0} is not supported by the pool (expected {1} to '
+              '{2}), sessions are started cold'.format(
+                  twisted.__version__, *['.'.join(map(str, version))
+                                         for version in TWISTED_VERSIONS]))
+        return 1
+
+    for name in preload:
+        try:
+            importlib.import_module(name)
+        except ImportError as e:
+            print('Not preloading {0}: {1}'.format(name, e))
+
+    # Like python does for the script it runs, for its sibling modules
+    sys.path.insert(0, os.path.dirname(os.path.abspath(script)))
+    namespace = runpy.run_path(script, run_name='__prewarm__')
+    if callable(namespace.get('prewarm')):
+        namespace['prewarm']()
+
+    if os.path.exists(socket_path):
+        os.unlink(socket_path)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(socket_path)
+    server.listen(max(pool_size * 4, 16))
+
+    ready_r, ready_w = os.pipe()
+    idle = set(_fork_worker(server, script, ready_w)
+               for _ in range(pool_size))
+    print('Pool of {0} {1} ready on {2}'.format(pool_size, script,
+                                               socket_path))
+    sys.stdout.flush()
+
+    try:
+        while True:
+            readable, _, _ = select.select([ready_r], [], [], 1.)
+            if readable:
+                pid, = struct.unpack('i', os.read(ready_r, 4))
+                idle.discard(pid)
+                idle.add(_fork_worker(server, script, ready_w))
+
+            # Reap finished sessions and replace idle workers that died
+            while True:
+                try:
+                    pid, _ = os.waitpid(-1, os.WNOHANG)
+                except ChildProcessError:
+                    break
+                if pid == 0:
+                    break
+                if pid in idle:
+                    idle.discard(pid)
+                    idle.add(_fork_worker(server, script, ready_w))
+    finally:
+        for pid in idle:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except OSError:
+                pass
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+
+
+def run(socket_path, script, argv):
+    """Run a session in a pooled interpreter, or start it cold."""
+    conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        conn.connect(socket_path)
+    except OSError:
+        conn.close()
+        os.execv(sys.executable, [sys.executable, script] + list(argv))
+
+    sys.stdout.flush()
+    sys.stderr.flush()
+    request = {'argv': list(argv), 'cwd': os.getcwd()}
+    _send_fds(conn, json.dumps(request).encode('utf8'), [1, 2])
+    replies = conn.makefile('rb')
+    worker_pid = json.loads(replies.readline().decode('utf8'))['pid']
+    pid_path = worker_pid_path(os.getpid())
+    with open(pid_path, 'w') as f:
+        f.write(str(worker_pid))
+
+    # The launcher stops sessions by terminating this process
+    def forward(signum, frame):
+        try:
+            os.kill(worker_pid, signum)
+        except OSError:
+            pass
+    signal.signal(signal.SIGTERM, forward)
+    signal.signal(signal.SIGINT, forward)
+
+    try:
+        line = replies.readline()
+    finally:
+        os.unlink(pid_path)
+    return json.loads(line.decode('utf8'))['status'] if line else 1
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Pre-warmed server pool')
+    commands = parser.add_subparsers(dest='command')
+
+    serve_parser = commands.add_parser('serve', help='start a pool daemon')
+    serve_parser.add_argument('--socket', required=True)
+    serve_parser.add_argument('--pool-size', type=int, default=2)
+    serve_parser.add_argument('--preload', nargs='*',
+                              default=list(DEFAULT_PRELOAD))
+    serve_parser.add_argument('script')
+
+    run_parser = commands.add_parser('run', help='start a session')
+    run_parser.add_argument('--socket', required=True)
+    run_parser.add_argument('script')
+    run_parser.add_argument('args', nargs=argparse.REMAINDER)
+
+    args = parser.parse_args(argv)
+    if args.command == 'serve':
+        sys.exit(serve(args.script, args.socket, args.pool_size,
+                       args.preload))
+    elif args.command == 'run':
+        sys.exit(run(args.socket, args.script, args.args))
+    else:
+        parser.print_help()
+
+
+if __name__ == '__main__':
+    # Run as a script: import this module as furyweb.prewarm so that the
+    # application scripts share its cache
+    sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                 os.pardir)))
+    from furyweb import prewarm
+    prewarm.main()
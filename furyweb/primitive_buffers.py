@@ -0,0 +1,94 @@
+"""In-place updates of the vertex buffers of fury primitive actors.
+
+``actor.sdf`` and ``actor.billboard`` repeat a small template (a box, a
+quad) for every primitive and store per vertex the positions, the
+``colors`` scalars and attributes such as ``center``, ``direction``,
+``scale`` or ``primitive``. Moving, recoloring or retyping primitives only
+needs these arrays to be rewritten and marked modified, instead of the
+actor to be rebuilt. Updates take an optional index array to only write
+the vertices of a subset of the primitives.
+"""
+import numpy as np
+from vtk.util import numpy_support
+
+
+class PrimitiveBuffers(object):
+    """numpy views on the point arrays of a fury primitive actor.
+
+    Parameters
+    ----------
+    prim_actor : vtkActor
+        Actor built by ``actor.sdf``, ``actor.billboard``, ...
+    n_primitives : int
+        Number of primitives of the actor.
+    """
+
+    def __init__(self, prim_actor, n_primitives):
+        self.polydata = prim_actor.GetMapper().GetInput()
+        self.n_primitives = n_primitives
+        self.vtk_arrays = {'positions': self.polydata.GetPoints().GetData()}
+        point_data = self.polydata.GetPointData()
+        for i in range(point_data.GetNumberOfArrays()):
+            vtk_array = point_data.GetArray(i)
+            if vtk_array is not None and vtk_array.GetName():
+                self.vtk_arrays[vtk_array.GetName()] = vtk_array
+        self.arrays = {name: numpy_support.vtk_to_numpy(vtk_array)
+                       for name, vtk_array in self.vtk_arrays.items()}
+        self.verts_per_primitive = \
+            len(self.arrays['positions']) // n_primitives
+
+    def __contains__(self, name):
+        return name in self.arrays
+
+    def primitive_values(self, name, index=None):
+        """Values of an attribute with one row per primitive."""
+        values = self.arrays[name][::self.verts_per_primitive]
+        return values if index is None else values[index]
+
+    def _rows(self, index):
+        """Vertex rows of a subset of the primitives (None: all)."""
+        if index is None:
+            return slice(None)
+        index = np.asarray(index, dtype=np.int64)
+        return (index[:, None] * self.verts_per_primitive +
+                np.arange(self.verts_per_primitive)).ravel()
+
+    def _per_vertex(self, values):
+        return np.repeat(values, self.verts_per_primitive, axis=0)
+
+    def _write(self, name, values, index):
+        target = self.arrays[name]
+        rows = self._rows(index)
+        values = self._per_vertex(np.asarray(values))
+        if target.ndim > 1:
+            target[rows, :values.shape[1]] = values.reshape(len(values), -1)
+        else:
+            target[rows] = values.ravel()
+
+    def set_centers(self, centers, index=None):
+        """Move the primitives, translating their vertices."""
+        centers = np.asarray(centers, dtype=self.arrays['center'].dtype)
+        delta = centers - self.primitive_values('center', index)
+        self.arrays['positions'][self._rows(index)] += \
+            self._per_vertex(delta)
+        self._write('center', centers, index)
+        self.modified('positions', 'center')
+
+    def set_colors(self, colors, index=None):
+        """Recolor the primitives, colors in [0, 1] or [0, 255]."""
+        colors = np.asarray(colors)
+        if colors.dtype.kind == 'f' and colors.size and colors.max() <= 1:
+            colors = colors * 255
+        self._write('colors', colors, index)
+        self.modified('colors')
+
+    def set_attribute(self, name, values, index=None):
+        """Write a per primitive attribute (direction, scale, primitive)."""
+        self._write(name, values, index)
+        self.modified(name)
+
+    def modified(self, *names):
+        """Flag arrays as modified so the mapper uploads them again."""
+        for name in names:
+            self.vtk_arrays[name].Modified()
+        self.polydata.Modified()
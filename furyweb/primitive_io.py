@@ -0,0 +1,315 @@
+r"""
+Reading and writing of primitive scenes.
+
+A scene is a set of named arrays with one row per primitive: ``centers``
+(n, 3), ``colors`` (n, 3), ``directions`` (n, 3) and ``primitives`` (n,),
+the type of each primitive as an integer code (see ``PRIMITIVE_CODES``).
+Only ``centers`` is required. :func:`load_primitives` reads:
+
+- ``.npy``: either the (n, 3) centers, or a structured array with one field
+  per attribute. Memory-mapped.
+- ``.npz``: one array per attribute.
+- ``.fwp``: the raw layout written by :func:`save_raw`, a small header
+  followed by the arrays. Memory-mapped.
+- ``.json``: ``{"centers": [[x, y, z], ...], "colors": ...}`` with the types
+  as names (``"primitives": ["sphere", ...]``), parsed by chunks straight
+  into typed arrays instead of nested Python lists.
+
+Convert a JSON scene once to the raw layout with::
+
+    $ python furyweb/primitive_io.py scene.json scene.fwp
+
+Simulations (time series of scenes) are directories with one ``.npy`` file
+per attribute, of shape (steps, n, ...), see :func:`save_series`. Each step
+is a contiguous block of every file, read through memory maps one step at a
+time.
+"""
+import argparse
+import os
+import re
+import struct
+
+import numpy as np
+
+# Primitive type codes, as in the fury sdf shader
+PRIMITIVE_CODES = {'sphere': 1, 'torus': 2, 'ellipsoid': 3, 'capsule': 4}
+
+RAW_MAGIC = b'FURYPRIM'
+RAW_VERSION = 1
+_RAW_HEADER = struct.Struct('<8sIIQ')     # magic, version, fields, rows
+_RAW_FIELD = struct.Struct('<16s8sIIQ')   # name, dtype, columns, 0, offset
+_RAW_ALIGN = 64
+
+
+def primitive_names(codes):
+    """Names of the primitive types of an array of codes."""
+    names = {code: name for name, code in PRIMITIVE_CODES.items()}
+    return [names[code] for code in np.asarray(codes).tolist()]
+
+
+def primitive_codes(names):
+    """Codes of a sequence of primitive type names."""
+    return np.fromiter((PRIMITIVE_CODES[name] for name in names),
+                       dtype=np.uint8)
+
+
+# =============================================================================
+# Raw layout
+# =============================================================================
+
+def save_raw(path, arrays):
+    """Write a dict of arrays (same number of rows) in the raw layout."""
+    arrays = {name: np.ascontiguousarray(array)
+              for name, array in arrays.items()}
+    rows = {len(array) for array in arrays.values()}
+    if len(rows) != 1:
+        raise ValueError('All the arrays must have the same number of rows')
+
+    offset = _RAW_HEADER.size + _RAW_FIELD.size * len(arrays)
+    fields = []
+    for name, array in arrays.items():
+        offset += -offset % _RAW_ALIGN
+        columns = array.shape[1] if array.ndim > 1 else 1
+        fields.append(_RAW_FIELD.pack(name.encode('ascii'),
+                                      array.dtype.str.encode('ascii'),
+                                      columns, 0, offset))
+        offset += array.nbytes
+
+    with open(path, 'wb') as f:
+        f.write(_RAW_HEADER.pack(RAW_MAGIC, RAW_VERSION, len(arrays),
+                                 rows.pop()))
+        for field in fields:
+            f.write(field)
+        for array in arrays.values():
+            f.write(b'\0' * (-f.tell() % _RAW_ALIGN))
+            f.write(array.tobytes())
+
+
+def load_raw(path):
+    """Memory-map the arrays of a file written by :func:`save_raw`."""
+    with open(path, 'rb') as f:
+        magic, version, count, rows = _RAW_HEADER.unpack(
+            f.read(_RAW_HEADER.size))
+        if magic != RAW_MAGIC or version != RAW_VERSION:
+            raise ValueError('{0} is not a primitive file (version {1})'
+                             .format(path, RAW_VERSION))
+        fields = [_RAW_FIELD.unpack(f.read(_RAW_FIELD.size))
+                  for _ in range(count)]
+
+    arrays = {}
+    for name, dtype, columns, _, offset in fields:
+        shape = (rows, columns) if columns > 1 else (rows,)
+        arrays[name.rstrip(b'\0').decode('ascii')] = np.memmap(
+            path, dtype=np.dtype(dtype.rstrip(b'\0').decode('ascii')),
+            mode='r', offset=offset, shape=shape)
+    return arrays
+
+
+# =============================================================================
+# Streaming JSON
+# =============================================================================
+
+_NUMBER_SEPARATORS = str.maketrans('[],', '   ')
+_STRING = re.compile(r'"((?:[^"\\]|\\.)*)"')
+_ROWS_END = re.compile(r'\]\s*\]')
+
+
+class _Chunks(object):
+    """Text of a file read by chunks, consumed from ``pos``."""
+
+    def __init__(self, f, chunk_size):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+
+    def more(self):
+        """Append the next chunk, dropping the consumed text."""
+        if self.eof:
+            raise ValueError('Unexpected end of JSON file')
+        chunk = self.f.read(self.chunk_size)
+        self.eof = not chunk
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+
+    def peek(self):
+        """Next non blank character, without consuming it."""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos].isspace():
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            self.more()
+
+    def expect(self, chars):
+        char = self.peek()
+        if char not in chars:
+            raise ValueError('Expected one of {0!r}, got {1!r}'.format(
+                chars, char))
+        self.pos += 1
+        return char
+
+    def string(self):
+        self.expect('"')
+        self.pos -= 1
+        while True:
+            match = _STRING.match(self.buf, self.pos)
+            if match:
+                self.pos = match.end()
+                return match.group(1)
+            self.more()
+
+    def skip_value(self):
+        """Skip a value of any type, e.g. the unknown keys."""
+        depth = 0
+        while True:
+            char = self.peek()
+            if char == '"':
+                self.string()
+            elif char in '[{':
+                depth += 1
+                self.pos += 1
+            elif char in ']}':
+                if depth == 0:
+                    return
+                depth -= 1
+                self.pos += 1
+            elif char == ',' and depth == 0:
+                return
+            else:
+                self.pos += 1
+            if depth == 0 and char in ']}"':
+                return
+
+
+def _read_numbers(chunks):
+    """Read a list of numbers, or of rows of numbers, as a 2D array."""
+    chunks.expect('[')
+    if chunks.peek() == ']':
+        chunks.pos += 1
+        return np.empty((0, 1))
+    nested = chunks.peek() == '['
+    parts = []
+    columns = None
+    while True:
+        # Parse the complete rows (or numbers) of the buffer at once
+        if nested:
+            match = _ROWS_END.search(chunks.buf, chunks.pos)
+            end = match.start() + 1 if match else \
+                chunks.buf.rfind(']', chunks.pos) + 1
+        else:
+            end = chunks.buf.find(']', chunks.pos)
+            match = end >= 0
+            if not match:
+                end = chunks.buf.rfind(',', chunks.pos) + 1
+        if end > chunks.pos:
+            text = chunks.buf[chunks.pos:end]
+            if columns is None:
+                columns = text[:text.find(']')].count(',') + 1 \
+                    if nested else 1
+            parts.append(np.fromstring(
+                text.translate(_NUMBER_SEPARATORS), sep=' '))
+            chunks.pos = end
+        # The closing bracket may only come with the next chunk
+        if match or (nested and chunks.peek() == ']'):
+            chunks.expect(']')
+            break
+        chunks.more()
+    values = np.concatenate(parts)
+    if len(values) % columns:
+        raise ValueError('Rows of different lengths in a JSON array')
+    return values.reshape(-1, columns)
+
+
+def _read_primitive_names(chunks):
+    chunks.expect('[')
+    parts = []
+    while True:
+        end = chunks.buf.find(']', chunks.pos)
+        last = end if end >= 0 else chunks.buf.rfind(',', chunks.pos)
+        if last > chunks.pos:
+            parts.append(primitive_codes(
+                _STRING.findall(chunks.buf, chunks.pos, last)))
+            chunks.pos = last
+        if end >= 0:
+            chunks.expect(']')
+            break
+        chunks.more()
+    return np.concatenate(parts) if parts else np.empty(0, np.uint8)
+
+
+def load_json(path, chunk_size=1 << 20):
+    """Parse a JSON scene by chunks into typed arrays."""
+    arrays = {}
+    with open(path) as f:
+        chunks = _Chunks(f, chunk_size)
+        chunks.expect('{')
+        if chunks.peek() == '}':
+            return arrays
+        while True:
+            key = chunks.string()
+            chunks.expect(':')
+            if key == 'primitives':
+                arrays[key] = _read_primitive_names(chunks)
+            elif chunks.peek() == '[':
+                values = _read_numbers(chunks)
+                arrays[key] = values[:, 0] if values.shape[1] == 1 \
+                    else values
+            else:
+                chunks.skip_value()
+            if chunks.expect(',}') == '}':
+                return arrays
+
+
+# =============================================================================
+# Any format
+# =============================================================================
+
+def load_primitives(path):
+    """Return the dict of arrays of a scene file, see the module doc."""
+    if path.endswith('.json'):
+        return load_json(path)
+    if path.endswith('.npz'):
+        with np.load(path) as npz:
+            return {name: npz[name] for name in npz.files}
+    if path.endswith('.npy'):
+        array = np.load(path, mmap_mode='r')
+        if array.dtype.names:
+            return {name: array[name] for name in array.dtype.names}
+        return {'centers': array}
+    return load_raw(path)
+
+
+def save_series(path, arrays):
+    """Write a simulation, arrays of shape (steps, n, ...) by attribute."""
+    steps = {len(array) for array in arrays.values()}
+    if len(steps) != 1:
+        raise ValueError('All the arrays must have the same number of steps')
+    os.makedirs(path, exist_ok=True)
+    for name, array in arrays.items():
+        np.save(os.path.join(path, name + '.npy'), np.ascontiguousarray(array))
+
+
+def load_series(path):
+    """Memory-map the arrays of a simulation written by :func:`save_series`.
+    """
+    arrays = {name[:-len('.npy')]: np.load(os.path.join(path, name),
+                                           mmap_mode='r')
+              for name in sorted(os.listdir(path)) if name.endswith('.npy')}
+    if 'centers' not in arrays:
+        raise ValueError('{0} has no centers.npy'.format(path))
+    return arrays
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Convert a primitive scene to the raw layout.')
+    parser.add_argument('input', help='.json, .npy, .npz or .fwp scene')
+    parser.add_argument('output', help='.fwp file to write')
+    args = parser.parse_args(argv)
+    save_raw(args.output, load_primitives(args.input))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""Per-view render scheduling on top of the Twisted reactor.
+
+Every view owns at most one pending timer. Render requests only mark the
+view dirty and move its deadline earlier if needed, so any number of
+requests issued before the timer fires (``UpdateEvent`` observers, RPCs,
+stale refinements, animation ticks) are merged into a single render.
+"""
+from twisted.internet import reactor
+
+
+class RenderScheduler(object):
+    """Merge render requests into one timer per view.
+
+    Parameters
+    ----------
+    render : callable
+        Called as ``render(viewId, priority)`` when the timer of a dirty view
+        fires. ``priority`` is the most urgent priority requested since the
+        previous render.
+    clock : IReactorTime, optional
+        Reactor used for the timers (default: the global Twisted reactor).
+    """
+
+    # Priorities, most urgent first
+    INTERACTION = 0
+    STALE = 1
+    IDLE = 2
+
+    def __init__(self, render, clock=reactor):
+        self.render = render
+        self.clock = clock
+        self.views = {}
+
+    def _getView(self, vId):
+        if vId not in self.views:
+            self.views[vId] = {'timer': None,
+                               'deadline': None,
+                               'priority': None,
+                               'rendering': False,
+                               'requests': 0,
+                               'renders': 0,
+                               'merged': 0}
+        return self.views[vId]
+
+    def request(self, vId, priority=IDLE, delay=0):
+        """Mark the view dirty and make sure it is rendered within delay.
+
+        If a render of the view is already pending, the request is merged
+        into it and only brings its deadline forward.
+        """
+        view = self._getView(vId)
+        view['requests'] += 1
+        deadline = self.clock.seconds() + max(delay, 0)
+
+        if view['priority'] is None:
+            view['priority'] = priority
+        else:
+            view['merged'] += 1
+            view['priority'] = min(view['priority'], priority)
+
+        if view['deadline'] is not None and view['deadline'] <= deadline:
+            return
+        view['deadline'] = deadline
+
+        # The timer is armed again once the running render is done
+        if not view['rendering']:
+            self._arm(vId)
+
+    def isPending(self, vId):
+        return vId in self.views and self.views[vId]['priority'] is not None
+
+    def cancel(self, vId):
+        """Forget about a view, dropping its pending render if any."""
+        view = self.views.pop(vId, None)
+        if view and view['timer'] and view['timer'].active():
+            view['timer'].cancel()
+
+    def getStats(self, vId):
+        view = self._getView(vId)
+        return {'requests': view['requests'],
+                'renders': view['renders'],
+                'merged': view['merged']}
+
+    def _arm(self, vId):
+        view = self.views[vId]
+        delay = max(view['deadline'] - self.clock.seconds(), 0)
+        timer = view['timer']
+        if timer and timer.active():
+            timer.reset(delay)
+        else:
+            view['timer'] = self.clock.callLater(delay, self._fire, vId)
+
+    def _fire(self, vId):
+        view = self.views.get(vId)
+        if not view:
+            return
+
+        view['timer'] = None
+        priority = view['priority']
+        view['priority'] = None
+        view['deadline'] = None
+        if priority is None:
+            return
+
+        view['rendering'] = True
+        try:
+            view['renders'] += 1
+            self.render(vId, priority)
+        finally:
+            view['rendering'] = False
+
+        # Requests made while rendering (next animation frame, stale
+        # refinement, ...) are scheduled now
+        if vId in self.views and view['priority'] is not None:
+            self._arm(vId)
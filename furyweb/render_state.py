@@ -0,0 +1,93 @@
+"""Fast/full render state hooks for progressive image delivery.
+
+Each function returns a ``(fast, full)`` pair of callables meant to be given
+to ``vtkWebPublishImageDelivery.registerRenderStateHooks``. Both callables
+take the view (render window) as their only argument.
+"""
+
+
+def _renderers(view):
+    renderers = view.GetRenderers()
+    renderers.InitTraversal()
+    renderer = renderers.GetNextItem()
+    while renderer is not None:
+        yield renderer
+        renderer = renderers.GetNextItem()
+
+
+def depth_peeling_hooks():
+    """Turn depth peeling (``order_transparent``) off while interacting."""
+    saved = []
+
+    def fast(view):
+        for renderer in _renderers(view):
+            saved.append((renderer, renderer.GetUseDepthPeeling()))
+            renderer.SetUseDepthPeeling(False)
+
+    def full(view):
+        for renderer, use_depth_peeling in saved:
+            renderer.SetUseDepthPeeling(use_depth_peeling)
+        del saved[:]
+
+    return fast, full
+
+
+def lod_actor_hooks(full_actors, fast_actors):
+    """Show cheap stand-in actors instead of the full ones while interacting.
+
+    Parameters
+    ----------
+    full_actors : list of vtkProp3D
+        Actors displayed once the view is idle.
+    fast_actors : list of vtkProp3D
+        Actors displayed while interacting. They must already be in the
+        scene.
+    """
+    for fast_actor in fast_actors:
+        fast_actor.SetVisibility(False)
+
+    def fast(view):
+        for full_actor in full_actors:
+            full_actor.SetVisibility(False)
+        for fast_actor in fast_actors:
+            fast_actor.SetVisibility(True)
+
+    def full(view):
+        for fast_actor in fast_actors:
+            fast_actor.SetVisibility(False)
+        for full_actor in full_actors:
+            full_actor.SetVisibility(True)
+
+    return fast, full
+
+
+def lod_mapper_hooks(levels):
+    """Render actors through coarser mappers while interacting.
+
+    Swapping the mapper, rather than the mapper input, keeps the buffers of
+    both levels on the GPU, and the actor itself (property, observers,
+    picking) is unchanged.
+
+    Parameters
+    ----------
+    levels : dict
+        Mapper used while interacting for each actor. It may be filled
+        later, e.g. once the decimated meshes are computed in the
+        background. Hidden actors are left alone.
+    """
+    saved = []
+
+    def fast(view):
+        if saved:
+            return
+        for lod_actor, fast_mapper in list(levels.items()):
+            if lod_actor.GetVisibility():
+                saved.append((lod_actor, lod_actor.GetMapper()))
+                lod_actor.SetMapper(fast_mapper)
+
+    def full(view):
+        for lod_actor, full_mapper in saved:
+            lod_actor.SetMapper(full_mapper)
+        del saved[:]
+
+    return fast, full
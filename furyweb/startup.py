@@ -0,0 +1,153 @@
+r"""
+Startup profile of the application servers.
+
+Run a server script through this module to get, once the first frame is
+rendered, the time spent importing each module and a timeline of the
+startup (process start, initialize, first frame)::
+
+    $ pvpython /pvw/furyweb/startup.py /pvw/apps/tumor/server/fury_server.py \
+        --port 9001 --load-default true
+
+The servers call :func:`mark` and :func:`watch_first_frame` from
+``initialize``; both do nothing unless the server runs under this profiler.
+"""
+import builtins
+import os
+import runpy
+import sys
+import time
+
+_profiler = None
+
+
+def _process_start_time():
+    """Wall clock time at which this process was started (Linux only)."""
+    try:
+        with open('/proc/self/stat') as f:
+            # The command name may contain spaces, fields follow the ')'
+            fields = f.read().rsplit(')', 1)[1].split()
+        with open('/proc/stat') as f:
+            boot_time = next(float(line.split()[1]) for line in f
+                             if line.startswith('btime'))
+        return boot_time + float(fields[19]) / os.sysconf('SC_CLK_TCK')
+    except (OSError, IndexError, StopIteration, ValueError):
+        return None
+
+
+class StartupProfiler(object):
+    """Time the imports done through ``__import__`` and startup events."""
+
+    def __init__(self):
+        self.process_start = _process_start_time()
+        self.start = time.time()
+        self.marks = []
+        self.imports = {}
+        self._stack = []
+        self._import = builtins.__import__
+
+    def install(self):
+        builtins.__import__ = self._timed_import
+
+    def uninstall(self):
+        builtins.__import__ = self._import
+
+    def _timed_import(self, name, globals=None, locals=None, fromlist=(),
+                      level=0):
+        if level and globals:
+            package = globals.get('__package__') or ''
+            name_key = '.'.join(filter(None, [
+                package.rsplit('.', level - 1)[0], name]))
+        else:
+            name_key = name
+        # from package import submodule: only the submodule may be new
+        if name_key in sys.modules and not any(
+                '{0}.{1}'.format(name_key, item) not in sys.modules
+                for item in fromlist or () if item != '*'):
+            return self._import(name, globals, locals, fromlist, level)
+
+        self._stack.append(0.)
+        start = time.perf_counter()
+        try:
+            return self._import(name, globals, locals, fromlist, level)
+        finally:
+            elapsed = time.perf_counter() - start
+            children = self._stack.pop()
+            if self._stack:
+                self._stack[-1] += elapsed
+            self_time, cumulative = self.imports.get(name_key, (0., 0.))
+            self.imports[name_key] = (self_time + elapsed - children,
+                                      cumulative + elapsed)
+
+    def mark(self, name):
+        self.marks.append((name, time.time()))
+
+    def report(self, top=20):
+        lines = ['Startup profile', '===============', '', 'Timeline:']
+        origin = self.process_start or self.start
+        events = [('profiler start', self.start)] + self.marks
+        if self.process_start:
+            events.insert(0, ('process start', self.process_start))
+        for name, timestamp in events:
+            lines.append('  {0:>8.3f}s  {1}'.format(timestamp - origin, name))
+
+        packages = {}
+        for name, (self_time, _) in self.imports.items():
+            package = name.split('.')[0]
+            packages[package] = packages.get(package, 0.) + self_time
+        total = sum(packages.values())
+        lines += ['', 'Import time by package (total {0:.3f}s):'.format(
+            total)]
+        for package, seconds in sorted(packages.items(),
+                                       key=lambda item: -item[1])[:top]:
+            lines.append('  {0:>8.3f}s  {1}'.format(seconds, package))
+
+        lines += ['', 'Slowest imports (cumulative):']
+        for name, (_, cumulative) in sorted(self.imports.items(),
+                                            key=lambda item: -item[1][1]
+                                            )[:top]:
+            lines.append('  {0:>8.3f}s  {1}'.format(cumulative, name))
+        return '\n'.join(lines)
+
+
+def mark(name):
+    """Record a startup event, when profiling."""
+    if _profiler is not None:
+        _profiler.mark(name)
+
+
+def watch_first_frame(render_window):
+    """Print the profile once the render window renders its next frame."""
+    if _profiler is None:
+        return
+
+    import vtk
+
+    def on_render(obj, event):
+        render_window.RemoveObserver(tag)
+        _profiler.mark('first frame')
+        _profiler.uninstall()
+        print(_profiler.report())
+        sys.stdout.flush()
+
+    tag = render_window.AddObserver(vtk.vtkCommand.EndEvent, on_render)
+
+
+def profile(script, argv):
+    """Run a server script with the startup profiler installed."""
+    global _profiler
+    _profiler = StartupProfiler()
+    _profiler.install()
+    sys.argv = [script] + list(argv)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(script)))
+    runpy.run_path(script, run_name='__main__')
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print('usage: startup.py SCRIPT [ARGS...]')
+        sys.exit(1)
+    # Import this module as furyweb.startup so that the server shares it
+    sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                 os.pardir)))
+    from furyweb import startup
+    startup.profile(sys.argv[1], sys.argv[2:])
@@ -0,0 +1,222 @@
+r"""
+Opt-in latency tracing of the wslink RPCs exposed by a server.
+
+Every method decorated with ``@register``/``@exportRpc`` on the protocols
+registered by the server is wrapped to record its call count, latency
+percentiles, exceptions and request/response payload sizes. RPCs run on the
+reactor thread, so a call lasting longer than the slow threshold blocks every
+other client message: a watchdog thread then samples the stack of the
+reactor thread and logs it.
+
+Tracing is enabled from the command line::
+
+    $ pvpython .../vtk_server.py --trace-rpc --trace-slow-ms 50 \
+        --trace-log-dir /pvw/launcher/log
+
+The statistics are available through the ``rpc.trace.get`` RPC and, when a
+log directory is given, written there as JSON when the server shuts down.
+"""
+import collections
+import functools
+import inspect
+import json
+import os
+import sys
+import threading
+import time
+import traceback
+
+from twisted.internet import reactor
+from vtk.web import protocols as vtk_protocols
+from wslink import register as exportRpc
+
+from furyweb.metrics import Histogram
+
+_options = None
+
+
+def add_arguments(parser):
+    """Add the tracing options to the server argument parser."""
+    parser.add_argument("--trace-rpc", default=False, action="store_true",
+                        dest="trace_rpc",
+                        help="record latency statistics of every RPC.")
+    parser.add_argument("--trace-slow-ms", default=100., type=float,
+                        dest="trace_slow_ms",
+                        help="log a stack sample of RPCs blocking the reactor "
+                             "longer than this (in ms).")
+    parser.add_argument("--trace-log-dir", default=None, dest="trace_log_dir",
+                        help="directory where the RPC statistics are written "
+                             "at shutdown (e.g. the launcher log_dir).")
+
+
+def configure(args):
+    global _options
+    _options = args
+
+
+def _payload_size(payload):
+    try:
+        return len(json.dumps(payload, default=str))
+    except (TypeError, ValueError):
+        return 0
+
+
+class RpcStats(object):
+    """Statistics of a single RPC."""
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.last_error = None
+        self.latency = Histogram()
+        self.request_bytes = 0
+        self.response_bytes = 0
+        self.max_request_bytes = 0
+
+    def to_dict(self):
+        return {'count': self.count,
+                'errors': self.errors,
+                'lastError': self.last_error,
+                'latency': self.latency.to_dict(),
+                'requestBytes': self.request_bytes,
+                'responseBytes': self.response_bytes,
+                'maxRequestBytes': self.max_request_bytes}
+
+
+class RpcTracer(object):
+    """Wrap RPC methods and collect their statistics.
+
+    Parameters
+    ----------
+    slow_threshold : float, optional
+        Duration in seconds above which a call is considered to block the
+        reactor.
+    """
+
+    def __init__(self, slow_threshold=.1):
+        self.slow_threshold = slow_threshold
+        self.stats = collections.defaultdict(RpcStats)
+        self.slow_calls = collections.deque(maxlen=50)
+        self.reactor_thread_id = threading.current_thread().ident
+        self._lock = threading.Lock()
+        self._current = None
+        self._watchdog = None
+
+    def instrument(self, protocol):
+        """Trace every RPC method of the protocol class."""
+        cls = protocol.__class__
+        for name, func in inspect.getmembers(cls, inspect.isfunction):
+            uris = getattr(func, '_wslinkuris', None)
+            if not uris or getattr(func, '_furyweb_traced', False):
+                continue
+            setattr(cls, name, self.wrap(func, uris[0]['uri']))
+
+    def wrap(self, func, uri):
+        # functools.wraps also copies _wslinkuris so that wslink still
+        # registers the wrapper under the same uri.
+        @functools.wraps(func)
+        def traced(*args, **kwargs):
+            call = {'uri': uri, 'start': time.time(), 'stack': None}
+            with self._lock:
+                self._current = call
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                self.stats[uri].errors += 1
+                self.stats[uri].last_error = repr(e)
+                raise
+            else:
+                self.stats[uri].response_bytes += _payload_size(result)
+                return result
+            finally:
+                with self._lock:
+                    self._current = None
+                self.record(call, args[1:], kwargs)
+
+        traced._furyweb_traced = True
+        return traced
+
+    def record(self, call, args, kwargs):
+        duration = time.time() - call['start']
+        stats = self.stats[call['uri']]
+        stats.count += 1
+        stats.latency.observe(duration)
+        request_bytes = _payload_size([args, kwargs])
+        stats.request_bytes += request_bytes
+        stats.max_request_bytes = max(stats.max_request_bytes, request_bytes)
+
+        if duration > self.slow_threshold:
+            slow_call = {'uri': call['uri'],
+                         'start': call['start'],
+                         'duration': duration,
+                         'stack': call['stack']}
+            self.slow_calls.append(slow_call)
+            print('Slow RPC {0}: {1:.1f} ms blocking the reactor'.format(
+                call['uri'], duration * 1000))
+            if call['stack']:
+                print(call['stack'])
+
+    def start_watchdog(self):
+        """Sample the reactor stack of calls exceeding the slow threshold."""
+        self._watchdog = threading.Thread(target=self._watch,
+                                          name='rpc-trace-watchdog')
+        self._watchdog.daemon = True
+        self._watchdog.start()
+
+    def _watch(self):
+        while True:
+            time.sleep(self.slow_threshold / 2.)
+            with self._lock:
+                call = self._current
+                if call is None or call['stack'] is not None or \
+                        time.time() - call['start'] < self.slow_threshold:
+                    continue
+                frame = sys._current_frames().get(self.reactor_thread_id)
+                if frame is not None:
+                    call['stack'] = ''.join(traceback.format_stack(frame))
+
+    def to_dict(self):
+        return {'slowThreshold': self.slow_threshold,
+                'rpcs': dict((uri, stats.to_dict())
+                             for uri, stats in self.stats.items()),
+                'slowCalls': list(self.slow_calls)}
+
+    def write(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+        print('RPC trace written to {0}'.format(path))
+
+
+class RpcTracingProtocol(vtk_protocols.vtkWebProtocol):
+
+    def __init__(self, tracer):
+        super(RpcTracingProtocol, self).__init__()
+        self.tracer = tracer
+
+    @exportRpc("rpc.trace.get")
+    def getTrace(self):
+        return self.tracer.to_dict()
+
+
+def instrument(server_protocol):
+    """Trace the RPCs of every protocol registered on the server so far.
+
+    Does nothing unless the server was started with ``--trace-rpc``. Must be
+    called at the end of ``initialize``.
+    """
+    if _options is None or not _options.trace_rpc:
+        return None
+
+    tracer = RpcTracer(_options.trace_slow_ms / 1000.)
+    for protocol in server_protocol.getLinkProtocols():
+        tracer.instrument(protocol)
+    server_protocol.registerVtkWebProtocol(RpcTracingProtocol(tracer))
+    tracer.start_watchdog()
+
+    if _options.trace_log_dir:
+        path = os.path.join(_options.trace_log_dir, 'rpc_trace_{0}_{1}.json'
+                            .format(_options.port, os.getpid()))
+        reactor.addSystemEventTrigger('before', 'shutdown', tracer.write,
+                                      path)
+
+    return tracer
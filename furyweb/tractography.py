@@ -0,0 +1,444 @@
+r"""
+Memory-mapped tractograms and their levels of detail.
+
+A tractogram of millions of streamlines does not fit comfortably in memory,
+and a view never shows all of its points anyway. ``load_tractogram`` maps a
+TrackVis ``.trk`` or MRtrix ``.tck`` file without reading it: only the
+index of the streamlines (offset and number of points of each one, found by
+a single pass over the file) is kept, and the points of a selection of
+streamlines are read on demand.
+
+The coarser representations, every streamline resampled to a few fixed
+numbers of points (``resample_levels``), are computed by streaming the file
+once, in chunks of streamlines, and cached as ``.npy`` files next to it
+(see ``furyweb.mesh_cache``), keyed by the hash of its content. They are
+memory-mapped again when used. The QuickBundles clusters, computed on the
+12-point level, are cached the same way by ``furyweb.clustering``.
+
+Coordinates are returned in RAS+ mm: ``.tck`` files store them so, the
+TrackVis voxmm coordinates are converted through the ``vox_to_ras`` matrix
+of the header.
+"""
+import hashlib
+import os
+import struct
+
+import numpy as np
+import vtk
+from vtk.util import numpy_support
+
+from furyweb import mesh_cache
+
+TRK_HEADER_SIZE = 1000
+
+# Points per streamline of the precomputed levels, the 12-point level is
+# the one QuickBundles compares streamlines with
+RESAMPLED_POINTS = (4, 12)
+
+# Streamlines read at once when streaming a tractogram
+CHUNK_SIZE = 20000
+
+_TCK_DTYPES = {'Float32LE': '<f4', 'Float32BE': '>f4',
+               'Float64LE': '<f8', 'Float64BE': '>f8'}
+
+
+class Tractogram(object):
+    """Streamlines of a tractogram file, read through a memory map.
+
+    The coordinates of streamline ``i`` are the values
+    ``data[offsets[i] + stride * k + (0, 1, 2)]`` for its ``lengths[i]``
+    points ``k``.
+
+    Parameters
+    ----------
+    path : str
+    data : memmap
+        Values of the file, 1D.
+    offsets, lengths : ndarray (n_streamlines,)
+    stride : int
+        Values per point (the TrackVis scalars follow the coordinates).
+    affine : ndarray (4, 4), optional
+        Transform of the stored coordinates to RAS+ mm.
+    """
+
+    def __init__(self, path, data, offsets, lengths, stride=3, affine=None):
+        self.path = path
+        self.data = data
+        self.offsets = offsets
+        self.lengths = lengths
+        self.stride = stride
+        self.affine = affine
+
+    def __len__(self):
+        return len(self.lengths)
+
+    @property
+    def n_points(self):
+        return int(self.lengths.sum())
+
+    def points(self, index):
+        """Points of some streamlines, concatenated.
+
+        Parameters
+        ----------
+        index : slice or array of int
+            Streamlines to read, preferably in increasing order so that the
+            file is read forward.
+
+        Returns
+        -------
+        points : ndarray (n_points, 3) float32
+        lengths : ndarray (n_streamlines,)
+        """
+        offsets = self.offsets[index]
+        lengths = self.lengths[index]
+        starts = np.cumsum(lengths) - lengths
+        positions = np.repeat(offsets - self.stride * starts, lengths) + \
+            self.stride * np.arange(lengths.sum())
+        points = self.data[positions[:, None] + np.arange(3)].astype(
+            np.float32)
+        if self.affine is not None:
+            points = np.dot(points, self.affine[:3, :3].T.astype(np.float32))
+            points += self.affine[:3, 3].astype(np.float32)
+        return points, lengths
+
+    def streamline(self, i):
+        return self.points([i])[0]
+
+    def chunks(self, chunk_size=CHUNK_SIZE):
+        """Yield the first streamline, points and lengths of each chunk."""
+        for start in range(0, len(self), chunk_size):
+            points, lengths = self.points(slice(start, start + chunk_size))
+            yield start, points, lengths
+
+
+def content_hash(path, cache_dir=None):
+    """sha1 of a file, remembered for its size and modification time.
+
+    Hashing a tractogram of several gigabytes takes seconds, it is only
+    done again when the file changed.
+    """
+    directory = mesh_cache._cache_dir(path, cache_dir)
+    stat = os.stat(path)
+    stamp = '%d %d' % (stat.st_size, stat.st_mtime_ns)
+    memo = None
+    if directory is not None:
+        memo = os.path.join(directory, '%s.%s.sha1' % (
+            os.path.basename(path),
+            hashlib.sha1(os.path.abspath(path).encode()).hexdigest()[:8]))
+        if os.path.isfile(memo):
+            with open(memo) as f:
+                saved = f.read().split('\n')
+            if saved[0] == stamp:
+                return saved[1]
+    digest = mesh_cache.file_hash(path)
+    if memo is not None:
+        tmp_path = '%s.%d.tmp' % (memo, os.getpid())
+        try:
+            with open(tmp_path, 'w') as f:
+                f.write('%s\n%s\n' % (stamp, digest))
+            os.replace(tmp_path, memo)
+        except OSError:
+            pass
+    return digest
+
+
+def cache_prefix(path, cache_dir=None):
+    """Path prefix of the cache files of a tractogram (None: no cache)."""
+    directory = mesh_cache._cache_dir(path, cache_dir)
+    if directory is None:
+        return None
+    return os.path.join(directory, '%s.%s' % (
+        os.path.basename(path), content_hash(path, cache_dir)[:16]))
+
+
+def _cached_array(path, compute):
+    """Load a cached array memory-mapped, or compute and cache it."""
+    if path is not None and os.path.isfile(path):
+        return np.load(path, mmap_mode='r')
+    array = compute()
+    if path is None:
+        return array
+    try:
+        mesh_cache._save(path, array)
+    except OSError:
+        return array
+    return np.load(path, mmap_mode='r')
+
+
+def _trk_header(path):
+    with open(path, 'rb') as f:
+        header = f.read(TRK_HEADER_SIZE)
+    if len(header) < TRK_HEADER_SIZE or header[:5] != b'TRACK':
+        raise ValueError('%s is not a TrackVis file' % path)
+    endian = '<' if struct.unpack('<i', header[996:1000])[0] == \
+        TRK_HEADER_SIZE else '>'
+
+    def read(fmt, offset):
+        return struct.unpack_from(endian + fmt, header, offset)
+
+    voxel_size = np.array(read('3f', 12), dtype=np.float64)
+    vox_to_ras = np.array(read('16f', 440), dtype=np.float64).reshape(4, 4)
+    affine = None
+    if vox_to_ras[3, 3] != 0 and np.all(voxel_size > 0):
+        # voxmm -> voxel (TrackVis counts from the corner of the voxels)
+        voxmm_to_vox = np.diag(list(1. / voxel_size) + [1.])
+        voxmm_to_vox[:3, 3] = -.5
+        affine = np.dot(vox_to_ras, voxmm_to_vox)
+    return {'endian': endian, 'n_scalars': read('h', 36)[0],
+            'n_properties': read('h', 238)[0], 'n_count': read('i', 988)[0],
+            'affine': affine}
+
+
+def _trk_index(data, stride, n_properties, n_count):
+    # The number of points of each streamline is needed to find the next
+    # one, a pass over the records has to be sequential
+    counts = np.asarray(data).view(data.dtype.byteorder + 'i4')
+    offsets, lengths = [], []
+    position, size = 0, len(counts)
+    while position < size and (not n_count or len(lengths) < n_count):
+        n = int(counts[position])
+        offsets.append(position + 1)
+        lengths.append(n)
+        position += 1 + n * stride + n_properties
+    offsets, lengths = np.array(offsets, dtype=np.int64), np.array(
+        lengths, dtype=np.int64)
+    keep = lengths > 0
+    return offsets[keep], lengths[keep]
+
+
+def _tck_header(path):
+    fields = {}
+    with open(path, 'rb') as f:
+        if f.readline().strip() != b'mrtrix tracks':
+            raise ValueError('%s is not a MRtrix tracks file' % path)
+        for line in f:
+            line = line.decode('latin-1').strip()
+            if line == 'END':
+                break
+            key, _, value = line.partition(':')
+            fields[key.strip()] = value.strip()
+    if fields.get('datatype') not in _TCK_DTYPES:
+        raise ValueError('Unsupported tracks datatype: %s' %
+                         fields.get('datatype'))
+    return {'dtype': _TCK_DTYPES[fields['datatype']],
+            'offset': int(fields['file'].split()[1])}
+
+
+def _tck_index(data, chunk_rows=1 << 22):
+    # Streamlines are separated by a row of NaN, the last one followed by a
+    # row of Inf
+    rows = data.reshape(-1, 3)
+    separators = []
+    end = len(rows)
+    for start in range(0, len(rows), chunk_rows):
+        x = np.asarray(rows[start:start + chunk_rows, 0])
+        separators.append(start + np.flatnonzero(np.isnan(x)))
+        infinite = np.flatnonzero(np.isinf(x))
+        if len(infinite):
+            end = start + infinite[0]
+            break
+    separators = np.concatenate(separators)
+    separators = np.append(separators[separators < end], end)
+    starts = np.concatenate([[0], separators[:-1] + 1])
+    lengths = separators - starts
+    keep = lengths > 0
+    return 3 * starts[keep].astype(np.int64), lengths[keep].astype(np.int64)
+
+
+def load_tractogram(path, cache_dir=None):
+    """Map a ``.trk`` or ``.tck`` file without reading its streamlines.
+
+    Parameters
+    ----------
+    path : str
+    cache_dir : str, optional
+        Directory of the cached index and levels (default: a
+        ``.furyweb_cache`` folder next to path, or in the temp directory if
+        not writable).
+
+    Returns
+    -------
+    Tractogram
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.trk':
+        header = _trk_header(path)
+        data = np.memmap(path, dtype=header['endian'] + 'f4', mode='r',
+                         offset=TRK_HEADER_SIZE)
+        stride = 3 + header['n_scalars']
+        affine = header['affine']
+
+        def index():
+            offsets, lengths = _trk_index(data, stride,
+                                          header['n_properties'],
+                                          header['n_count'])
+            return np.stack([offsets, lengths], axis=1)
+    elif extension == '.tck':
+        header = _tck_header(path)
+        data = np.memmap(path, dtype=header['dtype'], mode='r',
+                         offset=header['offset'])
+        data = data[:len(data) // 3 * 3]
+        stride = 3
+        affine = None
+
+        def index():
+            return np.stack(_tck_index(data), axis=1)
+    else:
+        raise ValueError('Unsupported tractogram format: %s' % path)
+
+    prefix = cache_prefix(path, cache_dir)
+    streamlines = _cached_array(
+        prefix and prefix + '.index.npy', index)
+    return Tractogram(path, data, streamlines[:, 0], streamlines[:, 1],
+                      stride, affine)
+
+
+def resample(points, lengths, n_points):
+    """Resample streamlines to points equally spaced along their length.
+
+    Parameters
+    ----------
+    points : ndarray (total_points, 3)
+        Points of the streamlines, concatenated (see
+        ``Tractogram.points``).
+    lengths : ndarray (n_streamlines,)
+        Number of points of each streamline, at least 1.
+    n_points : int
+
+    Returns
+    -------
+    ndarray (n_streamlines, n_points, 3) float32
+    """
+    if not len(lengths):
+        return np.empty((0, n_points, 3), dtype=np.float32)
+    ends = np.cumsum(lengths)
+    starts = ends - lengths
+    # Arc length at each point, from the first point of the chunk, with no
+    # segment between consecutive streamlines
+    segments = np.zeros(len(points))
+    segments[1:] = np.sqrt((np.diff(points, axis=0) ** 2).sum(axis=1))
+    segments[starts] = 0
+    arc = np.cumsum(segments)
+    targets = arc[starts][:, None] + (arc[ends - 1] - arc[starts])[:, None] \
+        * np.linspace(0., 1., n_points)
+    # Segment [j, j + 1] of each target, within its streamline
+    j = np.searchsorted(arc, targets.ravel(), side='right').reshape(
+        targets.shape) - 1
+    j = np.clip(j, starts[:, None], np.maximum(ends - 2, starts)[:, None])
+    k = np.minimum(j + 1, (ends - 1)[:, None])
+    span = arc[k] - arc[j]
+    fraction = np.where(span > 0, targets - arc[j], 0) / \
+        np.where(span > 0, span, 1)
+    resampled = points[j] + fraction[..., None] * (points[k] - points[j])
+    return resampled.astype(np.float32)
+
+
+def resample_levels(tractogram, point_counts=RESAMPLED_POINTS,
+                    chunk_size=CHUNK_SIZE, cache_dir=None):
+    """Every streamline resampled to each number of points.
+
+    The levels missing from the cache are computed in a single pass over
+    the file, chunk by chunk, straight into memory-mapped files.
+
+    Returns
+    -------
+    dict
+        ``(n_streamlines, n_points, 3)`` float32 array for each number of
+        points, memory-mapped when the cache is available.
+    """
+    prefix = cache_prefix(tractogram.path, cache_dir)
+    paths = {n: prefix and '%s.resampled%d.npy' % (prefix, n)
+             for n in point_counts}
+    levels = {n: np.load(path, mmap_mode='r') for n, path in paths.items()
+              if path is not None and os.path.isfile(path)}
+    missing = [n for n in point_counts if n not in levels]
+    if not missing:
+        return levels
+
+    outputs = {}
+    for n in missing:
+        shape = (len(tractogram), n, 3)
+        if paths[n] is None:
+            outputs[n] = np.empty(shape, dtype=np.float32)
+        else:
+            outputs[n] = np.lib.format.open_memmap(
+                '%s.%d.tmp' % (paths[n], os.getpid()), mode='w+',
+                dtype=np.float32, shape=shape)
+    for start, points, lengths in tractogram.chunks(chunk_size):
+        for n in missing:
+            outputs[n][start:start + len(lengths)] = resample(points, lengths,
+                                                              n)
+    for n in missing:
+        if paths[n] is None:
+            levels[n] = outputs[n]
+            continue
+        outputs[n].flush()
+        tmp_path = outputs[n].filename
+        del outputs[n]
+        os.replace(tmp_path, paths[n])
+        levels[n] = np.load(paths[n], mmap_mode='r')
+    return levels
+
+
+def orientation_colors(streamlines):
+    """RGB colors of the direction from the first to the last point.
+
+    Parameters
+    ----------
+    streamlines : ndarray (n_streamlines, n_points, 3)
+
+    Returns
+    -------
+    ndarray (n_streamlines, 3) uint8
+    """
+    directions = np.abs(streamlines[:, -1] - streamlines[:, 0])
+    norms = np.linalg.norm(directions, axis=1)
+    directions /= np.where(norms > 0, norms, 1)[:, None]
+    return (255 * directions).astype(np.uint8)
+
+
+def lines_polydata(points, lengths, colors=None):
+    """vtkPolyData of polylines.
+
+    Parameters
+    ----------
+    points : ndarray (total_points, 3)
+        Points of the streamlines, concatenated.
+    lengths : ndarray (n_streamlines,)
+    colors : ndarray (n_streamlines, 3) uint8, optional
+        Color of each streamline.
+    """
+    lengths = np.asarray(lengths, dtype=np.int64)
+    id_type = numpy_support.ID_TYPE_CODE
+    ids = np.arange(lengths.sum(), dtype=id_type)
+    lines = vtk.vtkCellArray()
+    if mesh_cache.LEGACY_CELLS:
+        # [n, i, j, ...] for each line
+        starts = np.cumsum(lengths) - lengths
+        cells = np.empty(len(ids) + len(lengths), dtype=id_type)
+        cells[starts + np.arange(len(lengths))] = lengths
+        mask = np.ones(len(cells), dtype=bool)
+        mask[starts + np.arange(len(lengths))] = False
+        cells[mask] = ids
+        lines.SetCells(len(lengths), numpy_support.numpy_to_vtkIdTypeArray(
+            cells, deep=True))
+    else:
+        offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(id_type)
+        lines.SetData(numpy_support.numpy_to_vtkIdTypeArray(offsets,
+                                                            deep=True),
+                      numpy_support.numpy_to_vtkIdTypeArray(ids, deep=True))
+
+    vtk_points = vtk.vtkPoints()
+    vtk_points.SetData(numpy_support.numpy_to_vtk(
+        np.ascontiguousarray(points, dtype=np.float32), deep=True))
+    polydata = vtk.vtkPolyData()
+    polydata.SetPoints(vtk_points)
+    polydata.SetLines(lines)
+    if colors is not None:
+        vtk_colors = numpy_support.numpy_to_vtk(
+            np.ascontiguousarray(np.repeat(colors, lengths, axis=0)),
+            deep=True, array_type=vtk.VTK_UNSIGNED_CHAR)
+        vtk_colors.SetName('colors')
+        polydata.GetPointData().SetScalars(vtk_colors)
+    return polydata
@@ -0,0 +1,33 @@
+#!/bin/bash
+#
+# Start a pool of pre-warmed server processes for each application (see
+# furyweb/prewarm.py), then start the launcher. Sessions requested while a
+# pool is not ready yet are started cold.
+#
+#   FURYWEB_POOL_SIZE   warm interpreters kept per application (0 disables)
+#   FURYWEB_POOL_APPS   applications to keep a pool for
+#   FURYWEB_POOL_ARGS   extra pvpython arguments of the pool daemons
+
+PYTHON_EXEC=${PYTHON_EXEC:-/opt/paraview/bin/pvpython}
+POOL_SIZE=${FURYWEB_POOL_SIZE:-2}
+POOL_APPS=${FURYWEB_POOL_APPS:-"fury demo sdf spheres tumor horizon"}
+
+declare -A SCRIPTS=(
+  [fury]=/pvw/apps/fury/server/fury_server.py
+  [demo]=/pvw/apps/demo/server/vtk_server.py
+  [sdf]=/pvw/apps/sdf/server/vtk_server.py
+  [spheres]=/pvw/apps/spheres/server/fury_server.py
+  [tumor]=/pvw/apps/tumor/server/fury_server.py
+  [horizon]=/pvw/apps/horizon/server/fury_server.py
+)
+
+if [ "$POOL_SIZE" -gt 0 ]; then
+  mkdir -p /pvw/launcher/log
+  for app in $POOL_APPS; do
+    $PYTHON_EXEC $FURYWEB_POOL_ARGS /pvw/furyweb/prewarm.py serve \
+      --pool-size "$POOL_SIZE" --socket "/tmp/furyweb-$app.sock" \
+      "${SCRIPTS[$app]}" > "/pvw/launcher/log/pool-$app.txt" 2>&1 &
+  done
+fi
+
+exec /opt/paraviewweb/scripts/server.sh "$@"
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The shared server modules are imported as the apps do, from the root of
+# the repository
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__),
+                                                os.pardir)))
@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('vtk')
+pytest.importorskip('dipy')
+
+from furyweb.clustering import (cached_thresholds, load_clusters,  # noqa: E402
+                                merge_clusters, save_clusters)
+
+
+def test_cluster_cache(tmpdir):
+    prefix = str(tmpdir.join('0123abcd'))
+    assert cached_thresholds(prefix) == []
+    assert load_clusters(prefix, 10.) is None
+    assert load_clusters(None, 10.) is None
+
+    centroids = np.random.RandomState(0).rand(3, 12, 3)
+    labels = np.array([0, 2, 1, 2])
+    save_clusters(prefix, 10., centroids, labels)
+    save_clusters(prefix, 2.5, centroids, labels)
+    # Clusters of another tractogram in the same directory
+    save_clusters(str(tmpdir.join('0123abcdef')), 5., centroids, labels)
+    assert cached_thresholds(prefix) == [2.5, 10.]
+
+    loaded_centroids, loaded_labels = load_clusters(prefix, 10.)
+    assert loaded_centroids.dtype == np.float32
+    np.testing.assert_allclose(loaded_centroids, centroids, rtol=1e-6)
+    assert loaded_labels.dtype == np.uint8
+    np.testing.assert_array_equal(loaded_labels, labels)
+
+    # Without their centroids, the labels are not complete clusters
+    tmpdir.join('0123abcd.qb10.centroids.npy').remove()
+    assert cached_thresholds(prefix) == [2.5]
+    assert load_clusters(prefix, 10.) is None
+
+
+def test_merge_clusters():
+    line = np.linspace(0., 10., 12)[:, None] * np.array([1., 0., 0.])
+    # Two close bundles, one of them flipped, and a distant one
+    centroids = np.array([line, line[::-1] + [0., 1., 0.],
+                          line + [0., 50., 0.]], dtype=np.float32)
+    sizes = np.array([1, 3, 2])
+    merged, mapping = merge_clusters(centroids, sizes, threshold=5.)
+    assert merged.dtype == np.float32
+    assert len(merged) == 2
+    assert mapping[0] == mapping[1] != mapping[2]
+    np.testing.assert_allclose(merged[mapping[0]], line + [0., .75, 0.],
+                               atol=1e-5)
+    np.testing.assert_allclose(merged[mapping[2]], centroids[2])
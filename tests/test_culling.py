@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('vtk')
+
+from furyweb.culling import classify_boxes, projected_pixels  # noqa: E402
+
+# The unit cube [-1, 1]^3 as a frustum, inward normals
+NORMALS = np.array([[1, 0, 0], [-1, 0, 0], [0, 1, 0], [0, -1, 0],
+                    [0, 0, 1], [0, 0, -1]], dtype=float)
+OFFSETS = np.ones(6)
+
+
+def test_classify_boxes():
+    low = np.array([[-.5, -.5, -.5], [2., 2., 2.], [.5, -.5, -.5],
+                    [-3., -3., -3.], [1.5, 0., 0.]])
+    high = low + np.array([[1., 1., 1.], [1., 1., 1.], [1., 1., 1.],
+                           [6., 6., 6.], [1., 1., 1.]])
+    outside, inside = classify_boxes(low, high, NORMALS, OFFSETS)
+    # inside, outside, crossing a plane, around the frustum, outside
+    assert outside.tolist() == [False, True, False, False, True]
+    assert inside.tolist() == [True, False, False, False, False]
+
+
+def test_classify_boxes_tilted_plane():
+    # x + y >= 0: the corner of the box is what matters, not its center
+    normals = np.array([[1., 1., 0.]]) / np.sqrt(2)
+    low = np.array([[-1., -1., 0.], [-2.1, -2.1, 0.], [0., 0., 0.]])
+    outside, inside = classify_boxes(low, low + 1., normals, np.zeros(1))
+    assert outside.tolist() == [False, True, False]
+    assert inside.tolist() == [False, False, True]
+
+
+class _Camera(object):
+
+    def __init__(self, parallel):
+        self.parallel = parallel
+
+    def GetParallelProjection(self):
+        return self.parallel
+
+    def GetParallelScale(self):
+        return 10.
+
+    def GetDirectionOfProjection(self):
+        return (0., 0., -1.)
+
+    def GetPosition(self):
+        return (0., 0., 10.)
+
+    def GetViewAngle(self):
+        return 90.
+
+
+class _Renderer(object):
+
+    def __init__(self, parallel=False):
+        self.camera = _Camera(parallel)
+
+    def GetActiveCamera(self):
+        return self.camera
+
+    def GetSize(self):
+        return (400, 200)
+
+
+def test_projected_pixels():
+    centers = np.array([[0., 0., 0.], [0., 0., 5.], [0., 0., 20.]])
+    radii = np.array([1., 1., 1.])
+    # 90 degrees: the view spans twice the depth over 200 pixels
+    pixels = projected_pixels(_Renderer(), centers, radii)
+    np.testing.assert_allclose(pixels[:2], [20., 40.])
+    # Behind the camera, clamped rather than negative
+    assert pixels[2] > 1e6
+    np.testing.assert_allclose(
+        projected_pixels(_Renderer(parallel=True), centers, radii), 20.)
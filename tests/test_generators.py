@@ -0,0 +1,67 @@
+import os
+
+import numpy as np
+import pytest
+
+from furyweb.generators import (BLOCK_SIZE, FIELDS, PHYSICELL_COLUMNS,
+                                generate_points, point_chunks,
+                                save_physicell, save_points)
+from furyweb.primitive_io import PRIMITIVE_CODES, load_primitives
+
+
+def test_points_do_not_depend_on_the_chunk_size():
+    n_points = 2 * BLOCK_SIZE + 100
+    points = generate_points(n_points, 'clustered', seed=3)
+    for name in FIELDS:
+        assert len(points[name]) == n_points
+    chunks = list(point_chunks(n_points, 'clustered', seed=3,
+                               chunk_size=BLOCK_SIZE))
+    assert len(chunks) == 3
+    for name in FIELDS:
+        np.testing.assert_array_equal(
+            np.concatenate([chunk[name] for chunk in chunks]), points[name])
+    other = generate_points(n_points, 'clustered', seed=4)
+    assert not np.array_equal(other['centers'], points['centers'])
+
+
+@pytest.mark.parametrize('distribution', ['uniform', 'clustered', 'shell'])
+def test_distributions(distribution):
+    points = generate_points(1000, distribution, extent=10.)
+    centers = points['centers']
+    assert centers.shape == (1000, 3)
+    assert centers.dtype == np.float32
+    assert set(points['primitives'].tolist()) <= \
+        set(PRIMITIVE_CODES.values())
+    if distribution == 'uniform':
+        assert np.all(np.abs(centers) <= 5.)
+    elif distribution == 'shell':
+        radii = np.linalg.norm(centers, axis=1)
+        assert np.all(radii <= 5. + 1e-5)
+        assert np.all(radii >= 5. * .95 - 1e-5)
+
+
+def test_unknown_distribution():
+    with pytest.raises(ValueError):
+        generate_points(10, 'gaussian')
+
+
+def test_save_points(tmpdir):
+    path = str(tmpdir.join('scene.npy'))
+    save_points(path, BLOCK_SIZE + 10, 'shell', seed=1, chunk_size=1)
+    loaded = load_primitives(path)
+    points = generate_points(BLOCK_SIZE + 10, 'shell', seed=1)
+    for name in FIELDS:
+        np.testing.assert_array_equal(loaded[name], points[name])
+
+
+def test_save_physicell(tmpdir):
+    loadmat = pytest.importorskip('scipy.io').loadmat
+    path = str(tmpdir.join('output'))
+    save_physicell(path, BLOCK_SIZE + 10, n_frames=2, chunk_size=1)
+    assert sorted(os.listdir(path)) == [
+        'output00000000.xml', 'output00000000_cells_physicell.mat',
+        'output00000001.xml', 'output00000001_cells_physicell.mat']
+    cells = loadmat(os.path.join(
+        path, 'output00000001_cells_physicell.mat'))['cells']
+    assert cells.shape == (PHYSICELL_COLUMNS, BLOCK_SIZE + 10)
+    np.testing.assert_array_equal(cells[0], np.arange(BLOCK_SIZE + 10))
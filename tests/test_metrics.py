@@ -0,0 +1,75 @@
+from furyweb.metrics import Histogram, MetricsRegistry
+
+
+def test_histogram_buckets_and_percentiles():
+    histogram = Histogram(buckets=(.01, .1, 1.))
+    for value in (.005, .05, .05, .5, 5.):
+        histogram.observe(value)
+    assert histogram.count == 5
+    assert histogram.sum == .005 + .05 + .05 + .5 + 5.
+    # The value above the last bound only counts in +Inf
+    assert histogram.cumulative_counts() == [(.01, 1), (.1, 3), (1., 4)]
+    assert histogram.percentile(0) == .005
+    assert histogram.percentile(50) == .05
+    assert histogram.percentile(100) == 5.
+    assert Histogram().percentile(50) == 0.
+
+
+def test_histogram_percentiles_use_the_window():
+    histogram = Histogram(window=2)
+    for value in (10., 1., 2.):
+        histogram.observe(value)
+    assert histogram.percentile(100) == 2.
+    assert histogram.count == 3
+
+
+def test_view_metrics_to_dict():
+    registry = MetricsRegistry()
+    view = registry.view('1')
+    view.frame_published(100, timestamp=0.)
+    view.frame_published(300, timestamp=.5)
+    view.increment('framesDropped')
+    view.set_gauges({'drawnInstances': 12})
+    metrics = view.to_dict()
+    assert metrics['framesPublished'] == 2
+    assert metrics['bytesSent'] == 400
+    assert metrics['framesDropped'] == 1
+    assert metrics['drawnInstances'] == 12
+    assert metrics['render']['count'] == 0
+
+
+def test_prometheus_text():
+    registry = MetricsRegistry({'app': 'spheres', 'port': 9001})
+    view = registry.view('7')
+    view.increment('framesPublished', 3)
+    view.set_gauge('visibleChunks', 2)
+    view.observe('render', .02)
+    view.observe('render', 20.)
+    lines = registry.to_prometheus().splitlines()
+
+    labels = 'app="spheres",port="9001",view="7"'
+    assert '# TYPE furyweb_view_frames_published_total counter' in lines
+    assert 'furyweb_view_frames_published_total{%s} 3' % labels in lines
+    assert '# TYPE furyweb_view_visible_chunks gauge' in lines
+    assert 'furyweb_view_visible_chunks{%s} 2.000000' % labels in lines
+    assert '# TYPE furyweb_view_render_seconds histogram' in lines
+    assert ('furyweb_view_render_seconds_bucket{app="spheres",le="0.025",'
+            'port="9001",view="7"} 1') in lines
+    assert ('furyweb_view_render_seconds_bucket{app="spheres",le="+Inf",'
+            'port="9001",view="7"} 2') in lines
+    assert 'furyweb_view_render_seconds_count{%s} 2' % labels in lines
+
+
+def test_prometheus_label_escaping():
+    registry = MetricsRegistry({'app': 'a"b'})
+    registry.view('1')
+    assert 'app="a\\"b"' in registry.to_prometheus()
+
+
+def test_write_textfile(tmp_path):
+    registry = MetricsRegistry()
+    registry.view('1').increment('renders')
+    path = tmp_path / 'furyweb.prom'
+    registry.write_textfile(str(path))
+    assert path.read_text() == registry.to_prometheus()
+    assert list(tmp_path.iterdir()) == [path]
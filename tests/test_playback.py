@@ -0,0 +1,89 @@
+import time
+
+import numpy as np
+from twisted.internet.task import Clock
+
+from furyweb.playback import SeriesPlayer
+
+
+def _player(steps=5, **kwargs):
+    series = {'centers': np.arange(steps * 6, dtype=np.float32)
+              .reshape(steps, 2, 3)}
+    shown = []
+    player = SeriesPlayer(series, lambda step, state: shown.append(
+        (step, state['centers'][0, 0])), **kwargs)
+    clock = Clock()
+    player._timer.clock = clock
+    return player, clock, shown
+
+
+def _decoded(player, steps):
+    # The readahead thread decodes the window in the background
+    deadline = time.time() + 5.
+    while time.time() < deadline:
+        with player._condition:
+            if all(step in player._decoded for step in steps):
+                return
+        time.sleep(.001)
+    raise AssertionError('steps {0} not decoded'.format(steps))
+
+
+def test_play_loops_over_the_steps():
+    player, clock, shown = _player(steps=3, fps=10., readahead=3)
+    _decoded(player, [0, 1, 2])
+    player.play()
+    for _ in range(3):
+        clock.advance(.1)
+        _decoded(player, [0, 1, 2])
+    assert [step for step, _ in shown] == [0, 1, 2, 0]
+    assert [value for _, value in shown] == [0., 6., 12., 0.]
+    assert player.state()['playing']
+
+    player.pause()
+    clock.advance(.1)
+    assert not player._timer.running
+    assert len(shown) == 4
+
+
+def test_play_stops_at_the_end_without_loop():
+    player, clock, shown = _player(steps=2, readahead=2, loop=False)
+    _decoded(player, [0, 1])
+    player.play()
+    clock.advance(.1)
+    clock.advance(.1)
+    assert [step for step, _ in shown] == [0, 1]
+    assert not player.playing
+    assert not player._timer.running
+
+
+def test_seek_waits_for_the_step():
+    player, clock, shown = _player(steps=10, readahead=2)
+    _decoded(player, [0, 1])
+    player.seek(-3)
+    _decoded(player, [7])
+    clock.advance(.1)
+    assert shown[-1][0] == 7
+    assert player.step == 7
+    # Shown once, the timer stops until the next play or seek
+    assert not player._timer.running
+
+
+def test_late_steps():
+    player, clock, shown = _player(steps=10, readahead=1)
+    _decoded(player, [0])
+    with player._condition:
+        # Hold the decoder so that the next steps are late
+        player.play()
+        assert shown == [(0, 0.)]
+        clock.advance(.1)
+        clock.advance(.1)
+    assert player.late_steps == 2
+    assert player.state()['lateSteps'] == 2
+
+
+def test_set_fps():
+    player, clock, shown = _player()
+    player.set_fps(0)
+    assert player.fps == .1
+    player.set_fps('25')
+    assert player.state()['fps'] == 25.
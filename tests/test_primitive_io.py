@@ -0,0 +1,108 @@
+import json
+
+import numpy as np
+import pytest
+
+from furyweb.primitive_io import (load_json, load_primitives, load_raw,
+                                  load_series, primitive_codes,
+                                  primitive_names, save_raw, save_series)
+
+
+def _scene(n=50):
+    rng = np.random.RandomState(0)
+    return {'centers': rng.rand(n, 3).round(4).tolist(),
+            'colors': rng.randint(256, size=(n, 3)).tolist(),
+            'scales': rng.rand(n).round(4).tolist(),
+            'primitives': [['sphere', 'torus', 'ellipsoid', 'capsule'][i % 4]
+                           for i in range(n)]}
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 64, 1 << 20])
+def test_load_json_matches_json_module(tmpdir, chunk_size):
+    scene = _scene()
+    scene['name'] = 'skipped, with {brackets} and "quotes"'
+    scene['camera'] = {'position': [0, 0, 1], 'up': [[0, 1, 0]]}
+    path = str(tmpdir.join('scene.json'))
+    with open(path, 'w') as f:
+        json.dump(scene, f, indent=1)
+
+    arrays = load_json(path, chunk_size=chunk_size)
+    assert sorted(arrays) == ['centers', 'colors', 'primitives', 'scales']
+    np.testing.assert_array_equal(arrays['centers'], scene['centers'])
+    np.testing.assert_array_equal(arrays['colors'], scene['colors'])
+    np.testing.assert_array_equal(arrays['scales'], scene['scales'])
+    assert primitive_names(arrays['primitives']) == scene['primitives']
+
+
+def test_load_json_empty_and_ragged(tmpdir):
+    path = str(tmpdir.join('scene.json'))
+    with open(path, 'w') as f:
+        f.write('{}')
+    assert load_json(path) == {}
+    with open(path, 'w') as f:
+        f.write('{"centers": [[0, 1, 2], [3, 4]]}')
+    with pytest.raises(ValueError):
+        load_json(path)
+
+
+def test_primitive_codes_round_trip():
+    names = ['capsule', 'sphere', 'torus', 'ellipsoid']
+    codes = primitive_codes(names)
+    assert codes.dtype == np.uint8
+    assert codes.tolist() == [4, 1, 2, 3]
+    assert primitive_names(codes) == names
+
+
+def test_raw_round_trip(tmpdir):
+    rng = np.random.RandomState(0)
+    arrays = {'centers': rng.rand(10, 3).astype(np.float32),
+              'primitives': rng.randint(1, 5, 10).astype(np.uint8),
+              'scales': rng.rand(10)}
+    path = str(tmpdir.join('scene.fwp'))
+    save_raw(path, arrays)
+
+    loaded = load_primitives(path)
+    assert sorted(loaded) == sorted(arrays)
+    for name, array in arrays.items():
+        assert loaded[name].dtype == array.dtype
+        np.testing.assert_array_equal(loaded[name], array)
+
+
+def test_raw_checks(tmpdir):
+    path = str(tmpdir.join('scene.fwp'))
+    with pytest.raises(ValueError):
+        save_raw(path, {'centers': np.zeros((2, 3)), 'scales': np.zeros(3)})
+    with open(path, 'wb') as f:
+        f.write(b'\0' * 64)
+    with pytest.raises(ValueError):
+        load_raw(path)
+
+
+def test_npy_scenes(tmpdir):
+    centers = np.arange(12, dtype=np.float32).reshape(4, 3)
+    path = str(tmpdir.join('centers.npy'))
+    np.save(path, centers)
+    np.testing.assert_array_equal(load_primitives(path)['centers'], centers)
+
+    points = np.zeros(4, dtype=[('centers', '<f4', (3,)), ('scales', '<f4')])
+    points['centers'] = centers
+    path = str(tmpdir.join('points.npy'))
+    np.save(path, points)
+    loaded = load_primitives(path)
+    assert sorted(loaded) == ['centers', 'scales']
+    np.testing.assert_array_equal(loaded['centers'], centers)
+
+
+def test_series_round_trip(tmpdir):
+    path = str(tmpdir.join('series'))
+    centers = np.random.RandomState(0).rand(5, 10, 3)
+    save_series(path, {'centers': centers, 'scales': np.ones((5, 10))})
+    series = load_series(path)
+    assert sorted(series) == ['centers', 'scales']
+    np.testing.assert_array_equal(series['centers'], centers)
+
+    with pytest.raises(ValueError):
+        save_series(path, {'centers': centers, 'scales': np.ones((4, 10))})
+    save_series(str(tmpdir.join('no_centers')), {'scales': np.ones((5, 10))})
+    with pytest.raises(ValueError):
+        load_series(str(tmpdir.join('no_centers')))
@@ -0,0 +1,89 @@
+from twisted.internet.task import Clock
+
+from furyweb.render_scheduler import RenderScheduler
+
+
+def make_scheduler():
+    clock = Clock()
+    renders = []
+    scheduler = RenderScheduler(
+        lambda vId, priority: renders.append((vId, priority)), clock=clock)
+    return scheduler, clock, renders
+
+
+def test_requests_merged_into_one_render():
+    scheduler, clock, renders = make_scheduler()
+    for _ in range(5):
+        scheduler.request('1', RenderScheduler.IDLE)
+    clock.advance(0)
+    assert renders == [('1', RenderScheduler.IDLE)]
+    assert scheduler.getStats('1') == {'requests': 5, 'renders': 1,
+                                       'merged': 4}
+
+
+def test_most_urgent_priority_wins():
+    scheduler, clock, renders = make_scheduler()
+    scheduler.request('1', RenderScheduler.IDLE, delay=.5)
+    scheduler.request('1', RenderScheduler.INTERACTION, delay=.5)
+    scheduler.request('1', RenderScheduler.STALE, delay=.5)
+    clock.advance(.5)
+    assert renders == [('1', RenderScheduler.INTERACTION)]
+
+
+def test_earlier_deadline_moves_the_timer():
+    scheduler, clock, renders = make_scheduler()
+    scheduler.request('1', RenderScheduler.STALE, delay=1.)
+    scheduler.request('1', RenderScheduler.IDLE, delay=.1)
+    clock.advance(.1)
+    assert len(renders) == 1
+    # The later deadline does not schedule a second render
+    clock.advance(1.)
+    assert len(renders) == 1
+    assert len(clock.getDelayedCalls()) == 0
+
+
+def test_later_deadline_keeps_the_timer():
+    scheduler, clock, renders = make_scheduler()
+    scheduler.request('1', RenderScheduler.IDLE, delay=.1)
+    scheduler.request('1', RenderScheduler.IDLE, delay=1.)
+    clock.advance(.1)
+    assert len(renders) == 1
+
+
+def test_views_are_independent():
+    scheduler, clock, renders = make_scheduler()
+    scheduler.request('1', RenderScheduler.IDLE, delay=.2)
+    scheduler.request('2', RenderScheduler.INTERACTION)
+    clock.advance(0)
+    assert renders == [('2', RenderScheduler.INTERACTION)]
+    clock.advance(.2)
+    assert renders[-1] == ('1', RenderScheduler.IDLE)
+
+
+def test_request_while_rendering_is_scheduled_after():
+    clock = Clock()
+    renders = []
+
+    def render(vId, priority):
+        renders.append(priority)
+        if len(renders) == 1:
+            # e.g. the next animation frame
+            scheduler.request(vId, RenderScheduler.INTERACTION, delay=.1)
+
+    scheduler = RenderScheduler(render, clock=clock)
+    scheduler.request('1', RenderScheduler.IDLE)
+    clock.advance(0)
+    assert renders == [RenderScheduler.IDLE]
+    assert scheduler.isPending('1')
+    clock.advance(.1)
+    assert renders == [RenderScheduler.IDLE, RenderScheduler.INTERACTION]
+    assert not scheduler.isPending('1')
+
+
+def test_cancel_drops_the_pending_render():
+    scheduler, clock, renders = make_scheduler()
+    scheduler.request('1', RenderScheduler.IDLE, delay=.1)
+    scheduler.cancel('1')
+    clock.advance(1.)
+    assert renders == []
+    assert not scheduler.isPending('1')
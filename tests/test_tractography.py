@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('vtk')
+streamline = pytest.importorskip('dipy.tracking.streamline')
+
+from furyweb.tractography import orientation_colors, resample  # noqa: E402
+
+
+def _streamlines(seed=0, count=20):
+    rng = np.random.RandomState(seed)
+    return [np.cumsum(rng.normal(size=(rng.randint(2, 40), 3)), axis=0)
+            for _ in range(count)]
+
+
+@pytest.mark.parametrize('n_points', [2, 4, 12])
+def test_resample_matches_dipy(n_points):
+    streamlines = _streamlines()
+    resampled = resample(np.concatenate(streamlines),
+                         np.array([len(s) for s in streamlines]), n_points)
+    assert resampled.shape == (len(streamlines), n_points, 3)
+    assert resampled.dtype == np.float32
+    expected = streamline.set_number_of_points(streamlines, n_points)
+    np.testing.assert_allclose(resampled, np.array(expected), atol=1e-4)
+
+
+def test_resample_degenerate_streamlines():
+    # A single point, and repeated points with no length
+    points = np.array([[1., 2., 3.], [0., 0., 0.], [0., 0., 0.],
+                       [0., 0., 0.], [1., 0., 0.]])
+    resampled = resample(points, np.array([1, 2, 2]), 3)
+    np.testing.assert_array_equal(resampled[0], [[1., 2., 3.]] * 3)
+    np.testing.assert_array_equal(resampled[1], 0.)
+    np.testing.assert_allclose(resampled[2], [[0., 0., 0.], [.5, 0., 0.],
+                                              [1., 0., 0.]])
+    assert resample(np.empty((0, 3)), np.empty(0, int), 4).shape == (0, 4, 3)
+
+
+def test_orientation_colors():
+    streamlines = np.array([[[0., 0., 0.], [0., 0., -2.]],
+                            [[1., 1., 1.], [1., 1., 1.]]])
+    np.testing.assert_array_equal(orientation_colors(streamlines),
+                                  [[0, 0, 255], [0, 0, 0]])